@@ -1,8 +1,41 @@
 """
 analizar_precios_carrefour.py
 ==============================
-Lee output_carrefour/*.csv del día, guarda histórico en
-data/precios_compacto.csv y genera los JSONs para la web.
+Lee la salida del scraper del día, guarda el histórico particionado por
+fecha en data/hist/ (ver historico_precios.py) y genera los JSONs para
+la web.
+
+El análisis trabaja sobre la tabla de hechos (product_key, fecha entera,
+precios float32) más cat_principal; nombres y marcas se unen recién al
+armar los rankings.
+
+La corrida diaria lee sólo las particiones que comparan (hoy, el día
+anterior y los snapshots 7d/30d/6m/1y) y agrega el paso de hoy al
+estado del índice (data/indice_estado.json). Las particiones no se
+versionan: al empezar se dejan iguales al log de cambios
+(historico_delta), que es lo que va al commit. Con --rebuild lee todo el
+año, recalcula el índice desde cero y lo compara con el incremental.
+
+Antes de comparar nada, las filas con precios anómalos (errores de
+scraping) quedan en cuarentena: no entran en rankings, resumen ni
+índice, y se listan en data/anomalias.json (ver anomalias_precios.py).
+
+--desde YYYYMMDD [--hasta YYYYMMDD] recalcula, para cada fecha guardada
+del rango, el resumen y los rankings como si ese día hubiera sido hoy y
+los deja en data/archivo/YYYYMMDD.json (no toca los JSONs de hoy). Los
+workers leen el histórico de la copia con mmap, que comparten. Si se
+corrió compactar_historico.py, antes de su corte hay una fecha por semana.
+
+--solo-graficos lee el histórico desde la copia columnar con mmap
+(historico_mmap), que pone al día antes de empezar.
+
+Con --workers N las comparaciones 7d/30d/6m/1y y los pasos del índice
+que haya que calcular se reparten en N procesos; cada uno lee del disco
+(parquet o mmap) sólo las fechas que necesita.
+
+--profile mide tiempo y memoria por etapa y por función clave y deja el
+reporte en data/perfil/; --cprofile agrega un volcado de cProfile por
+etapa (ver perfil_analizador.py).
 
 Lógica idéntica al bot de Coto:
 - Una fila por producto por día
@@ -18,8 +51,17 @@ from datetime import datetime, timedelta
 from pathlib import Path
 import sys
 
-DIR_DATA         = Path("data")
-PRECIOS_COMPACTO = DIR_DATA / "precios_compacto.csv"
+import anomalias_precios
+import consulta_precios
+import historico_delta
+import historico_mmap
+import historico_precios
+import indice_precios
+import perfil_analizador
+import salida_scraper
+from historico_precios import DIR_DATA, DIR_HIST
+
+perfil = perfil_analizador.Perfil()   # se activa con --profile
 
 ORDEN_CATS = [
     "Almacén", "Frescos", "Congelados",
@@ -28,94 +70,234 @@ ORDEN_CATS = [
 ]
 
 PERIODOS = {"7d": 7, "30d": 30, "6m": 180, "1y": 365}
+# (label, días, clave en resumen.json, ranking que se guarda)
+COMPARACIONES = [
+    ("7d",  7,   "variacion_7d",   "ranking_7d.json"),
+    ("30d", 30,  "variacion_mes",  "ranking_mes.json"),
+    ("6m",  180, "variacion_6m",   None),
+    ("1y",  365, "variacion_anio", "ranking_anio.json"),
+]
+DIAS_HISTORIA = max(PERIODOS.values())   # lo más viejo que leen snapshots y gráficos
+COLUMNAS_DIA = historico_precios.COLUMNAS_PRODUCTO + ["precio_actual", "precio_regular"]
+LOTE_INGESTA = 50_000   # filas por lote al leer las salidas del scraper
+COLUMNAS_CAT = ["cat_principal", "categoria"]
 
 
+@perfil.funcion()
 def cargar_csvs_hoy():
+    """
+    Salidas del scraper de hoy (CSV o datasets Parquet), leídas en lotes
+    con el esquema de salida_scraper. Cada lote se filtra y deduplica por
+    product_id apenas se lee (gana la primera fila válida, en el orden de
+    los archivos), así las corridas retomadas o shardeadas que dejan
+    varios archivos no se juntan enteras en memoria: sólo el día ya
+    deduplicado. La categoría de un producto listado en varias es la menor
+    de todas sus filas (categoria_minima), no la de la que llegó primero.
+    """
     hoy = datetime.now().strftime("%Y%m%d")
-    patron = f"output_carrefour/carrefour_{hoy}*.csv"
-    dfs = []
-    for archivo in glob.glob(patron):
+    patron = f"output_carrefour/carrefour_{hoy}*"
+    partes, vistos, cargados = [], pd.Index([], dtype=object), 0
+    cats = pd.DataFrame(columns=COLUMNAS_CAT, index=pd.Index([], dtype=object))
+    for archivo in sorted(glob.glob(patron + ".csv") + glob.glob(patron + ".parquet")):
+        partes_archivo, vistos_archivo, cats_archivo, leidas = [], vistos, cats, 0
         try:
-            df = pd.read_csv(archivo, encoding="utf-8-sig")
-            dfs.append(df)
-            print(f"  Cargado: {archivo} ({len(df)} prods)")
+            for lote in salida_scraper.leer_lotes(Path(archivo), COLUMNAS_DIA, LOTE_INGESTA):
+                leidas += len(lote)
+                cats_archivo = categoria_minima(cats_archivo, lote)
+                lote = limpiar_lote(lote, vistos_archivo)
+                vistos_archivo = vistos_archivo.append(pd.Index(lote["product_id"], dtype=object))
+                partes_archivo.append(lote)
         except Exception as e:
             print(f"  ERROR cargando {archivo}: {e}")
-    if not dfs:
-        print("ERROR: No se encontraron CSVs de hoy.")
+            continue
+        partes += partes_archivo
+        print(f"  Cargado: {archivo} ({leidas} prods, {len(vistos_archivo) - len(vistos)} nuevos válidos)")
+        vistos, cats = vistos_archivo, cats_archivo
+        cargados += 1
+    if not cargados:
+        print("ERROR: No se encontraron salidas del scraper de hoy.")
+        return None
+    if not sum(len(p) for p in partes):   # dataset sin parts, o ninguna fila válida
+        print("ERROR: Las salidas del scraper de hoy no tienen filas válidas.")
         return None
-    return pd.concat(dfs, ignore_index=True)
+    df = pd.concat(partes, ignore_index=True)
+    elegidas = cats.reindex(df["product_id"].to_numpy())
+    for col in COLUMNAS_CAT:
+        if col in df.columns:
+            df[col] = elegidas[col].to_numpy()
+    return df
+
 
+def limpiar_lote(lote, vistos):
+    """Filas con precio_regular válido y product_id que no esté en `vistos` (Index)."""
+    lote = lote[lote["precio_regular"] > 0]
+    lote = lote.drop_duplicates(subset=["product_id"], keep="first")
+    lote = lote.assign(product_id=lote["product_id"].astype(str))
+    return lote[vistos.get_indexer(lote["product_id"].to_numpy(dtype=object)) < 0]
 
+
+def categoria_minima(cats, lote):
+    """
+    `cats` (product_id -> cat_principal, categoria) con las filas válidas
+    de `lote`, quedándose por producto con la menor (cat_principal,
+    categoria): no depende del orden en que terminaron las páginas.
+    """
+    lote = lote[lote["precio_regular"] > 0].reindex(columns=["product_id"] + COLUMNAS_CAT)
+    lote = lote.set_index(lote["product_id"].astype(str).to_numpy())[COLUMNAS_CAT]
+    todas = pd.concat([cats, lote]) if len(cats) else lote
+    todas = todas.sort_values(COLUMNAS_CAT, na_position="last", kind="stable")
+    return todas[~todas.index.duplicated()]
+
+
+@perfil.funcion()
 def preparar_df_dia(df_raw, fecha_str):
-    df = df_raw.copy()
-    for col in ["precio_actual", "precio_regular"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-    df = df.dropna(subset=["precio_regular"])
-    df = df[df["precio_regular"] > 0]
-    df = df.drop_duplicates(subset=["product_id"], keep="first")
-    df["product_id"] = df["product_id"].astype(str)
-    df["fecha"] = fecha_str
+    """Completa el día que arma cargar_csvs_hoy (ya filtrado y deduplicado)."""
+    df = df_raw.assign(fecha=fecha_str)
     # cat_principal ya viene del scraper
     if "cat_principal" not in df.columns:
         df["cat_principal"] = "Sin categoría"
     return df
 
 
+@perfil.funcion()
 def guardar_compacto(df_dia, fecha_str):
-    DIR_DATA.mkdir(parents=True, exist_ok=True)
-    cols = ["product_id", "sku_id", "ean", "nombre", "marca",
-            "categoria", "cat_principal", "precio_actual", "precio_regular", "fecha"]
-    cols = [c for c in cols if c in df_dia.columns]
-    df_guardar = df_dia[cols].copy()
-
-    if PRECIOS_COMPACTO.exists():
-        df_hist = pd.read_csv(PRECIOS_COMPACTO, dtype={"product_id": str, "fecha": str})
-        df_hist = df_hist[df_hist["fecha"] != fecha_str]
-        df_nuevo = pd.concat([df_hist, df_guardar], ignore_index=True)
-    else:
-        df_nuevo = df_guardar
-
-    df_nuevo.to_csv(PRECIOS_COMPACTO, index=False)
-    kb = PRECIOS_COMPACTO.stat().st_size / 1024
-    print(f"  precios_compacto.csv: {len(df_nuevo)} filas | {kb:.0f} KB")
-    return df_nuevo
-
-
-def snapshot_anterior(df_hist, fecha_hoy):
-    fechas = sorted(df_hist["fecha"].unique(), reverse=True)
-    for f in fechas:
-        if f < fecha_hoy:
-            df = df_hist[df_hist["fecha"] == f].copy()
-            print(f"  Snapshot anterior: {f} ({len(df)} prods)")
-            return df
-    return None
-
-
-def snapshot_en_fecha(df_hist, fecha_objetivo_str):
-    fechas = sorted(df_hist["fecha"].unique())
-    candidato = None
-    for f in fechas:
-        if f <= fecha_objetivo_str:
-            candidato = f
-    if candidato is None:
+    """
+    Guarda el día como su propia partición del histórico (reemplazando
+    sólo esa fecha) y lo agrega al log de cambios.
+    """
+    ruta = historico_precios.guardar_dia(df_dia, fecha_str)
+    if ruta is None:
+        print(f"  {fecha_str}: sin filas válidas, no se guarda")
+        return
+    kb = ruta.stat().st_size / 1024
+    fechas = historico_precios.fechas_disponibles()
+    print(f"  {ruta}: {len(df_dia)} filas | {kb:.0f} KB | {len(fechas)} fechas en {DIR_HIST}")
+    escritas = historico_delta.sincronizar({fecha_str})
+    kb = sum(historico_delta.ruta_entrada(f, c).stat().st_size
+             for f, c in historico_delta.fechas_log() if f in escritas) / 1024
+    print(f"  {historico_delta.DIR_DELTA}: {len(escritas)} fechas escritas | {kb:.0f} KB")
+    if consulta_precios.DB.exists():
+        cargadas = consulta_precios.actualizar()
+        print(f"  {consulta_precios.DB}: {len(cargadas)} fechas actualizadas")
+
+
+def fechas_snapshots(fecha_hoy):
+    """Particiones que usan las comparaciones: hoy, la anterior y 7d/30d/6m/1y."""
+    fechas = [f for f in historico_precios.fechas_disponibles() if f <= fecha_hoy]
+    necesarias = {fecha_hoy} | set([f for f in fechas if f < fecha_hoy][-1:])
+    for dias in PERIODOS.values():
+        objetivo = historico_precios.desde_dias(dias)
+        necesarias |= set([f for f in fechas if f <= objetivo][-1:])
+    return sorted(necesarias & set(fechas))
+
+
+@perfil.funcion()
+def cargar_historico(fechas=None, cargar=historico_precios.cargar_historico):
+    """
+    Las `fechas` pedidas, o todo lo que leen snapshots y gráficos. `cargar`
+    es el lector: las particiones parquet o la copia en historico_mmap.
+    """
+    desde = historico_precios.desde_dias(DIAS_HISTORIA)
+    df_hist = cargar(desde=desde, fechas=fechas)
+    mb = df_hist.memory_usage(deep=True).sum() / 1e6
+    origen = f"{len(fechas)} fechas de snapshot" if fechas is not None else f"desde {desde}"
+    print(f"  Histórico ({origen}): {len(df_hist)} filas, "
+          f"{df_hist['fecha'].nunique()} fechas, {mb:.1f} MB en memoria")
+    return df_hist
+
+
+@perfil.funcion()
+def actualizar_indice(df_hist, fecha_guardada=None, rebuild=False,
+                      cargar=historico_precios.cargar_historico, workers=1, cambiadas=()):
+    """
+    Agrega al estado del índice los pasos que falten y devuelve los datos
+    de graficos.json; `cambiadas` son fechas que cambiaron de cuarentena o
+    de contenido (particiones que restaurar() reemplazó).
+    Con rebuild, recalcula todo sobre `df_hist`, avisa si no coincide con
+    el incremental y se queda con lo recalculado.
+    """
+    desde = historico_precios.desde_dias(DIAS_HISTORIA)
+    estado = indice_precios.cargar_estado(ORDEN_CATS)
+    recalcular = set(cambiadas) | ({fecha_guardada} if fecha_guardada else set())
+    calculadas = indice_precios.actualizar_estado(estado, desde, recalcular, cargar, workers)
+    print(f"  Índice incremental: {len(calculadas)} pasos calculados, "
+          f"{len(estado['dias'])} fechas en el estado")
+    if rebuild:
+        fechas = historico_precios.fechas_en_rango(historico_precios.fechas_disponibles(), desde)
+        reconstruido = indice_precios.reconstruir_estado(df_hist, ORDEN_CATS, workers, fechas)
+        distintas = indice_precios.comparar_estados(estado, reconstruido)
+        if distintas:
+            print(f"  ATENCIÓN: el incremental difiere en {len(distintas)} fechas "
+                  f"({', '.join(distintas[:5])}{' ...' if len(distintas) > 5 else ''})")
+        else:
+            print("  Rebuild: coincide con el índice incremental")
+        estado = reconstruido
+    indice_precios.guardar_estado(estado)
+    return indice_precios.graficos_desde_estado(estado, PERIODOS)
+
+
+@perfil.funcion()
+def snapshot_anterior(indice, fecha_hoy):
+    f = indice.anterior_a(fecha_hoy)
+    if f is None:
         return None
-    df = df_hist[df_hist["fecha"] == candidato].copy()
-    print(f"  Snapshot para {fecha_objetivo_str}: {candidato} ({len(df)} prods)")
+    df = indice.dia(f)
+    print(f"  Snapshot anterior: {f} ({len(df)} prods)")
     return df
 
 
+@perfil.funcion()
+def fecha_snapshot(indice, fecha_objetivo_str):
+    candidato = indice.ultima_hasta(fecha_objetivo_str)
+    if candidato is None:
+        return None
+    print(f"  Snapshot para {fecha_objetivo_str}: {candidato} ({len(indice.dia(candidato))} prods)")
+    return str(candidato)
+
+
+_lector = {}   # cómo lee el histórico cada worker de variacion_periodo
+
+
+def _iniciar_lector(cargar):
+    _lector["cargar"] = cargar
+
+
+@perfil.funcion()
+def variacion_periodo(tarea):
+    """
+    (fecha_hoy, fecha_ref, con_ranking) -> (variación promedio, top 20 o
+    None). Lee sólo esas dos fechas del histórico, así corre igual en este
+    proceso o en un worker sin recibir el DataFrame.
+    """
+    fecha_hoy, fecha_ref, con_ranking = tarea
+    df = _lector["cargar"](fechas=sorted({fecha_ref, fecha_hoy}))
+    indice = historico_precios.IndiceFechas(df)
+    dv = calcular_variacion(indice.dia(fecha_hoy), indice.dia(fecha_ref))
+    if dv.empty:
+        return None, None
+    return (round(float(dv["diff_pct"].mean()), 2),
+            top_productos(dv, 20, False) if con_ranking else None)
+
+
+@perfil.funcion()
+def guardar_json(nombre, datos):
+    with open(DIR_DATA / nombre, "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False, indent=2)
+
+
+@perfil.funcion()
 def calcular_variacion(df_hoy, df_antes):
-    df_h = df_hoy[["product_id", "nombre", "marca", "categoria", "cat_principal",
-                    "precio_actual", "precio_regular"]].copy()
-    df_h = df_h.rename(columns={
-        "precio_regular": "precio_hoy",
-        "precio_actual":  "precio_actual_hoy",
+    df_h = pd.DataFrame({
+        "product_key":       df_hoy["product_key"],
+        "cat_principal":     df_hoy["cat_principal"].astype(str),
+        "precio_actual_hoy": historico_precios.precio64(df_hoy["precio_actual"]),
+        "precio_hoy":        historico_precios.precio64(df_hoy["precio_regular"]),
+    })
+    df_a = pd.DataFrame({
+        "product_key":  df_antes["product_key"],
+        "precio_antes": historico_precios.precio64(df_antes["precio_regular"]),
     })
-    df_a = df_antes[["product_id", "precio_regular"]].rename(
-        columns={"precio_regular": "precio_antes"})
-    df = pd.merge(df_h, df_a, on="product_id", how="inner")
+    df = pd.merge(df_h, df_a, on="product_key", how="inner")
     df = df.dropna(subset=["precio_hoy", "precio_antes"])
     df = df[df["precio_antes"] > 0]
     df["diff_abs"] = (df["precio_hoy"] - df["precio_antes"]).round(2)
@@ -123,6 +305,7 @@ def calcular_variacion(df_hoy, df_antes):
     return df
 
 
+@perfil.funcion()
 def calcular_variacion_cats(df_var):
     resumen = df_var.groupby("cat_principal").agg(
         variacion_pct_promedio=("diff_pct", "mean"),
@@ -138,142 +321,227 @@ def calcular_variacion_cats(df_var):
     return resumen.sort_values("_ord").drop(columns="_ord")
 
 
+@perfil.funcion()
 def top_productos(df_var, n=20, ascendente=False):
-    df = df_var.sort_values("diff_pct", ascending=ascendente).head(n)
+    """Los `n` de mayor (o menor) diff_pct; los empates, por product_id."""
+    df = historico_precios.unir_productos(df_var, ["product_id"])
+    df = df.sort_values(["diff_pct", "product_id"], ascending=[ascendente, True]).head(n)
+    df = historico_precios.unir_productos(df, ["nombre", "marca", "categoria"])
     return df[["product_id", "nombre", "marca", "categoria",
                "precio_antes", "precio_hoy", "precio_actual_hoy",
                "diff_abs", "diff_pct"]].to_dict("records")
 
 
-def generar_graficos_data(df_hist):
-    if df_hist.empty:
-        return {}
-    df_hist = df_hist.copy()
-    df_hist["fecha_dt"] = pd.to_datetime(df_hist["fecha"], format="%Y%m%d")
-    df_hist = df_hist.sort_values(["fecha_dt", "product_id"])
-    hoy = pd.Timestamp.now().normalize()
-    resultado = {}
+def resumen_vacio(fecha, total_productos):
+    return {
+        "fecha": fecha,
+        "total_productos": total_productos,
+        "variacion_dia": None, "variacion_7d": None,
+        "variacion_mes": None, "variacion_6m": None, "variacion_anio": None,
+        "categorias_dia": [], "ranking_baja_dia": [],
+        "productos_subieron_dia": 0, "productos_bajaron_dia": 0, "productos_sin_cambio_dia": 0,
+    }
 
-    for periodo, dias in PERIODOS.items():
-        fecha_inicio = hoy - timedelta(days=dias)
-        df_p = df_hist[df_hist["fecha_dt"] >= fecha_inicio].copy()
-        fechas = sorted(df_p["fecha_dt"].unique())
-        if not fechas:
-            resultado[periodo] = {"total": [], "categorias": {}}
-            continue
 
-        fecha_str_0 = fechas[0].strftime("%Y-%m-%d")
-        serie_total = [{"fecha": fecha_str_0, "pct": 0.0}]
-        acum = 0.0
-        for i in range(1, len(fechas)):
-            dv = calcular_variacion(
-                df_p[df_p["fecha_dt"] == fechas[i]],
-                df_p[df_p["fecha_dt"] == fechas[i - 1]]
-            )
-            var = float(dv["diff_pct"].mean()) if not dv.empty else 0.0
-            acum = round(acum + var, 2)
-            serie_total.append({"fecha": fechas[i].strftime("%Y-%m-%d"), "pct": acum})
-
-        series_cats = {}
-        for cat in ORDEN_CATS:
-            df_cat = df_p[df_p["cat_principal"] == cat]
-            if df_cat.empty:
-                continue
-            serie = [{"fecha": fecha_str_0, "pct": 0.0}]
-            acum_cat = 0.0
-            for i in range(1, len(fechas)):
-                dv = calcular_variacion(
-                    df_cat[df_cat["fecha_dt"] == fechas[i]],
-                    df_cat[df_cat["fecha_dt"] == fechas[i - 1]]
-                )
-                var = float(dv["diff_pct"].mean()) if not dv.empty else 0.0
-                acum_cat = round(acum_cat + var, 2)
-                serie.append({"fecha": fechas[i].strftime("%Y-%m-%d"), "pct": acum_cat})
-            series_cats[cat] = serie
+def completar_dia(resumen, dv):
+    """Campos del día en `resumen` desde la variación contra la fecha anterior."""
+    resumen["variacion_dia"]            = round(float(dv["diff_pct"].mean()), 2)
+    resumen["productos_subieron_dia"]   = int((dv["diff_pct"] > 0).sum())
+    resumen["productos_bajaron_dia"]    = int((dv["diff_pct"] < 0).sum())
+    resumen["productos_sin_cambio_dia"] = int((dv["diff_pct"] == 0).sum())
+    resumen["ranking_baja_dia"]         = top_productos(dv, 10, True)
+    resumen["categorias_dia"]           = calcular_variacion_cats(dv).to_dict("records")
 
-        resultado[periodo] = {"total": serie_total, "categorias": series_cats}
 
-    return resultado
+# ── BACKFILL (--desde / --hasta) ──────────────────────────────────────────────
+DIR_ARCHIVO = DIR_DATA / "archivo"
+
+_archivo = {}   # histórico del rango, abierto una vez por worker
+
+
+def _iniciar_archivo(cargar, desde, hasta):
+    _archivo["indice"] = historico_precios.IndiceFechas(cargar(desde=desde, hasta=hasta))
+
+
+def analizar_fecha(fecha):
+    """
+    Resumen y rankings de `fecha` como si ese día hubiera sido hoy, en
+    data/archivo/<fecha>.json. Devuelve (fecha, variación del día).
+    """
+    indice = _archivo["indice"]
+    df_dia = indice.dia(fecha)
+    resumen, rankings = resumen_vacio(fecha, len(df_dia)), {}
+    anterior = indice.anterior_a(fecha)
+    if anterior is not None:
+        dv = calcular_variacion(df_dia, indice.dia(anterior))
+        if not dv.empty:
+            completar_dia(resumen, dv)
+            rankings["ranking_dia.json"] = top_productos(dv, 20, False)
+    referencia = datetime.strptime(fecha, "%Y%m%d")
+    for label, dias, key, fname in COMPARACIONES:
+        f_ref = indice.ultima_hasta(historico_precios.desde_dias(dias, referencia))
+        if f_ref is None:
+            continue
+        dv = calcular_variacion(df_dia, indice.dia(f_ref))
+        if dv.empty:
+            continue
+        resumen[key] = round(float(dv["diff_pct"].mean()), 2)
+        if fname:
+            rankings[fname] = top_productos(dv, 20, False)
+    guardar_json(f"{DIR_ARCHIVO.name}/{fecha}.json", {"resumen": resumen, "rankings": rankings})
+    return fecha, resumen["variacion_dia"]
+
+
+def backfill(desde, hasta=None, workers=1):
+    """Corre analizar_fecha para cada fecha guardada en [desde, hasta]."""
+    copiadas = historico_mmap.sincronizar()
+    print(f"  {historico_mmap.DIR_MMAP}: {len(copiadas)} fechas copiadas")
+    fechas = [f for f in historico_precios.fechas_disponibles()
+              if desde <= f and (hasta is None or f <= hasta)]
+    if not fechas:
+        print(f"ERROR: No hay fechas guardadas entre {desde} y {hasta or 'hoy'}")
+        return []
+    carga_desde = historico_precios.desde_dias(DIAS_HISTORIA,
+                                               datetime.strptime(fechas[0], "%Y%m%d"))
+    anomalias, _ = anomalias_precios.sincronizar(historico_mmap.cargar_historico, carga_desde)
+    cargar = anomalias_precios.sin_cuarentena(historico_mmap.cargar_historico, anomalias)
+    DIR_ARCHIVO.mkdir(parents=True, exist_ok=True)
+    hechas = indice_precios.mapear(analizar_fecha, fechas, workers,
+                                   _iniciar_archivo, (cargar, carga_desde, fechas[-1]))
+    for fecha, variacion in hechas:
+        print(f"  {DIR_ARCHIVO}/{fecha}.json  día: {variacion if variacion is not None else '-'}%")
+    return fechas
 
 
 def main():
     solo_graficos = "--solo-graficos" in sys.argv
+    rebuild = "--rebuild" in sys.argv
+    workers = int(sys.argv[sys.argv.index("--workers") + 1]) if "--workers" in sys.argv else 1
+    desde, hasta = (sys.argv[sys.argv.index(f) + 1].replace("-", "") if f in sys.argv else None
+                    for f in ("--desde", "--hasta"))
+    if "--profile" in sys.argv or "--cprofile" in sys.argv:
+        perfil.activar(cprofile="--cprofile" in sys.argv)
 
     print(f"\n{'='*60}")
     print(f"  ANALISIS CARREFOUR — {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     if solo_graficos:
         print(f"  MODO: solo gráficos (sin scraping)")
+    if rebuild:
+        print(f"  MODO: rebuild del índice (verifica contra el incremental)")
+    if desde:
+        print(f"  MODO: backfill {desde} a {hasta or 'la última fecha'} en data/archivo/")
+    if workers > 1:
+        print(f"  MODO: {workers} procesos")
+    if perfil.activo:
+        print(f"  MODO: perfilado{' con cProfile' if perfil.cprofile else ''}")
     print(f"{'='*60}\n")
 
     fecha_hoy = datetime.now().strftime("%Y%m%d")
     DIR_DATA.mkdir(parents=True, exist_ok=True)
 
+    with perfil.etapa("migrar_compacto"):
+        # antes: el CSV viejo es sólo si no hay log
+        restauradas, reemplazadas = historico_delta.restaurar()
+        historico_precios.migrar_compacto()
+    if restauradas:
+        print(f"  {DIR_HIST}: {len(restauradas)} particiones rearmadas desde "
+              f"{historico_delta.DIR_DELTA}")
+
+    if desde:
+        with perfil.etapa("backfill"):
+            fechas = backfill(desde, hasta, workers)
+        print(f"\n{'='*60}")
+        print(f"  LISTO — {len(fechas)} fechas recalculadas")
+        if perfil.activo:
+            rep = perfil.reporte(desde=desde, hasta=hasta, argumentos=sys.argv[1:])
+            ruta = perfil.guardar(rep)
+            perfil_analizador.imprimir(rep)
+            print(f"  Perfil: {ruta}")
+        print(f"{'='*60}\n")
+        return
+
+    fecha_guardada = None
+    cargar = historico_precios.cargar_historico
     if solo_graficos:
-        if not PRECIOS_COMPACTO.exists():
-            print("ERROR: No existe precios_compacto.csv")
+        fechas = historico_precios.fechas_disponibles()
+        if not fechas:
+            print(f"ERROR: No hay histórico en {DIR_HIST}")
             return
-        df_hist = pd.read_csv(PRECIOS_COMPACTO, dtype={"product_id": str, "fecha": str})
-        fecha_hoy = sorted(df_hist["fecha"].unique())[-1]
-        df_dia = df_hist[df_hist["fecha"] == fecha_hoy].copy()
-        print(f"  Usando fecha más reciente: {fecha_hoy} ({len(df_dia)} prods)")
+        fecha_hoy = fechas[-1]
+        with perfil.etapa("sincronizar_mmap"):
+            copiadas = historico_mmap.sincronizar()
+        print(f"  {historico_mmap.DIR_MMAP}: {len(copiadas)} fechas copiadas")
+        cargar = historico_mmap.cargar_historico
     else:
         print("[1/5] Cargando CSVs de hoy ...")
-        df_raw = cargar_csvs_hoy()
-        if df_raw is None:
-            return
-        df_dia = preparar_df_dia(df_raw, fecha_hoy)
-        print("\n[2/5] Guardando precios_compacto ...")
-        df_hist = guardar_compacto(df_dia, fecha_hoy)
+        with perfil.etapa("1_cargar_csvs"):
+            df_raw = cargar_csvs_hoy()
+            if df_raw is None:
+                return
+            df_dia = preparar_df_dia(df_raw, fecha_hoy)
+        print("\n[2/5] Guardando histórico ...")
+        with perfil.etapa("2_guardar_historico"):
+            guardar_compacto(df_dia, fecha_hoy)
+        fecha_guardada = fecha_hoy
+
+    with perfil.etapa("anomalias"):
+        anomalias, cambiadas = anomalias_precios.sincronizar(
+            cargar, historico_precios.desde_dias(DIAS_HISTORIA))
+        cargar = anomalias_precios.sin_cuarentena(cargar, anomalias)
+        reporte = anomalias_precios.reporte(anomalias, fecha_hoy)
+        guardar_json(anomalias_precios.REPORTE.name, reporte)
+    hoy_fuera = len(anomalias["fechas"].get(fecha_hoy, {}).get("filas", []))
+    print(f"  Anomalías: {hoy_fuera} filas de hoy en cuarentena, "
+          f"{reporte['filas_en_cuarentena']} en {len(reporte['por_fecha'])} fechas "
+          f"({len(cambiadas)} fechas cambiaron)")
+
+    with perfil.etapa("cargar_historico"):
+        df_hist = cargar_historico(None if rebuild else fechas_snapshots(fecha_hoy), cargar)
+        indice = historico_precios.IndiceFechas(df_hist)
+        df_dia = indice.dia(fecha_hoy)
+    if solo_graficos:
+        print(f"  Usando fecha más reciente: {fecha_hoy} ({len(df_dia)} prods)")
 
     print("\n[3/5] Calculando variaciones ...")
-    resumen = {
-        "fecha": fecha_hoy,
-        "total_productos": len(df_dia),
-        "variacion_dia": None, "variacion_7d": None,
-        "variacion_mes": None, "variacion_6m": None, "variacion_anio": None,
-        "categorias_dia": [], "ranking_baja_dia": [],
-        "productos_subieron_dia": 0, "productos_bajaron_dia": 0, "productos_sin_cambio_dia": 0,
-    }
+    resumen = resumen_vacio(fecha_hoy, len(df_dia))
 
-    df_ayer = snapshot_anterior(df_hist, fecha_hoy)
-    if df_ayer is not None:
-        dv = calcular_variacion(df_dia, df_ayer)
-        if not dv.empty:
-            resumen["variacion_dia"]            = round(float(dv["diff_pct"].mean()), 2)
-            resumen["productos_subieron_dia"]   = int((dv["diff_pct"] > 0).sum())
-            resumen["productos_bajaron_dia"]    = int((dv["diff_pct"] < 0).sum())
-            resumen["productos_sin_cambio_dia"] = int((dv["diff_pct"] == 0).sum())
-            resumen["ranking_baja_dia"]         = top_productos(dv, 10, True)
-            resumen["categorias_dia"]           = calcular_variacion_cats(dv).to_dict("records")
-            print(f"  Variación día: {resumen['variacion_dia']}%")
-            with open(DIR_DATA / "ranking_dia.json", "w", encoding="utf-8") as f:
-                json.dump(top_productos(dv, 20, False), f, ensure_ascii=False, indent=2)
-
-    for label, dias, key, fname in [
-        ("7d",  7,   "variacion_7d",   "ranking_7d.json"),
-        ("30d", 30,  "variacion_mes",  "ranking_mes.json"),
-        ("6m",  180, "variacion_6m",   None),
-        ("1y",  365, "variacion_anio", "ranking_anio.json"),
-    ]:
-        f_target = (datetime.now() - timedelta(days=dias)).strftime("%Y%m%d")
-        df_ref = snapshot_en_fecha(df_hist, f_target)
-        if df_ref is not None:
-            dv = calcular_variacion(df_dia, df_ref)
+    with perfil.etapa("3_variacion_dia"):
+        df_ayer = snapshot_anterior(indice, fecha_hoy)
+        if df_ayer is not None:
+            dv = calcular_variacion(df_dia, df_ayer)
             if not dv.empty:
-                resumen[key] = round(float(dv["diff_pct"].mean()), 2)
-                print(f"  Variación {label}: {resumen[key]}%")
-                if fname:
-                    with open(DIR_DATA / fname, "w", encoding="utf-8") as f:
-                        json.dump(top_productos(dv, 20, False), f, ensure_ascii=False, indent=2)
+                completar_dia(resumen, dv)
+                print(f"  Variación día: {resumen['variacion_dia']}%")
+                guardar_json("ranking_dia.json", top_productos(dv, 20, False))
+
+    with perfil.etapa("3_variacion_periodos"):
+        periodos, tareas = [], []
+        for label, dias, key, fname in COMPARACIONES:
+            f_target = (datetime.now() - timedelta(days=dias)).strftime("%Y%m%d")
+            f_ref = fecha_snapshot(indice, f_target)
+            if f_ref is not None:
+                periodos.append((label, key, fname))
+                tareas.append((fecha_hoy, f_ref, fname is not None))
+
+        resultados = indice_precios.mapear(variacion_periodo, tareas, workers,
+                                           _iniciar_lector, (cargar,))
+        for (label, key, fname), (variacion, ranking) in zip(periodos, resultados):
+            if variacion is None:
+                continue
+            resumen[key] = variacion
+            print(f"  Variación {label}: {resumen[key]}%")
+            if fname:
+                guardar_json(fname, ranking)
 
     print("\n[4/5] Guardando resumen.json ...")
-    with open(DIR_DATA / "resumen.json", "w", encoding="utf-8") as f:
-        json.dump(resumen, f, ensure_ascii=False, indent=2)
+    with perfil.etapa("4_resumen"):
+        guardar_json("resumen.json", resumen)
 
     print("\n[5/5] Generando graficos.json ...")
-    graficos = generar_graficos_data(df_hist)
-    with open(DIR_DATA / "graficos.json", "w", encoding="utf-8") as f:
-        json.dump(graficos, f, ensure_ascii=False, indent=2)
+    with perfil.etapa("5_graficos"):
+        graficos = actualizar_indice(df_hist, fecha_guardada, rebuild, cargar, workers,
+                                     set(cambiadas) | set(reemplazadas))
+        guardar_json("graficos.json", graficos)
 
     print(f"\n{'='*60}")
     print(f"  LISTO — {resumen['total_productos']} productos")
@@ -282,6 +550,12 @@ def main():
                  ("1y", resumen["variacion_anio"])]:
         if v is not None:
             print(f"  {k}: {'📈' if v > 0 else '📉'} {v}%")
+    if perfil.activo:
+        rep = perfil.reporte(fecha=fecha_hoy, filas_historico=len(df_hist),
+                             argumentos=sys.argv[1:])
+        ruta = perfil.guardar(rep)
+        perfil_analizador.imprimir(rep)
+        print(f"  Perfil: {ruta}")
     print(f"{'='*60}\n")
 
 
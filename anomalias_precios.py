@@ -0,0 +1,286 @@
+"""
+anomalias_precios.py
+====================
+Cuarentena de precios anómalos antes de que entren en las variaciones,
+los rankings y el índice: errores de scraping como un precio de $1 o la
+coma corrida (×100, ÷100).
+
+Cada precio_regular se compara, en escala logarítmica, con la mediana
+de ese producto en las VENTANA fechas guardadas anteriores, normalizada
+por el MAD (desvío absoluto mediano) de esas mismas fechas:
+
+    z = |log(precio) - mediana| / (1.4826 · max(MAD, MAD_MINIMO))
+
+Una fila va a cuarentena si su precio es <= PRECIO_MINIMO, o si tiene
+al menos MIN_OBS precios en la ventana, z > UMBRAL_Z y el salto contra
+la mediana es de SALTO_MINIMO veces o más (para arriba o para abajo).
+Un cambio de precio real de ese tamaño queda afuera hasta que la
+mediana lo alcanza (media ventana). Sólo se mira hacia atrás, así que
+lo que se decide para una fecha no cambia cuando llegan las siguientes.
+
+La detección corre sobre la matriz fecha × producto con numpy, por
+bloques de fechas y sin loops por producto: el mínimo y el máximo de
+cada ventana descartan casi todas las celdas y sólo para las que quedan
+se ordena la ventana para sacar mediana y MAD.
+
+El estado (data/anomalias_estado.json) guarda por fecha las filas en
+cuarentena y una firma de las particiones de su ventana: sincronizar()
+sólo evalúa las fechas nuevas o cuya ventana cambió (partición
+reescrita, compactación) y devuelve las que cambiaron de cuarentena,
+para que el índice recalcule esos pasos. El reporte para revisar a mano
+va a data/anomalias.json.
+
+Uso:
+    python anomalias_precios.py            # sincroniza y escribe el reporte
+"""
+
+import functools
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+import historico_mmap
+import historico_precios
+from historico_precios import DIR_DATA
+
+ESTADO  = DIR_DATA / "anomalias_estado.json"
+REPORTE = DIR_DATA / "anomalias.json"
+VERSION_ESTADO = 1
+
+VENTANA       = 28     # fechas guardadas anteriores contra las que se compara
+MIN_OBS       = 3      # precios mínimos en la ventana para usar la mediana
+UMBRAL_Z      = 5.0
+SALTO_MINIMO  = 3.0    # veces contra la mediana (×3 o ÷3)
+MAD_MINIMO    = 0.01   # en log: precios que nunca cambian no dan z infinito
+PRECIO_MINIMO = 1.0    # $1 o menos es siempre un error
+BLOQUE        = 32     # fechas por bloque de la matriz de ventanas
+DIAS_REPORTE  = 30
+
+PARAMETROS = {"ventana": VENTANA, "min_obs": MIN_OBS, "umbral_z": UMBRAL_Z,
+              "salto_minimo": SALTO_MINIMO, "mad_minimo": MAD_MINIMO,
+              "precio_minimo": PRECIO_MINIMO}
+CAMPOS = ["product_key", "precio_regular", "mediana", "salto", "z", "motivo"]
+
+
+# ── DETECCIÓN ─────────────────────────────────────────────────────────────────
+def _mediana(w):
+    """Mediana del último eje ignorando NaN/inf (ordena `w` en el lugar) y cuántos valores."""
+    w[np.isnan(w)] = np.inf
+    w.sort(axis=-1)
+    n = (w < np.inf).sum(axis=-1)
+    bajo = np.take_along_axis(w, (np.maximum(n - 1, 0) // 2)[..., None], -1)[..., 0]
+    alto = np.take_along_axis(w, (n // 2)[..., None], -1)[..., 0]
+    with np.errstate(invalid="ignore"):
+        return np.where(n > 0, (bajo + alto) / 2, np.nan), n
+
+
+def detectar(df, evaluar=None):
+    """
+    Filas en cuarentena de las fechas `evaluar` (YYYYMMDD; todas si es
+    None) de `df`, que tiene que traer también las VENTANA fechas
+    anteriores a cada una. DataFrame con fecha y CAMPOS.
+    """
+    indice = historico_precios.IndiceFechas(df)
+    claves, col = np.unique(indice.df["product_key"].to_numpy(), return_inverse=True)
+    precios = np.full((len(indice), len(claves)), np.nan, dtype=np.float32)
+    precios[indice.filas(), col] = indice.df["precio_regular"].to_numpy(dtype=np.float32)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        logs = np.log(np.where(precios > PRECIO_MINIMO, precios, np.nan))
+    # ventanas[i]: las VENTANA fechas anteriores a la fila i (NaN antes de la primera)
+    ventanas = sliding_window_view(
+        np.vstack([np.full((VENTANA, len(claves)), np.nan, np.float32), logs]), VENTANA, axis=0)
+
+    evaluada = np.ones(len(indice), bool) if evaluar is None else \
+        np.isin(indice.fechas, [int(f) for f in evaluar])
+    filas = np.flatnonzero(evaluada)
+    partes = []
+    for inicio in range(filas[0] if len(filas) else 0, filas[-1] + 1 if len(filas) else 0,
+                        BLOQUE):
+        fin = min(inicio + BLOQUE, filas[-1] + 1)
+        # La mediana está entre el mínimo y el máximo de la ventana: sólo
+        # puede haber un salto donde el precio se aleja SALTO_MINIMO de alguno.
+        w, x = ventanas[inicio:fin], logs[inicio:fin]
+        with np.errstate(invalid="ignore"):
+            lejos = (x - np.fmin.reduce(w, axis=-1) >= np.log(SALTO_MINIMO)) \
+                  | (np.fmax.reduce(w, axis=-1) - x >= np.log(SALTO_MINIMO))
+            minimo = precios[inicio:fin] <= PRECIO_MINIMO
+        f, c = np.nonzero((lejos | minimo) & evaluada[inicio:fin, None])
+        if not len(f):
+            continue
+        partes.append(_evaluar(w[f, c], precios[inicio:fin][f, c], minimo[f, c],
+                               indice.fechas[inicio:fin][f], claves[c]))
+    if not partes:
+        return pd.DataFrame(columns=["fecha"] + CAMPOS)
+    return pd.concat(partes, ignore_index=True)
+
+
+def _evaluar(ventana, precio, minimo, fecha, product_key):
+    """Aplica el criterio a filas candidatas, cada una con su ventana (filas × VENTANA)."""
+    mediana, n = _mediana(ventana.copy())
+    mad, _ = _mediana(np.abs(ventana - mediana[:, None]))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dif = np.abs(np.log(precio) - mediana)
+        z = dif / (1.4826 * np.maximum(mad, MAD_MINIMO))
+        salto = (n >= MIN_OBS) & (dif >= np.log(SALTO_MINIMO)) & (z > UMBRAL_Z)
+    fuera = salto | minimo
+    mediana = np.exp(mediana.astype(np.float64))
+    return pd.DataFrame({
+        "fecha":          fecha[fuera],
+        "product_key":    product_key[fuera],
+        "precio_regular": precio[fuera].astype(np.float64).round(2),
+        "mediana":        mediana[fuera].round(2),
+        "salto":          (precio[fuera] / mediana[fuera]).round(2),
+        "z":              np.where(salto, z, np.nan)[fuera].astype(np.float64).round(1),
+        "motivo":         np.where(minimo[fuera], "minimo", "salto"),
+    })
+
+
+# ── ESTADO INCREMENTAL ────────────────────────────────────────────────────────
+def estado_vacio():
+    return {"version": VERSION_ESTADO, "parametros": PARAMETROS, "fechas": {}}
+
+
+def cargar_estado(ruta=ESTADO):
+    """Estado guardado; vacío si no existe o es de otra versión/parámetros."""
+    if ruta.exists():
+        with open(ruta, encoding="utf-8") as f:
+            estado = json.load(f)
+        if estado.get("version") == VERSION_ESTADO and estado.get("parametros") == PARAMETROS:
+            return estado
+        print(f"  {ruta}: versión o parámetros distintos, se recalcula")
+    return estado_vacio()
+
+
+def guardar_estado(estado, ruta=ESTADO):
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    tmp = ruta.with_suffix(ruta.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(estado, f, ensure_ascii=False, indent=1)
+    tmp.replace(ruta)
+
+
+def _contextos(todas, desde_i):
+    """Firma de cada fecha desde la posición `desde_i`: ella y su ventana."""
+    firmas = {f: historico_mmap.firma_particion(f)
+              for f in todas[max(0, desde_i - VENTANA):]}
+    return {f: hashlib.md5(" ".join(f"{g}:{firmas[g]}"
+                                    for g in todas[max(0, i - VENTANA):i + 1]).encode()).hexdigest()
+            for i, f in enumerate(todas[desde_i:], desde_i)}
+
+
+def _filas_json(df):
+    return [[int(r.product_key), float(r.precio_regular),
+             *(None if pd.isna(v) else float(v) for v in (r.mediana, r.salto, r.z)), r.motivo]
+            for r in df.itertuples(index=False)]
+
+
+def sincronizar(cargar=historico_precios.cargar_historico, desde=None):
+    """
+    Pone al día el estado con las fechas de data/hist/ desde `desde` (más
+    la anterior inmediata): evalúa las nuevas y las de ventana cambiada,
+    leyéndolas con `cargar`, y descarta las que ya no están. Guarda y
+    devuelve (estado, fechas cuya cuarentena cambió).
+    """
+    estado = cargar_estado()
+    todas = historico_precios.fechas_disponibles()
+    fechas = historico_precios.fechas_en_rango(todas, desde)
+    contextos = _contextos(todas, todas.index(fechas[0])) if fechas else {}
+    previas = estado["fechas"]
+    evaluar = [f for f in fechas
+               if f not in previas or previas[f]["contexto"] != contextos[f]]
+
+    nuevas = {}
+    if evaluar:
+        posicion = {f: i for i, f in enumerate(todas)}
+        leer = sorted({g for f in evaluar
+                       for g in todas[max(0, posicion[f] - VENTANA):posicion[f] + 1]})
+        detectadas = detectar(cargar(fechas=leer, columnas_producto=()), evaluar)
+        por_fecha = dict(iter(detectadas.groupby("fecha")))
+        for f in evaluar:
+            nuevas[f] = {"contexto": contextos[f],
+                         "filas": _filas_json(por_fecha.get(int(f), detectadas.iloc[0:0]))}
+
+    cambiadas = sorted(f for f, d in nuevas.items()
+                       if d["filas"] != previas.get(f, {}).get("filas", []))
+    estado["fechas"] = {f: nuevas.get(f) or previas[f] for f in fechas}
+    guardar_estado(estado)
+    return estado, cambiadas
+
+
+# ── CUARENTENA AL LEER ────────────────────────────────────────────────────────
+def _clave(fecha, product_key):
+    return (np.asarray(fecha, dtype=np.int64) << 32) | np.asarray(product_key, dtype=np.int64)
+
+
+def claves_cuarentena(estado):
+    """Claves (fecha, product_key) de todas las filas en cuarentena, ordenadas."""
+    pares = [(int(f), fila[0]) for f, d in estado["fechas"].items() for fila in d["filas"]]
+    if not pares:
+        return np.empty(0, dtype=np.int64)
+    return np.sort(_clave(*zip(*pares)))
+
+
+def quitar(df, claves):
+    """`df` sin las filas en cuarentena (el mismo frame si no hay ninguna)."""
+    if not len(claves) or df.empty:
+        return df
+    fuera = np.isin(_clave(df["fecha"].to_numpy(), df["product_key"].to_numpy()), claves)
+    return df[~fuera] if fuera.any() else df
+
+
+def _cargar_sin(cargar, claves, **kwargs):
+    return quitar(cargar(**kwargs), claves)
+
+
+def sin_cuarentena(cargar, estado):
+    """
+    Lector como `cargar` (parquet, log de cambios o mmap) que ya saca las
+    filas en cuarentena. Se puede pasar a los workers.
+    """
+    return functools.partial(_cargar_sin, cargar, claves_cuarentena(estado))
+
+
+# ── REPORTE ───────────────────────────────────────────────────────────────────
+def reporte(estado, fecha, dias=DIAS_REPORTE):
+    """Resumen por fecha y detalle de los últimos `dias` días, para revisar a mano."""
+    desde = historico_precios.desde_dias(dias, pd.Timestamp(fecha).to_pydatetime())
+    filas = [dict(zip(CAMPOS, fila), fecha=f)
+             for f, d in estado["fechas"].items() if f >= desde for fila in d["filas"]]
+    detalle = pd.DataFrame(filas, columns=["fecha"] + CAMPOS)
+    if len(detalle):
+        detalle = historico_precios.unir_productos(
+            detalle, ["product_id", "nombre", "marca", "categoria"])
+        detalle = detalle.sort_values(["fecha", "z"], ascending=False, na_position="first")
+    por_fecha = [{"fecha": f, "filas": len(d["filas"])}
+                 for f, d in sorted(estado["fechas"].items()) if d["filas"]]
+    return {
+        "fecha": fecha,
+        "criterio": PARAMETROS,
+        "fechas_evaluadas": len(estado["fechas"]),
+        "filas_en_cuarentena": sum(p["filas"] for p in por_fecha),
+        "por_fecha": por_fecha,
+        "detalle": detalle.drop(columns="product_key").astype(object)
+                          .where(detalle.notna(), None).to_dict("records"),
+    }
+
+
+def main():
+    from analizar_precios_carrefour import DIAS_HISTORIA
+
+    fechas = historico_precios.fechas_disponibles()
+    if not fechas:
+        print(f"ERROR: No hay histórico en {historico_precios.DIR_HIST}")
+        return
+    estado, cambiadas = sincronizar(desde=historico_precios.desde_dias(DIAS_HISTORIA))
+    rep = reporte(estado, fechas[-1])
+    with open(REPORTE, "w", encoding="utf-8") as f:
+        json.dump(rep, f, ensure_ascii=False, indent=2)
+    print(f"  {rep['filas_en_cuarentena']} filas en cuarentena en {len(rep['por_fecha'])} fechas "
+          f"({len(cambiadas)} fechas cambiaron) | {REPORTE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+bench_analizador.py
+===================
+Mide cómo escala el analizador con el tamaño del histórico. Para cada
+cantidad de días genera un histórico sintético (historico_sintetico) más
+la salida del scraper de hoy y corre, en un proceso aparte, las etapas
+de analizar_precios_carrefour una por una, tomando de cada una tiempo de
+pared, tiempo de CPU y pico de memoria (tracemalloc).
+
+Los resultados van a un JSON con el commit medido; --comparar contra el
+JSON de otro commit muestra cuánto cambió cada etapa.
+
+Uso:
+    python benchmarks/bench_analizador.py --dias 30 180 365 730 --productos 10000 \\
+        --salida bench_analizador.json
+    python benchmarks/bench_analizador.py --dias 365 --comparar bench_analizador_main.json
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+DIR_BENCH = Path(__file__).resolve().parent
+sys.path.insert(0, str(DIR_BENCH.parent))
+sys.path.insert(0, str(DIR_BENCH))
+
+UMBRAL_REGRESION = 1.20   # --comparar marca etapas 20% más lentas o pesadas ...
+MINIMO_S         = 0.10   # ... si además tardan al menos esto más (ruido en etapas cortas)
+
+
+@contextmanager
+def medir(etapas, nombre):
+    tracemalloc.reset_peak()
+    antes = tracemalloc.get_traced_memory()[0]
+    t0, c0 = time.perf_counter(), time.process_time()
+    yield
+    etapas[nombre] = {
+        "wall_s":  round(time.perf_counter() - t0, 3),
+        "cpu_s":   round(time.process_time() - c0, 3),
+        "pico_mb": round((tracemalloc.get_traced_memory()[1] - antes) / 1e6, 1),
+    }
+
+
+def corrida_hija():
+    """Proceso hijo: corre las etapas del analizador sobre el directorio actual."""
+    import analizar_precios_carrefour as ana
+    import anomalias_precios
+    import historico_precios
+    import indice_precios
+
+    fecha_hoy = datetime.now().strftime("%Y%m%d")
+    etapas = {}
+    tracemalloc.start()
+
+    with medir(etapas, "cargar_csvs_hoy"):
+        df_raw = ana.cargar_csvs_hoy()
+    with medir(etapas, "preparar_df_dia"):
+        df_dia = ana.preparar_df_dia(df_raw, fecha_hoy)
+    with medir(etapas, "guardar_compacto"):
+        ana.guardar_compacto(df_dia, fecha_hoy)
+    with medir(etapas, "anomalias_desde_cero"):
+        anomalias_precios.sincronizar(desde=historico_precios.desde_dias(ana.DIAS_HISTORIA))
+    with medir(etapas, "cargar_snapshots"):
+        df_hist = ana.cargar_historico(ana.fechas_snapshots(fecha_hoy))
+        indice = historico_precios.IndiceFechas(df_hist)
+        df_dia = indice.dia(fecha_hoy)
+    with medir(etapas, "variacion_dia"):
+        dv = ana.calcular_variacion(df_dia, ana.snapshot_anterior(indice, fecha_hoy))
+        ana.top_productos(dv, 20, False)
+        ana.calcular_variacion_cats(dv)
+    with medir(etapas, "variacion_periodos"):
+        ana._iniciar_lector(historico_precios.cargar_historico)
+        for dias in ana.PERIODOS.values():
+            f_ref = ana.fecha_snapshot(indice, historico_precios.desde_dias(dias))
+            if f_ref is not None:
+                ana.variacion_periodo((fecha_hoy, f_ref, True))
+    with medir(etapas, "indice_sin_estado"):
+        ana.actualizar_indice(None, fecha_hoy)
+    with medir(etapas, "indice_incremental"):
+        ana.actualizar_indice(None, fecha_hoy)
+    with medir(etapas, "cargar_historico_anio"):
+        df_anio = ana.cargar_historico()
+    with medir(etapas, "graficos_desde_cero"):
+        graficos = indice_precios.generar_graficos(df_anio, ana.PERIODOS, ana.ORDEN_CATS)
+    with medir(etapas, "json_graficos"):
+        json.dumps(graficos, ensure_ascii=False, indent=2)
+
+    print("__RESULTADO__" + json.dumps({
+        "etapas": etapas,
+        "pico_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+def correr(dias, productos):
+    import historico_precios
+    import historico_sintetico
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            filas = historico_sintetico.generar(dias, productos, salida_hoy=True)
+            fechas = len(historico_precios.fechas_disponibles())
+        finally:
+            os.chdir(cwd)
+        proc = subprocess.run([sys.executable, __file__, "--hija"],
+                              cwd=tmp, capture_output=True, text=True)
+    linea = next((l for l in proc.stdout.splitlines() if l.startswith("__RESULTADO__")), None)
+    if linea is None:
+        raise RuntimeError(f"la corrida de {dias} días falló:\n{proc.stderr[-2000:]}")
+    return dict(json.loads(linea[len("__RESULTADO__"):]), dias=dias, productos=productos,
+                filas_historico=filas, fechas=fechas)
+
+
+def commit_actual():
+    proc = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=DIR_BENCH,
+                          capture_output=True, text=True)
+    return proc.stdout.strip() or None
+
+
+def comparar(resultados, ruta_base):
+    with open(ruta_base, encoding="utf-8") as f:
+        base = {r["dias"]: r for r in json.load(f)["resultados"]}
+    print(f"\nContra {ruta_base} (nuevo / base):")
+    for r in resultados:
+        previo = base.get(r["dias"])
+        if previo is None:
+            continue
+        for etapa, m in r["etapas"].items():
+            p = previo["etapas"].get(etapa)
+            if not p:
+                continue
+            ratios = [m[k] / p[k] if p[k] else 1.0 for k in ("wall_s", "pico_mb")]
+            lenta = ratios[0] > UMBRAL_REGRESION and m["wall_s"] - p["wall_s"] >= MINIMO_S
+            marca = "  REGRESIÓN" if lenta or ratios[1] > UMBRAL_REGRESION else ""
+            print(f"  {r['dias']:>4}d {etapa:<22} tiempo x{ratios[0]:.2f}  memoria x{ratios[1]:.2f}{marca}")
+
+
+def main():
+    if sys.argv[1:] == ["--hija"]:
+        corrida_hija()
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark del analizador por tamaño de histórico")
+    parser.add_argument("--dias", nargs="+", type=int, default=[30, 180, 365, 730])
+    parser.add_argument("--productos", type=int, default=10_000)
+    parser.add_argument("--salida", help="guarda los resultados en este JSON")
+    parser.add_argument("--comparar", help="JSON de otra corrida para comparar")
+    args = parser.parse_args()
+
+    resultados = []
+    for dias in args.dias:
+        print(f"\n{dias} días x {args.productos} productos ...")
+        r = correr(dias, args.productos)
+        resultados.append(r)
+        print(f"  {r['filas_historico']} filas en {r['fechas']} fechas, pico RSS {r['pico_rss_mb']} MB")
+        print(f"  {'etapa':<22} {'pared s':>8} {'cpu s':>8} {'pico MB':>8}")
+        for etapa, m in r["etapas"].items():
+            print(f"  {etapa:<22} {m['wall_s']:>8.3f} {m['cpu_s']:>8.3f} {m['pico_mb']:>8.1f}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"commit": commit_actual(),
+                       "fecha": datetime.now().isoformat(timespec="seconds"),
+                       "config": vars(args), "resultados": resultados}, f, indent=2)
+    if args.comparar:
+        comparar(resultados, args.comparar)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+bench_parseo.py
+===============
+Compara el parser de fetch_page anterior (dict por SKU + r.json() +
+datetime.now() por fila) con carrefour_scraper.parsear_productos sobre
+las mismas respuestas.
+
+Uso:
+    python benchmarks/bench_parseo.py [--respuestas DIR] [--repeticiones N]
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import carrefour_scraper  # noqa: E402
+from datos_vtex import respuestas  # noqa: E402
+
+
+def parser_anterior(contenido, cat_nombre, cat_principal):
+    """Copia del loop de fetch_page antes de parsear_productos."""
+    skus = []
+    for p in json.loads(contenido):
+        for sku in p.get("items", []):
+            sellers = sku.get("sellers", [])
+            if not sellers:
+                continue
+            offer = sellers[0].get("commertialOffer", {})
+            skus.append({
+                "fecha":          datetime.now().strftime("%Y-%m-%d"),
+                "product_id":     p.get("productId", ""),
+                "sku_id":         sku.get("itemId", ""),
+                "ean":            sku.get("ean", ""),
+                "nombre":         sku.get("nameComplete") or p.get("productName", ""),
+                "marca":          p.get("brand", ""),
+                "categoria":      cat_nombre,
+                "precio_actual":  offer.get("Price"),
+                "precio_regular": offer.get("ListPrice"),
+                "disponible":     offer.get("AvailableQuantity", 0),
+                "link":           p.get("link", ""),
+                "cat_principal":  cat_principal,
+            })
+    return skus
+
+
+def medir(fn, cuerpos, repeticiones):
+    mejor = float("inf")
+    filas = 0
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        filas = sum(len(fn(c, "Aceites y vinagres", "Almacén")) for c in cuerpos)
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor, filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--respuestas", help="directorio con respuestas grabadas (*.json)")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    cuerpos = respuestas(args.respuestas)
+    mb = sum(len(c) for c in cuerpos) / 1e6
+    decoder = carrefour_scraper.cargar_json.__module__
+    print(f"{len(cuerpos)} páginas | {mb:.1f} MB | decoder: {decoder}")
+
+    t_ant, n_ant = medir(parser_anterior, cuerpos, args.repeticiones)
+    t_nue, n_nue = medir(carrefour_scraper.parsear_productos, cuerpos, args.repeticiones)
+    assert n_ant == n_nue, "los parsers devuelven distinta cantidad de filas"
+
+    for nombre, t, n in [("anterior", t_ant, n_ant), ("parsear_productos", t_nue, n_nue)]:
+        print(f"  {nombre:<18} {t*1000:8.1f} ms | {n / t:10.0f} filas/s")
+    print(f"  speedup: {t_ant / t_nue:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
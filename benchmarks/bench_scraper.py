@@ -0,0 +1,123 @@
+"""
+bench_scraper.py
+================
+Corre carrefour_scraper de punta a punta contra mock_vtex y reporta, por
+engine y cantidad de workers: páginas/s, latencia por request
+(p50/p95/p99, del reporte de metricas_scraper), reintentos (429/5xx
+servidos) y pico de memoria.
+
+Cada corrida es un proceso aparte (así el pico de RSS es sólo de esa
+corrida) que trabaja en un directorio temporal.
+
+Uso:
+    python benchmarks/bench_scraper.py --engines async threads --workers 5 10 20
+    python benchmarks/bench_scraper.py --tasa-429 0.02 --salida bench_scraper.json
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+DIR_BENCH = Path(__file__).resolve().parent
+sys.path.insert(0, str(DIR_BENCH.parent))
+sys.path.insert(0, str(DIR_BENCH))
+
+
+def corrida_hija(engine, workers):
+    """Proceso hijo: corre el scraper y devuelve su reporte de métricas."""
+    import carrefour_scraper
+
+    t0 = time.perf_counter()
+    carrefour_scraper.main(["--engine", engine, "--workers", str(workers),
+                            "--refrescar-categorias"])
+    duracion = time.perf_counter() - t0
+
+    reporte = next(carrefour_scraper.OUTPUT_DIR.glob("*.reporte.json"))
+    with open(reporte, encoding="utf-8") as f:
+        rep = json.load(f)
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print("__RESULTADO__" + json.dumps({
+        "duracion_s": round(duracion, 3),
+        "filas": rep["skus"],
+        "requests_cliente": rep["requests"],
+        "reintentos_cliente": rep["reintentos"],
+        "latencia_ms": rep["latencia_ms"],
+        "pico_rss_mb": round(rss_kb / 1024, 1),
+    }))
+
+
+def correr(engine, workers, url, stats):
+    stats.reset()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, CARREBOT_BASE_URL=url)
+        proc = subprocess.run(
+            [sys.executable, __file__, "--hija", engine, str(workers)],
+            cwd=tmp, env=env, capture_output=True, text=True)
+    linea = next((l for l in proc.stdout.splitlines() if l.startswith("__RESULTADO__")), None)
+    if linea is None:
+        raise RuntimeError(f"la corrida {engine}/{workers} falló:\n{proc.stderr[-2000:]}")
+    res = json.loads(linea[len("__RESULTADO__"):])
+    servidor = stats.como_dict()
+    res.update({
+        "engine": engine,
+        "workers": workers,
+        "paginas": servidor["paginas"],
+        "paginas_s": round(servidor["paginas"] / res["duracion_s"], 1),
+        "reintentos": servidor["throttles"] + servidor["errores"],
+        "mb_descargados": round(servidor["bytes"] / 1e6, 1),
+    })
+    return res
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "--hija":
+        corrida_hija(sys.argv[2], int(sys.argv[3]))
+        return
+
+    import mock_vtex
+    from carrefour_scraper import CATEGORIAS, ENGINES
+
+    parser = argparse.ArgumentParser(description="Benchmark del scraper contra mock_vtex")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--workers", nargs="+", type=int, default=[5, 10, 20])
+    parser.add_argument("--categorias", type=int, default=20)
+    parser.add_argument("--escala", type=float, default=1.0)
+    parser.add_argument("--latencia-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=15.0)
+    parser.add_argument("--tasa-429", type=float, default=0.0)
+    parser.add_argument("--tasa-error", type=float, default=0.0)
+    parser.add_argument("--salida", help="guarda los resultados en este JSON")
+    args = parser.parse_args()
+
+    servidor, url, stats = mock_vtex.iniciar(
+        0, CATEGORIAS[:args.categorias], args.escala, args.latencia_ms, args.jitter_ms,
+        args.tasa_429, args.tasa_error)
+
+    resultados = []
+    print(f"{'engine':<8} {'workers':>7} {'seg':>7} {'pág/s':>7} {'p50':>7} {'p95':>7} "
+          f"{'p99':>7} {'reint':>6} {'RSS MB':>7} {'filas':>7}")
+    try:
+        for engine in args.engines:
+            for workers in args.workers:
+                r = correr(engine, workers, url, stats)
+                resultados.append(r)
+                lat = r["latencia_ms"]
+                print(f"{engine:<8} {workers:>7} {r['duracion_s']:>7.1f} {r['paginas_s']:>7.1f} "
+                      f"{lat.get('p50', 0):>7.1f} {lat.get('p95', 0):>7.1f} {lat.get('p99', 0):>7.1f} "
+                      f"{r['reintentos']:>6} {r['pico_rss_mb']:>7.1f} {r['filas']:>7}")
+    finally:
+        servidor.shutdown()
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "resultados": resultados}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+bench_solo_graficos.py
+======================
+Mide lo que hace --solo-graficos sin estado del índice (leer el año de
+histórico y calcular graficos.json desde cero) con tres lectores sobre
+el mismo histórico sintético:
+
+- csv:     data/precios_compacto.csv parseado como texto (camino anterior)
+- parquet: particiones data/hist/ (historico_precios)
+- mmap:    copia columnar data/hist_mmap/ (historico_mmap)
+
+Cada lector corre en un proceso aparte (el pico de RSS es sólo suyo) y
+reporta segundos de lectura, segundos totales y pico de RSS.
+
+Uso:
+    python benchmarks/bench_solo_graficos.py --dias 365 --productos 20000
+    python benchmarks/bench_solo_graficos.py --dir /tmp/hist1y --salida bench_solo_graficos.json
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+DIR_BENCH = Path(__file__).resolve().parent
+sys.path.insert(0, str(DIR_BENCH.parent))
+sys.path.insert(0, str(DIR_BENCH))
+
+LECTORES = ("csv", "parquet", "mmap")
+
+
+def leer_csv(desde):
+    import pandas as pd
+
+    import historico_precios
+
+    df = pd.read_csv(historico_precios.PRECIOS_COMPACTO,
+                     dtype={"product_id": str, "sku_id": str, "ean": str, "fecha": str})
+    df = df[df["fecha"] >= desde]
+    claves = historico_precios.cargar_productos(["product_id"])["product_id"]
+    claves = pd.Series(claves.index, index=claves.to_numpy())
+    return pd.DataFrame({
+        "product_key":    claves.reindex(df["product_id"]).to_numpy(),
+        "fecha":          df["fecha"].astype("int32").to_numpy(),
+        "precio_actual":  df["precio_actual"].to_numpy(),
+        "precio_regular": df["precio_regular"].to_numpy(),
+        "cat_principal":  df["cat_principal"].astype("category").to_numpy(),
+    })
+
+
+def corrida_hija(lector):
+    """Proceso hijo: lee el histórico con `lector` y arma graficos.json."""
+    import historico_mmap
+    import historico_precios
+    import indice_precios
+    from analizar_precios_carrefour import DIAS_HISTORIA, ORDEN_CATS, PERIODOS
+
+    desde = historico_precios.desde_dias(DIAS_HISTORIA)
+    t0 = time.perf_counter()
+    if lector == "csv":
+        df = leer_csv(desde)
+    elif lector == "parquet":
+        df = historico_precios.cargar_historico(desde=desde)
+    else:
+        df = historico_mmap.cargar_historico(desde=desde)
+    lectura = time.perf_counter() - t0
+    graficos = indice_precios.generar_graficos(df, PERIODOS, ORDEN_CATS)
+    total = time.perf_counter() - t0
+
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print("__RESULTADO__" + json.dumps({
+        "lector": lector,
+        "filas": len(df),
+        "lectura_s": round(lectura, 3),
+        "total_s": round(total, 3),
+        "pico_rss_mb": round(rss_kb / 1024, 1),
+        "puntos_total_1y": len(graficos.get("1y", {}).get("total", [])),
+    }))
+
+
+def correr(lector, directorio):
+    proc = subprocess.run([sys.executable, __file__, "--hija", lector],
+                          cwd=directorio, capture_output=True, text=True)
+    linea = next((l for l in proc.stdout.splitlines() if l.startswith("__RESULTADO__")), None)
+    if linea is None:
+        raise RuntimeError(f"la corrida {lector} falló:\n{proc.stderr[-2000:]}")
+    return json.loads(linea[len("__RESULTADO__"):])
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--hija":
+        corrida_hija(sys.argv[2])
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark de lectura para --solo-graficos")
+    parser.add_argument("--dias", type=int, default=365)
+    parser.add_argument("--productos", type=int, default=20_000)
+    parser.add_argument("--lectores", nargs="+", choices=LECTORES, default=list(LECTORES))
+    parser.add_argument("--dir", type=Path,
+                        help="usa (o genera, si está vacío) el histórico en este directorio")
+    parser.add_argument("--salida", help="guarda los resultados en este JSON")
+    args = parser.parse_args()
+    salida = Path(args.salida).resolve() if args.salida else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directorio = (args.dir or Path(tmp)).resolve()
+        directorio.mkdir(parents=True, exist_ok=True)
+        os.chdir(directorio)
+
+        import historico_mmap
+        import historico_precios
+        import historico_sintetico
+
+        if not historico_precios.fechas_disponibles():
+            print(f"Generando histórico sintético: {args.dias} días x {args.productos} productos ...")
+            historico_sintetico.generar(args.dias, args.productos, csv=True)
+        historico_mmap.sincronizar()
+
+        resultados = []
+        print(f"{'lector':<8} {'filas':>9} {'lectura s':>10} {'total s':>8} {'RSS MB':>8}")
+        for lector in args.lectores:
+            r = correr(lector, directorio)
+            resultados.append(r)
+            print(f"{lector:<8} {r['filas']:>9} {r['lectura_s']:>10.2f} {r['total_s']:>8.2f} "
+                  f"{r['pico_rss_mb']:>8.1f}")
+
+    if salida:
+        with open(salida, "w", encoding="utf-8") as f:
+            json.dump({"config": {k: str(v) for k, v in vars(args).items()},
+                       "resultados": resultados}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
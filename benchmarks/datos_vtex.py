@@ -0,0 +1,89 @@
+"""
+datos_vtex.py
+=============
+Respuestas de products/search para los benchmarks: grabadas (un .json por
+página en un directorio) o sintéticas con la misma forma que devuelve
+VTEX, incluyendo los campos que el scraper no lee (imágenes,
+especificaciones, etc.) para que el costo de decodificar sea realista.
+"""
+
+import json
+import random
+from pathlib import Path
+
+MARCAS = ["Carrefour", "Arcor", "Nestlé", "La Serenísima", "Coca-Cola",
+          "Quilmes", "Molinos", "Unilever", "Procter & Gamble", "Ledesma"]
+
+
+def producto_sintetico(product_id, rng, skus_por_producto=1):
+    """Un producto con la estructura de VTEX (campos reales y de relleno)."""
+    nombre = f"Producto {product_id} {rng.choice(['x 500 g', 'x 1 L', 'x 6 u', '350 ml'])}"
+    precio = round(rng.lognormvariate(7.5, 0.9), 2)
+    items = []
+    for k in range(skus_por_producto):
+        sku_id = f"{product_id}{k:02d}"
+        items.append({
+            "itemId": sku_id,
+            "name": nombre,
+            "nameComplete": nombre,
+            "complementName": "",
+            "ean": f"779{rng.randrange(10**9, 10**10)}",
+            "referenceId": [{"Key": "RefId", "Value": sku_id}],
+            "measurementUnit": "un",
+            "unitMultiplier": 1.0,
+            "images": [{
+                "imageId": str(rng.randrange(10**6)),
+                "imageLabel": "", "imageTag": "",
+                "imageUrl": f"https://carrefourar.vtexassets.com/arquivos/ids/{sku_id}/img.jpg",
+                "imageText": nombre,
+            } for _ in range(3)],
+            "sellers": [{
+                "sellerId": "1",
+                "sellerName": "Carrefour",
+                "sellerDefault": True,
+                "commertialOffer": {
+                    "Price": precio,
+                    "ListPrice": round(precio * rng.choice([1.0, 1.0, 1.0, 1.25]), 2),
+                    "PriceWithoutDiscount": precio,
+                    "AvailableQuantity": rng.choice([0, 10, 99999]),
+                    "Installments": [{"Value": precio, "NumberOfInstallments": 1,
+                                      "PaymentSystemName": "Visa"}] * 4,
+                    "Tax": 0.0,
+                    "DiscountHighLight": [],
+                    "Teasers": [],
+                },
+            }],
+        })
+    return {
+        "productId": str(product_id),
+        "productName": nombre,
+        "brand": rng.choice(MARCAS),
+        "brandId": rng.randrange(1000),
+        "link": f"https://www.carrefour.com.ar/producto-{product_id}/p",
+        "description": "Descripción larga del producto. " * 8,
+        "categories": ["/Almacén/Aceites y vinagres/", "/Almacén/"],
+        "categoriesIds": ["/161/162/", "/161/"],
+        "allSpecifications": ["Contenido", "Origen"],
+        "Contenido": ["500 g"],
+        "Origen": ["Argentina"],
+        "clusterHighlights": {},
+        "properties": [],
+        "items": items,
+    }
+
+
+def pagina_sintetica(primer_id, n=50, semilla=0):
+    rng = random.Random(semilla + primer_id)
+    return [producto_sintetico(primer_id + i, rng) for i in range(n)]
+
+
+def respuestas(directorio=None, paginas=40):
+    """
+    Lista de cuerpos crudos (bytes). Si `directorio` tiene .json grabados
+    los usa; si no, genera `paginas` páginas sintéticas de 50 productos.
+    """
+    if directorio:
+        archivos = sorted(Path(directorio).glob("*.json"))
+        if archivos:
+            return [a.read_bytes() for a in archivos]
+    return [json.dumps(pagina_sintetica(i * 50)).encode() for i in range(paginas)]
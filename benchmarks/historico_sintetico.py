@@ -0,0 +1,134 @@
+"""
+historico_sintetico.py
+======================
+Histórico de precios sintético para medir el analizador sin datos
+reales: un catálogo que rota (productos que entran y salen), días sin
+scraping, cambios de precio diarios con inflación de fondo y promociones.
+Con --errores, además errores de scraping sueltos (precio de $1, coma
+corrida ×100 o ÷100) para probar anomalias_precios.
+
+Escribe, relativo al directorio actual:
+- data/hist/ (dimensión + una partición por fecha, ver historico_precios)
+- opcional data/precios_compacto.csv (formato CSV anterior)
+- opcional la salida del scraper de hoy en output_carrefour/
+
+Uso:
+    python benchmarks/historico_sintetico.py /tmp/hist1y --dias 365 --productos 20000 --csv
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import historico_precios  # noqa: E402
+from analizar_precios_carrefour import ORDEN_CATS  # noqa: E402
+
+TASA_SIN_SCRAPING = 0.05   # días sin corrida
+TASA_CAMBIO       = 0.03   # productos que cambian de precio por día
+TASA_FALTANTE     = 0.04   # productos que un día no aparecen
+TASA_PROMO        = 0.10   # productos con precio_actual < precio_regular
+ROTACION          = 0.25   # fracción del catálogo que entra o sale en el período
+ERRORES           = [1 / 100, 100]   # factores de la coma corrida
+
+
+def catalogo(productos, dias, rng):
+    """Metadata y vida (día de alta/baja) de cada producto."""
+    n = int(productos * (1 + ROTACION))
+    ids = np.arange(100_000, 100_000 + n).astype(str)
+    meta = pd.DataFrame({
+        "product_id":    ids,
+        "sku_id":        ids,
+        "ean":           np.char.add("779", np.char.zfill(ids, 10)),
+        "nombre":        np.char.add("Producto sintético ", ids),
+        "marca":         rng.choice(["Carrefour", "Arcor", "Molinos", "Unilever", "Quilmes"], n),
+        "categoria":     rng.choice([f"Subcategoría {i}" for i in range(60)], n),
+        "cat_principal": rng.choice(ORDEN_CATS, n),
+    })
+    alta = np.where(rng.random(n) < ROTACION, rng.integers(0, dias, n), 0)
+    baja = np.where(rng.random(n) < ROTACION, rng.integers(0, dias, n), dias)
+    return meta, alta, np.maximum(baja, alta + 1)
+
+
+def generar(dias=365, productos=20_000, semilla=0, csv=False, salida_hoy=False, hoy=None,
+            errores=0.0):
+    """
+    Genera el histórico de los `dias` anteriores a `hoy`, con una fracción
+    `errores` de filas por día mal scrapeadas. Devuelve filas escritas.
+    """
+    rng = np.random.default_rng(semilla)
+    hoy = hoy or datetime.now()
+    meta, alta, baja = catalogo(productos, dias, rng)
+    n = len(meta)
+    claves = historico_precios.actualizar_productos(meta).reindex(meta["product_id"]).to_numpy()
+    precio = np.round(rng.lognormal(7.5, 0.8, n), 2)
+
+    filas = 0
+    partes_csv = []
+    for d in range(dias + 1):
+        fecha = hoy - timedelta(days=dias - d)
+        cambia = rng.random(n) < TASA_CAMBIO
+        precio = np.where(cambia, np.round(precio * rng.uniform(0.95, 1.12, n), 2), precio)
+        promo = np.where(rng.random(n) < TASA_PROMO, np.round(rng.uniform(0.7, 0.95, n), 2), 1.0)
+        actual = np.round(precio * promo, 2)
+        regular = precio
+        if errores:
+            error = rng.random(n) < errores
+            factor = rng.choice(ERRORES + [0.0], n)   # 0: precio de $1
+            regular = np.where(error, np.where(factor > 0, np.round(precio * factor, 2), 1.0),
+                               precio)
+            actual = np.where(error, regular, actual)
+        if d == dias or rng.random() < TASA_SIN_SCRAPING:
+            continue   # el último paso es hoy: sólo va a la salida del scraper
+        vivos = (alta <= d) & (d < baja) & (rng.random(n) >= TASA_FALTANTE)
+        fecha_str = fecha.strftime("%Y%m%d")
+        historico_precios.escribir_hechos(fecha_str, claves[vivos], actual[vivos], regular[vivos])
+        filas += int(vivos.sum())
+        if csv:
+            partes_csv.append(meta[vivos].assign(precio_actual=actual[vivos],
+                                                 precio_regular=regular[vivos],
+                                                 fecha=fecha_str))
+
+    if csv:
+        pd.concat(partes_csv, ignore_index=True).to_csv(historico_precios.PRECIOS_COMPACTO,
+                                                       index=False)
+    if salida_hoy:
+        vivos = (alta <= dias) & (baja >= dias)   # baja == dias: sigue en el catálogo
+        os.makedirs("output_carrefour", exist_ok=True)
+        meta[vivos].assign(fecha=hoy.strftime("%Y-%m-%d"), precio_actual=actual[vivos],
+                           precio_regular=regular[vivos], disponible=1,
+                           link="https://www.carrefour.com.ar/p").to_csv(
+            f"output_carrefour/carrefour_{hoy:%Y%m%d}_090000.csv", index=False,
+            encoding="utf-8-sig")
+    return filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un histórico de precios sintético")
+    parser.add_argument("destino", type=Path)
+    parser.add_argument("--dias", type=int, default=365)
+    parser.add_argument("--productos", type=int, default=20_000)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--csv", action="store_true",
+                        help="también escribe data/precios_compacto.csv")
+    parser.add_argument("--salida-hoy", action="store_true",
+                        help="también escribe la salida del scraper de hoy")
+    parser.add_argument("--errores", type=float, default=0.0,
+                        help="fracción de filas por día con errores de scraping")
+    args = parser.parse_args()
+
+    args.destino.mkdir(parents=True, exist_ok=True)
+    os.chdir(args.destino)
+    filas = generar(args.dias, args.productos, args.semilla, args.csv, args.salida_hoy,
+                    errores=args.errores)
+    print(f"  {args.destino}: {filas} filas en {len(historico_precios.fechas_disponibles())} fechas")
+
+
+if __name__ == "__main__":
+    main()
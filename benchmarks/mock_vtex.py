@@ -0,0 +1,220 @@
+"""
+mock_vtex.py
+============
+Servidor VTEX local para medir el scraper sin pegarle a carrefour.com.ar.
+
+Sirve:
+- /api/catalog_system/pub/products/search   (fq / _from / _to, header resources)
+- /api/catalog_system/pub/category/tree/N   (árbol armado desde CATEGORIAS)
+- /__stats                                  (contadores, GET) y /__reset
+
+Cada categoría tiene una cantidad de productos determinística (algunas
+por encima de MAX_PRODS para ejercitar el sharding por precio) y acepta
+filtros P:[a TO b]. La latencia, la tasa de 429 y la de errores 5xx son
+configurables.
+
+Uso:
+    python benchmarks/mock_vtex.py --puerto 8765 --latencia-ms 80 --tasa-429 0.02
+    CARREBOT_BASE_URL=http://127.0.0.1:8765 python carrefour_scraper.py
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Lock, Thread
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from carrefour_scraper import CATEGORIAS, MAX_PRODS, PAGE_SIZE  # noqa: E402
+from datos_vtex import producto_sintetico  # noqa: E402
+
+RE_CATEGORIA = re.compile(r"C:/(\d+)/(\d+)/")
+RE_PRECIO    = re.compile(r"P:\[(\d+(?:\.\d+)?) TO (\d+(?:\.\d+)?)\]")
+
+
+class CatalogoSintetico:
+    """Productos por categoría, generados una vez y reutilizados."""
+
+    def __init__(self, categorias, escala=1.0, semilla=0):
+        self.categorias = categorias
+        self.semilla = semilla
+        self.lock = Lock()
+        self.productos = {}
+        rng = random.Random(semilla)
+        self.tamanios = {}
+        for _, _, p_id, c_id in categorias:
+            n = int(rng.lognormvariate(5.5, 1.0) * escala)
+            self.tamanios[(p_id, c_id)] = max(1, n)
+        # Un par de categorías grandes para forzar shards
+        for clave in list(self.tamanios)[:2]:
+            self.tamanios[clave] = int((MAX_PRODS + 1500) * escala) or 1
+
+    def de_categoria(self, p_id, c_id):
+        clave = (p_id, c_id)
+        with self.lock:
+            if clave not in self.productos:
+                rng = random.Random(hash((self.semilla, p_id, c_id)))
+                base = c_id * 100_000
+                prods = [producto_sintetico(base + i, rng)
+                         for i in range(self.tamanios.get(clave, 0))]
+                self.productos[clave] = [
+                    (p["items"][0]["sellers"][0]["commertialOffer"]["Price"], p) for p in prods]
+            return self.productos[clave]
+
+    def arbol(self):
+        deptos = {}
+        for _, nombre, p_id, c_id in self.categorias:
+            depto = deptos.setdefault(p_id, {"id": p_id, "name": f"Depto {p_id}",
+                                             "hasChildren": True, "children": []})
+            depto["children"].append({"id": c_id, "name": nombre,
+                                      "hasChildren": False, "children": []})
+        return list(deptos.values())
+
+
+class Estadisticas:
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.paginas = 0
+            self.throttles = 0
+            self.errores = 0
+            self.bytes = 0
+
+    def sumar(self, **kw):
+        with self.lock:
+            for k, v in kw.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def como_dict(self):
+        with self.lock:
+            return {"requests": self.requests, "paginas": self.paginas,
+                    "throttles": self.throttles, "errores": self.errores,
+                    "bytes": self.bytes}
+
+
+def crear_handler(catalogo, stats, latencia_ms, jitter_ms, tasa_429, tasa_error,
+                  retry_after):
+    rng = random.Random()
+    rng_lock = Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def responder(self, status, cuerpo=b"", headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/__stats":
+                return self.responder(200, json.dumps(stats.como_dict()).encode())
+            if url.path == "/__reset":
+                stats.reset()
+                return self.responder(200, b"{}")
+
+            stats.sumar(requests=1)
+            with rng_lock:
+                demora = max(0.0, rng.gauss(latencia_ms, jitter_ms)) / 1000
+                sorteo = rng.random()
+            time.sleep(demora)
+
+            if url.path.startswith("/api/catalog_system/pub/category/tree/"):
+                return self.responder(200, json.dumps(catalogo.arbol()).encode())
+            if url.path != "/api/catalog_system/pub/products/search":
+                return self.responder(404)
+
+            if sorteo < tasa_429:
+                stats.sumar(throttles=1)
+                return self.responder(429, headers={"Retry-After": str(retry_after)})
+            if sorteo < tasa_429 + tasa_error:
+                stats.sumar(errores=1)
+                return self.responder(503)
+
+            qs = parse_qs(url.query)
+            fqs = qs.get("fq", [])
+            desde = int(qs.get("_from", ["0"])[0])
+            hasta = int(qs.get("_to", [str(PAGE_SIZE - 1)])[0])
+            if hasta - desde + 1 > PAGE_SIZE or desde >= MAX_PRODS:
+                return self.responder(400, b'"_from/_to fuera de rango"')
+
+            prods = []
+            for fq in fqs:
+                m = RE_CATEGORIA.match(fq)
+                if m:
+                    prods = catalogo.de_categoria(int(m.group(1)), int(m.group(2)))
+            for fq in fqs:
+                m = RE_PRECIO.match(fq)
+                if m:
+                    lo, hi = float(m.group(1)), float(m.group(2))
+                    prods = [x for x in prods if lo <= x[0] <= hi]
+
+            pagina = [p for _, p in prods[desde:hasta + 1]]
+            cuerpo = json.dumps(pagina).encode()
+            stats.sumar(paginas=1, bytes=len(cuerpo))
+            self.responder(200, cuerpo,
+                           {"resources": f"{desde}-{hasta}/{len(prods)}"})
+
+    return Handler
+
+
+def iniciar(puerto=0, categorias=None, escala=1.0, latencia_ms=50.0, jitter_ms=15.0,
+            tasa_429=0.0, tasa_error=0.0, retry_after=1):
+    """
+    Levanta el servidor en un thread. Devuelve (servidor, url_base, stats).
+    Con puerto=0 elige uno libre.
+    """
+    catalogo = CatalogoSintetico(categorias or CATEGORIAS, escala)
+    stats = Estadisticas()
+    handler = crear_handler(catalogo, stats, latencia_ms, jitter_ms, tasa_429,
+                            tasa_error, retry_after)
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), handler)
+    servidor.daemon_threads = True
+    Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}", stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor VTEX local para benchmarks")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--categorias", type=int, default=len(CATEGORIAS),
+                        help="cuántas categorías de CATEGORIAS servir")
+    parser.add_argument("--escala", type=float, default=1.0,
+                        help="multiplica la cantidad de productos por categoría")
+    parser.add_argument("--latencia-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=15.0)
+    parser.add_argument("--tasa-429", type=float, default=0.0)
+    parser.add_argument("--tasa-error", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    servidor, url, _ = iniciar(args.puerto, CATEGORIAS[:args.categorias], args.escala,
+                               args.latencia_ms, args.jitter_ms, args.tasa_429,
+                               args.tasa_error, args.retry_after)
+    print(f"Mock VTEX escuchando en {url} (Ctrl+C para salir)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
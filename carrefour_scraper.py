@@ -1,19 +1,59 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
 import requests
-import pandas as pd
+import unicodedata
+import zlib
 import time
 from datetime import datetime
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from threading import Lock
 
+from metricas_scraper import Metricas, guardar_reporte
+from salida_scraper import COLUMNAS, FORMATOS, crear_escritor, formato_de, leer_filas, pa
+
+try:
+    import orjson
+    cargar_json = orjson.loads
+except ImportError:
+    cargar_json = json.loads
+
 # ── CONFIGURACIÓN ─────────────────────────────────────────────────────────────
-BASE_URL   = "https://www.carrefour.com.ar"
+BASE_URL   = os.environ.get("CARREBOT_BASE_URL", "https://www.carrefour.com.ar")
 PAGE_SIZE  = 50
-MAX_PRODS  = 2500
-MAX_WORKERS = 10     # requests concurrentes
+MAX_PRODS  = 2500     # ventana máxima de _from que pagina VTEX
+PRECIO_TOPE = 10_000_000   # rango de precio inicial al partir categorías grandes
+FQ_SEP     = "|"      # separa los filtros fq de un shard (se mandan repetidos)
+MAX_WORKERS = 10     # requests concurrentes (presupuesto global)
+ENGINES    = ("async", "threads")
+SHARD      = (1, 1)   # (k, n): este proceso baja la porción k de n (--shard k/n)
 OUTPUT_DIR = Path("output_carrefour")
+DIR_PARCIALES = OUTPUT_DIR / "parciales"
+CACHE_CATEGORIAS = Path("data") / "categorias_cache.json"
+CACHE_TTL_HORAS  = 24 * 7
+ULTIMO_REPORTE   = Path("data") / "scraper_reporte.json"   # base de comparación
+PROM_TEXTFILE    = OUTPUT_DIR / "carrebot_scraper.prom"
+
+# ── RATE LIMIT (AIMD) ─────────────────────────────────────────────────────────
+TASA_INICIAL   = 8.0    # requests/segundo al arrancar
+TASA_MIN       = 0.5
+TASA_MAX       = 40.0
+AIMD_INCREMENTO = 1.0   # +req/s por cada "ventana" de respuestas OK
+AIMD_FACTOR     = 0.5   # tasa *= factor ante 429/5xx
+MAX_INTENTOS   = 8
+MAX_ESPERA     = 120.0  # segundos: tope de la pausa por Retry-After
+STATUS_REINTENTO = {429, 500, 502, 503, 504}
+
+# Cada fila que devuelve parsear_productos es una tupla en el orden de COLUMNAS
+COL_SKU  = COLUMNAS.index("sku_id")
+FECHA_CORRIDA = datetime.now().strftime("%Y-%m-%d")
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
@@ -23,7 +63,9 @@ HEADERS = {
     "Connection": "keep-alive",
 }
 
-# ── TODAS LAS CATEGORÍAS (74) ─────────────────────────────────────────────────
+# ── CATEGORÍAS CONOCIDAS (74) ─────────────────────────────────────────────────
+# Se usan para nombrar/agrupar los nodos del árbol VTEX que coinciden por id
+# y como lista de respaldo si el descubrimiento falla.
 CATEGORIAS = [
     ("Almacén", "Aceites y vinagres", 161, 162), ("Almacén", "Pastas secas", 161, 168),
     ("Almacén", "Arroz y legumbres", 161, 172), ("Almacén", "Harinas", 161, 176),
@@ -65,130 +107,805 @@ CATEGORIAS = [
 ]
 
 
+# ── MAPEO DEPARTAMENTO VTEX → cat_principal ───────────────────────────────────
+# Para nodos del árbol que no están en CATEGORIAS (ids nuevos o renumerados)
+# se busca cada palabra clave en el nombre normalizado del departamento.
+MAPA_DEPARTAMENTOS = [
+    ("almacen",         "Almacén"),
+    ("desayuno",        "Almacén"),
+    ("bebidas",         "Bebidas"),          # se separa por subcategoría
+    ("lacteo",          "Frescos"),
+    ("frescos",         "Frescos"),
+    ("carnes",          "Frescos"),
+    ("frutas",          "Frescos"),
+    ("congelados",      "Congelados"),
+    ("limpieza",        "Limpieza"),
+    ("perfumeria",      "Cuidado Personal"),
+    ("cuidado personal", "Cuidado Personal"),
+    ("bebe",            "Cuidado Personal"),
+]
+PALABRAS_ALCOHOL = ("cerveza", "vino", "fernet", "aperitivo", "blancas",
+                    "espumante", "sidra", "whisk", "licor", "vodka")
+
+
+class LimitadorAIMD:
+    """
+    Token bucket compartido por todos los fetch_page (thread-safe).
+
+    La tasa sube de a poco mientras las respuestas son OK (aumento aditivo)
+    y se corta a la mitad apenas aparece un 429/5xx (disminución
+    multiplicativa), así todos los workers frenan juntos. Un Retry-After
+    pausa a todos hasta la fecha indicada, con un tope de MAX_ESPERA
+    segundos para no pasarse del timeout del workflow.
+    """
+
+    def __init__(self, tasa=TASA_INICIAL, tasa_min=TASA_MIN, tasa_max=TASA_MAX,
+                 incremento=AIMD_INCREMENTO, factor=AIMD_FACTOR):
+        self.tasa       = tasa
+        self.tasa_min   = tasa_min
+        self.tasa_max   = tasa_max
+        self.incremento = incremento
+        self.factor     = factor
+        self.lock       = Lock()
+        self.tokens     = 1.0
+        self.ultimo     = time.monotonic()
+        self.pausa_hasta   = 0.0
+        self.ultimo_recorte = 0.0
+        self.inicio     = time.monotonic()
+        self.requests   = 0
+        self.throttles  = 0
+
+    def adquirir(self):
+        """Bloquea hasta que haya un token disponible."""
+        while True:
+            with self.lock:
+                ahora = time.monotonic()
+                if ahora < self.pausa_hasta:
+                    espera = self.pausa_hasta - ahora
+                else:
+                    burst = max(1.0, self.tasa)
+                    self.tokens = min(burst, self.tokens + (ahora - self.ultimo) * self.tasa)
+                    self.ultimo = ahora
+                    if self.tokens >= 1.0:
+                        self.tokens -= 1.0
+                        self.requests += 1
+                        return
+                    espera = (1.0 - self.tokens) / self.tasa
+            time.sleep(espera)
+
+    def exito(self):
+        with self.lock:
+            self.tasa = min(self.tasa_max, self.tasa + self.incremento / self.tasa)
+
+    def penalizar(self, retry_after=None):
+        """
+        Registra un throttle: recorta la tasa y respeta Retry-After hasta
+        MAX_ESPERA. Devuelve True si el servidor pidió esperar más que eso.
+        """
+        with self.lock:
+            ahora = time.monotonic()
+            self.throttles += 1
+            # Las respuestas de una misma ráfaga cuentan como un solo recorte
+            if ahora - self.ultimo_recorte >= 1.0 / self.tasa:
+                self.tasa = max(self.tasa_min, self.tasa * self.factor)
+                self.tokens = min(self.tokens, 0.0)
+                self.ultimo_recorte = ahora
+            segundos = parse_retry_after(retry_after)
+            if segundos:
+                self.pausa_hasta = max(self.pausa_hasta, ahora + min(segundos, MAX_ESPERA))
+            return segundos > MAX_ESPERA
+
+    def tasa_efectiva(self):
+        transcurrido = time.monotonic() - self.inicio
+        return self.requests / transcurrido if transcurrido > 0 else 0.0
+
+    def resumen(self):
+        return (f"{self.requests} requests | {self.tasa_efectiva():.1f} req/s efectivos | "
+                f"tasa final {self.tasa:.1f} req/s | {self.throttles} throttles")
+
+
+def parse_retry_after(valor):
+    """Retry-After en segundos, ya sea numérico o fecha HTTP."""
+    if not valor:
+        return 0.0
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        fecha = parsedate_to_datetime(valor)
+        return max(0.0, fecha.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+limitador = LimitadorAIMD()
+metricas  = Metricas()
+
+
 def crear_sesion():
     session = requests.Session()
+    # Sólo errores de conexión: los 429/5xx los maneja el limitador
     retry_strategy = Retry(
-        total=10,
-        backoff_factor=3,
-        status_forcelist=[429, 500, 502, 503, 504],
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[],
     )
-    session.mount("https://", HTTPAdapter(max_retries=retry_strategy))
+    adapter = HTTPAdapter(max_retries=retry_strategy,
+                          pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)     # servidor local de benchmarks
     return session
 
 
+def parsear_productos(contenido, cat_nombre, cat_principal, fecha=FECHA_CORRIDA):
+    """
+    Convierte la respuesta cruda de products/search en filas (tuplas en el
+    orden de COLUMNAS), leyendo sólo los campos que se guardan.
+    """
+    filas = []
+    agregar = filas.append
+    for p in cargar_json(contenido):
+        items = p.get("items")
+        if not items:
+            continue
+        product_id = p.get("productId", "")
+        nombre_p   = p.get("productName", "")
+        marca      = p.get("brand", "")
+        link       = p.get("link", "")
+        for sku in items:
+            sellers = sku.get("sellers")
+            if not sellers:
+                continue
+            offer = sellers[0].get("commertialOffer") or {}
+            agregar((fecha, product_id, sku.get("itemId", ""), sku.get("ean", ""),
+                     sku.get("nameComplete") or nombre_p, marca, cat_nombre,
+                     offer.get("Price"), offer.get("ListPrice"),
+                     offer.get("AvailableQuantity", 0), link, cat_principal))
+    return filas
+
+
+def buscar(session, fq, from_idx, to_idx, cat_nombre):
+    """
+    GET a products/search pasando por el limitador: reintenta los 429/5xx
+    y levanta si no hay respuesta OK.
+    """
+    url = f"{BASE_URL}/api/catalog_system/pub/products/search"
+    for _ in range(MAX_INTENTOS):
+        limitador.adquirir()
+        t0 = time.perf_counter()
+        r = session.get(url, params={"fq": fq.split(FQ_SEP), "_from": from_idx, "_to": to_idx},
+                        headers=HEADERS, timeout=30)
+        metricas.request(cat_nombre, r.status_code, time.perf_counter() - t0, len(r.content))
+        if r.status_code not in STATUS_REINTENTO:
+            break
+        metricas.reintento(cat_nombre)
+        if limitador.penalizar(r.headers.get("Retry-After")):
+            # Queda como fallida en el journal: la baja --resume
+            raise RuntimeError(f"Retry-After {r.headers['Retry-After']} "
+                               f"(más de {MAX_ESPERA:.0f}s)")
+    r.raise_for_status()
+    limitador.exito()
+    return r
+
+
+def total_resources(r):
+    """Total de productos del fq según el header resources ("0-49/1234")."""
+    res = r.headers.get("resources", "")
+    return int(res.split("/")[-1]) if "/" in res else 0
+
+
 def fetch_page(args):
     """Descarga una página y devuelve los SKUs extraídos."""
     session, fq, from_idx, cat_nombre, cat_principal = args
-    url = f"{BASE_URL}/api/catalog_system/pub/products/search"
-    to_idx = from_idx + PAGE_SIZE - 1
-
     try:
-        r = session.get(url, params={"fq": fq, "_from": from_idx, "_to": to_idx},
-                        headers=HEADERS, timeout=30)
-        r.raise_for_status()
-
-        total_vtex = 0
-        res = r.headers.get("resources", "")
-        if "/" in res:
-            total_vtex = int(res.split("/")[-1])
-
-        skus = []
-        for p in r.json():
-            for sku in p.get("items", []):
-                sellers = sku.get("sellers", [])
-                if not sellers:
-                    continue
-                offer = sellers[0].get("commertialOffer", {})
-                skus.append({
-                    "fecha":          datetime.now().strftime("%Y-%m-%d"),
-                    "product_id":     p.get("productId", ""),
-                    "sku_id":         sku.get("itemId", ""),
-                    "ean":            sku.get("ean", ""),
-                    "nombre":         sku.get("nameComplete") or p.get("productName", ""),
-                    "marca":          p.get("brand", ""),
-                    "categoria":      cat_nombre,
-                    "precio_actual":  offer.get("Price"),
-                    "precio_regular": offer.get("ListPrice"),
-                    "disponible":     offer.get("AvailableQuantity", 0),
-                    "link":           p.get("link", ""),
-                    "cat_principal":  cat_principal,
-                })
+        r = buscar(session, fq, from_idx, from_idx + PAGE_SIZE - 1, cat_nombre)
+        total_vtex = total_resources(r)
+        skus = parsear_productos(r.content, cat_nombre, cat_principal)
+        metricas.pagina(cat_nombre, ok=True)
         return skus, total_vtex, None
 
     except Exception as e:
+        metricas.pagina(cat_nombre, ok=False, error=type(e).__name__)
         return [], 0, str(e)
 
 
-def get_productos_categoria(parent_id, child_id, cat_nombre, cat_principal, session):
-    fq = f"C:/{parent_id}/{child_id}/"
+# ── DESCUBRIMIENTO DE CATEGORÍAS ──────────────────────────────────────────────
+def normalizar(texto):
+    sin_tildes = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode()
+    return sin_tildes.lower()
 
-    # ── Página 0: obtener total real ──────────────────────────────────────────
-    skus_p0, total_vtex, err = fetch_page((session, fq, 0, cat_nombre, cat_principal))
-    if err:
-        print(f" [Error inicial en {cat_nombre}]: {err}")
-        return [], 0
-    if not skus_p0:
-        return [], total_vtex
 
-    # ── Páginas restantes en paralelo ─────────────────────────────────────────
-    limit = min(total_vtex, MAX_PRODS)
-    offsets = list(range(PAGE_SIZE, limit, PAGE_SIZE))
+def mapear_cat_principal(depto, subcat):
+    """cat_principal para un nodo (departamento, subcategoría), o None."""
+    nombre_depto = normalizar(depto)
+    for clave, cat_principal in MAPA_DEPARTAMENTOS:
+        if clave in nombre_depto:
+            break
+    else:
+        return None
+    if cat_principal == "Bebidas":
+        con_alcohol = any(p in normalizar(subcat) for p in PALABRAS_ALCOHOL)
+        return "Bebidas Con Alcohol" if con_alcohol else "Bebidas Sin Alcohol"
+    return cat_principal
+
+
+def contar_productos(session, fq, cat_nombre):
+    """
+    Total de productos de un fq (pide 1 solo ítem, con los mismos
+    reintentos que las páginas), o None si no se pudo contar.
+    """
+    try:
+        return total_resources(buscar(session, fq, 0, 0, cat_nombre))
+    except Exception:
+        return None
+
+
+def descubrir_categorias(session):
+    """
+    Lee el árbol de categorías VTEX (departamento → subcategoría), arma la
+    lista de trabajo y cuenta los productos de cada nodo.
+    """
+    r = session.get(f"{BASE_URL}/api/catalog_system/pub/category/tree/2",
+                    headers=HEADERS, timeout=30)
+    r.raise_for_status()
+
+    conocidas = {(p_id, c_id): (cat_principal, nombre)
+                 for cat_principal, nombre, p_id, c_id in CATEGORIAS}
+    nodos, sin_mapear = [], []
+    for depto in r.json():
+        for sub in depto.get("children", []):
+            clave = (depto["id"], sub["id"])
+            if clave in conocidas:
+                cat_principal, nombre = conocidas[clave]
+            else:
+                cat_principal = mapear_cat_principal(depto["name"], sub["name"])
+                nombre = sub["name"]
+            if cat_principal is None:
+                sin_mapear.append(f"{depto['name']} > {sub['name']}")
+                continue
+            nodos.append({"cat_principal": cat_principal, "nombre": nombre,
+                          "parent_id": depto["id"], "child_id": sub["id"]})
+
+    def contar(nodo):
+        return contar_productos(session, f"C:/{nodo['parent_id']}/{nodo['child_id']}/",
+                                nodo["nombre"])
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        for nodo, n in zip(nodos, ex.map(contar, nodos)):
+            if n is not None:   # sin conteo: no se cachea un 0
+                nodo["productos"] = n
+
+    return {"generado": datetime.now().isoformat(timespec="seconds"),
+            "categorias": nodos, "sin_mapear": sin_mapear}
+
+
+def cargar_categorias(session, refrescar=False):
+    """
+    Lista de trabajo (cat_principal, nombre, parent_id, child_id) ordenada de
+    mayor a menor cantidad de productos, así las categorías grandes arrancan
+    primero. Usa el cache en disco mientras no venza CACHE_TTL_HORAS (sólo
+    se guarda si se pudieron contar todas) y cae en CATEGORIAS si el árbol
+    no se puede leer.
+    """
+    cache = None
+    if CACHE_CATEGORIAS.exists() and not refrescar:
+        with open(CACHE_CATEGORIAS, encoding="utf-8") as f:
+            cache = json.load(f)
+        edad = datetime.now() - datetime.fromisoformat(cache["generado"])
+        if edad.total_seconds() > CACHE_TTL_HORAS * 3600:
+            cache = None
+
+    if cache is None:
+        try:
+            cache = descubrir_categorias(session)
+        except Exception as e:
+            print(f" [Aviso] No se pudo leer el árbol de categorías ({e}); "
+                  f"uso la lista fija")
+            return list(CATEGORIAS), "lista fija"
+        if not cache["categorias"]:
+            print(" [Aviso] Árbol de categorías vacío; uso la lista fija")
+            return list(CATEGORIAS), "lista fija"
+        sin_conteo = sum("productos" not in n for n in cache["categorias"])
+        if sin_conteo:
+            print(f" [Aviso] {sin_conteo} categorías sin conteo; no se guarda el cache")
+        else:
+            CACHE_CATEGORIAS.parent.mkdir(parents=True, exist_ok=True)
+            with open(CACHE_CATEGORIAS, "w", encoding="utf-8") as f:
+                json.dump(cache, f, ensure_ascii=False, indent=2)
+        origen = "árbol VTEX"
+    else:
+        origen = f"cache {cache['generado']}"
+
+    nodos = sorted(cache["categorias"], key=lambda n: n.get("productos", 0), reverse=True)
+    return [(n["cat_principal"], n["nombre"], n["parent_id"], n["child_id"])
+            for n in nodos], origen
+
+
+def dividir_fq(fq):
+    """
+    Parte un fq en dos shards por rango de precio (P:[a TO b]), cortando en
+    la media geométrica del rango. Los bordes se solapan para no perder
+    productos justo en el corte; los duplicados se filtran por sku_id.
+    Devuelve None si el rango ya no se puede partir.
+    """
+    base, _, rango = fq.partition(FQ_SEP)
+    m = re.match(r"P:\[(\d+) TO (\d+)\]", rango)
+    lo, hi = (int(m.group(1)), int(m.group(2))) if m else (0, PRECIO_TOPE)
+    if hi - lo <= 1:
+        return None
+    mid = min(max(int(math.sqrt(max(lo, 1) * hi)), lo + 1), hi - 1)
+    return [f"{base}{FQ_SEP}P:[{lo} TO {mid}]", f"{base}{FQ_SEP}P:[{mid} TO {hi}]"]
+
+
+def shards_necesarios(fq, total_vtex, cat_nombre):
+    """Shards en los que hay que partir fq, o None si entra en MAX_PRODS."""
+    if total_vtex <= MAX_PRODS:
+        return None
+    shards = dividir_fq(fq)
+    if shards is None:
+        print(f" [Aviso {cat_nombre}]: {fq} tiene {total_vtex} productos y no se puede "
+              f"partir más; se bajan sólo {MAX_PRODS}")
+    return shards
+
+
+def pagina_asignada(fq, from_idx):
+    """
+    True si la página (fq, from) le toca a este proceso según SHARD. El
+    reparto es un hash estable, así cualquier runner calcula el mismo.
+    """
+    k, n = SHARD
+    return n == 1 or zlib.crc32(f"{fq}#{from_idx}".encode()) % n == k - 1
 
-    if not offsets:
-        return skus_p0, total_vtex
 
-    all_skus = list(skus_p0)
-    page_args = [(session, fq, off, cat_nombre, cat_principal) for off in offsets]
+def filtrar_vistos(skus, vistos):
+    """Descarta SKUs ya escritos en la categoría (shards solapados)."""
+    nuevos = [s for s in skus if s[COL_SKU] not in vistos]
+    vistos.update(s[COL_SKU] for s in nuevos)
+    return nuevos
+
+
+def get_productos_categoria(parent_id, child_id, cat_nombre, cat_principal, session,
+                            escritor, journal):
+    """
+    Engine threads: baja una categoría y escribe cada página al terminar.
+    Si el total supera MAX_PRODS la parte en shards por precio hasta que
+    cada uno entre en la ventana de paginado.
+    """
+    n_skus = 0
+    vistos = set()
+    hojas  = []   # (fq, total) de los shards que entran en MAX_PRODS
+
+    # ── Página 0 de cada shard: total real y, si hace falta, partir ───────────
+    pendientes = [f"C:/{parent_id}/{child_id}/"]
+    while pendientes:
+        fq = pendientes.pop()
+        total_vtex = journal.total(fq)
+        skus_p0 = None   # None: página 0 ya estaba en el journal
+        if total_vtex is None:
+            skus_p0, total_vtex, err = fetch_page((session, fq, 0, cat_nombre, cat_principal))
+            if err:
+                print(f" [Error inicial en {cat_nombre}]: {err}")
+                escritor.fallo(fq, 0, err)
+                continue
+        shards = shards_necesarios(fq, total_vtex, cat_nombre)
+        if shards:
+            if skus_p0 is not None:
+                escritor.escribir([], fq, 0, total_vtex)
+            pendientes.extend(shards)
+            continue
+        if skus_p0 is not None:
+            ajena = not pagina_asignada(fq, 0)
+            skus_p0 = [] if ajena else filtrar_vistos(skus_p0, vistos)
+            escritor.escribir(skus_p0, fq, 0, total_vtex, ajena=ajena)
+            n_skus += len(skus_p0)
+        hojas.append((fq, total_vtex))
+
+    # ── Páginas restantes de todos los shards en paralelo ─────────────────────
+    page_args = [(session, fq, off, cat_nombre, cat_principal)
+                 for fq, total in hojas
+                 for off in offsets_restantes(total)
+                 if pagina_asignada(fq, off) and not journal.completa(fq, off)]
+
+    if not page_args:
+        return n_skus, sum(t for _, t in hojas)
 
     with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
-        futures = {ex.submit(fetch_page, args): args[2] for args in page_args}
+        futures = {ex.submit(fetch_page, args): args for args in page_args}
         for future in as_completed(futures):
             skus, _, err = future.result()
+            _, fq, off, _, _ = futures[future]
             if err:
-                print(f" [Error offset {futures[future]} en {cat_nombre}]: {err}")
+                print(f" [Error offset {off} en {cat_nombre}]: {err}")
+                escritor.fallo(fq, off, err)
             else:
-                all_skus.extend(skus)
+                skus = filtrar_vistos(skus, vistos)
+                escritor.escribir(skus, fq, off, dict(hojas)[fq])
+                n_skus += len(skus)
 
-    return all_skus, total_vtex
+    return n_skus, sum(t for _, t in hojas)
 
 
-def main():
-    OUTPUT_DIR.mkdir(exist_ok=True)
-    timestamp    = datetime.now().strftime("%Y%m%d_%H%M%S")
-    csv_filename = OUTPUT_DIR / f"carrefour_{timestamp}.csv"
-    csv_lock     = Lock()
+def offsets_restantes(total_vtex):
+    """Offsets de las páginas posteriores a la 0 para una categoría."""
+    limit = min(total_vtex, MAX_PRODS)
+    return list(range(PAGE_SIZE, limit, PAGE_SIZE))
 
-    session    = crear_sesion()
-    total_cats = len(CATEGORIAS)
-    acumulado_skus = 0
+
+# ── JOURNAL DE PÁGINAS ────────────────────────────────────────────────────────
+def ruta_journal(salida):
+    return salida.with_suffix(".journal.jsonl")
+
+
+def ruta_output(timestamp, formato):
+    k, n = SHARD
+    ext = "parquet" if formato == "parquet" else "csv"
+    if n == 1:
+        return OUTPUT_DIR / f"carrefour_{timestamp}.{ext}"
+    return DIR_PARCIALES / f"carrefour_{timestamp}_shard{k}de{n}.{ext}"
+
+
+def ultimo_output(formato="parquet"):
+    """
+    Salida más reciente (de este shard) que tenga journal (para --resume).
+    Si la corrida se cortó antes de escribir filas sólo está el journal:
+    la salida es la que exista al lado, o una nueva en `formato`.
+    """
+    k, n = SHARD
+    sufijo = "" if n == 1 else f"_shard{k}de{n}"
+    directorio = OUTPUT_DIR if n == 1 else DIR_PARCIALES
+    journals = sorted(directorio.glob(f"carrefour_*{sufijo}.journal.jsonl"))
+    if not journals:
+        return None
+    base = journals[-1].name[:-len(".journal.jsonl")]
+    existentes = [directorio / f"{base}.{ext}" for ext in FORMATOS
+                  if (directorio / f"{base}.{ext}").exists()]
+    return existentes[0] if existentes else directorio / f"{base}.{formato}"
+
+
+class Journal:
+    """
+    Registro append-only de las páginas (fq, from) bajadas o fallidas,
+    guardado al lado de la salida. Permite retomar una corrida con
+    --resume pidiendo sólo lo que falta.
+    """
+
+    def __init__(self, ruta):
+        self.ruta    = ruta
+        self.ok      = set()
+        self.errores = {}
+        self.totales = {}
+        if ruta.exists():
+            with open(ruta, encoding="utf-8") as f:
+                for linea in f:
+                    try:
+                        self._aplicar(json.loads(linea))
+                    except ValueError:
+                        continue   # última línea cortada por un crash
+        self.archivo = open(ruta, "a", encoding="utf-8")
+
+    def _aplicar(self, e):
+        clave = (e["fq"], e["from"])
+        if e.get("ok"):
+            self.ok.add(clave)
+            self.errores.pop(clave, None)
+            self.totales[e["fq"]] = e.get("total", 0)
+        else:
+            self.errores[clave] = e.get("error", "")
+
+    def registrar(self, fq, from_idx, total=None, error=None, ajena=False):
+        e = {"fq": fq, "from": from_idx, "ok": error is None}
+        if error is None:
+            e["total"] = total
+            if ajena:
+                e["ajena"] = True   # página 0 leída sólo por el total (otro shard)
+        else:
+            e["error"] = error
+        self._aplicar(e)
+        self.archivo.write(json.dumps(e, ensure_ascii=False) + "\n")
+        self.archivo.flush()
+
+    def completa(self, fq, from_idx):
+        return (fq, from_idx) in self.ok
+
+    def total(self, fq):
+        """Total VTEX de la categoría si su página 0 ya está bajada."""
+        return self.totales.get(fq) if self.completa(fq, 0) else None
+
+    def cerrar(self):
+        self.archivo.close()
+
+
+# ── COMBINAR SALIDAS DE VARIOS SHARDS ─────────────────────────────────────────
+RE_PARCIAL = re.compile(r"_shard(\d+)de(\d+)\.(csv|parquet)$")
+
+
+def paginas_esperadas(totales):
+    """Páginas (fq, from) que una corrida completa tiene que haber bajado."""
+    esperadas = set()
+    for fq, total in totales.items():
+        if total > MAX_PRODS and dividir_fq(fq):
+            continue   # se bajó por sus shards de precio
+        esperadas.add((fq, 0))
+        esperadas.update((fq, off) for off in offsets_restantes(total))
+    return esperadas
+
+
+def combinar_parciales(parciales, destino):
+    """
+    Une las salidas parciales de `--shard k/n` en `destino`, sin repetir
+    sku_id, y verifica con sus journals que no falte ninguna página.
+    Devuelve (filas escritas, páginas faltantes).
+    """
+    cubiertas, totales, fallidas = set(), {}, set()
+    shards_vistos, n_shards = set(), set()
+    for parcial in parciales:
+        m = RE_PARCIAL.search(parcial.name)
+        if m:
+            shards_vistos.add(int(m.group(1)))
+            n_shards.add(int(m.group(2)))
+        with open(ruta_journal(parcial), encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    e = json.loads(linea)
+                except ValueError:
+                    continue
+                clave = (e["fq"], e["from"])
+                if not e.get("ok"):
+                    fallidas.add(clave)
+                    continue
+                totales[e["fq"]] = e.get("total", 0)
+                if not e.get("ajena"):
+                    cubiertas.add(clave)
+    for clave in fallidas:
+        if clave[1] == 0 and clave[0] not in totales:
+            totales.setdefault(clave[0], 0)   # ni el total se pudo leer
+
+    if len(n_shards) > 1:
+        print(f" ATENCIÓN: parciales de distintos repartos ({sorted(n_shards)})")
+    for n in n_shards:
+        ausentes = sorted(set(range(1, n + 1)) - shards_vistos)
+        if ausentes:
+            print(f" ATENCIÓN: faltan los shards {ausentes} de {n}")
+
+    vistos = set()
+    escritor = crear_escritor(destino)
+    for parcial in parciales:
+        if not parcial.exists():
+            continue
+        for lote in leer_filas(parcial):
+            nuevas = [f for f in lote if f[COL_SKU] not in vistos]
+            vistos.update(f[COL_SKU] for f in nuevas)
+            escritor.escribir(nuevas)
+    escritor.cerrar()
+
+    faltantes = sorted(paginas_esperadas(totales) - cubiertas)
+    return escritor.filas, faltantes
+
+
+def main_merge(parciales):
+    parciales = [Path(p) for p in parciales]
+    sin_journal = [p for p in parciales if not ruta_journal(p).exists()]
+    if sin_journal:
+        print(f"ERROR: sin journal: {', '.join(map(str, sin_journal))}")
+        return
+    OUTPUT_DIR.mkdir(exist_ok=True)
+    formatos = {formato_de(p) for p in parciales}
+    if len(formatos) > 1:
+        print("ERROR: los parciales mezclan CSV y Parquet")
+        return
+    destino = ruta_output(datetime.now().strftime("%Y%m%d_%H%M%S"), formatos.pop())
+    filas, faltantes = combinar_parciales(parciales, destino)
 
     print(f"{'='*60}")
-    print(f" CARREBOT - SCRAPER COMPLETO (74 CATEGORÍAS)")
-    print(f" Inicia: {datetime.now().strftime('%H:%M:%S')}")
-    print(f"{'='*60}\n")
+    print(f" MERGE: {len(parciales)} parciales -> {destino}")
+    print(f" SKUs únicos: {filas}")
+    if faltantes:
+        print(f" ATENCIÓN: {len(faltantes)} páginas sin cubrir, p.ej.:")
+        for fq, off in faltantes[:10]:
+            print(f"   {fq} _from={off}")
+    else:
+        print(" Cobertura completa: todas las páginas esperadas están.")
+    print(f"{'='*60}")
 
-    for i, (cat_principal, cat_nombre, p_id, c_id) in enumerate(CATEGORIAS, 1):
+
+# ── ENGINE THREADS: una categoría por vez ─────────────────────────────────────
+def scrape_threads(categorias, session, escritor, journal):
+    total_cats = len(categorias)
+    for i, (cat_principal, cat_nombre, p_id, c_id) in enumerate(categorias, 1):
         print(f"[{i:02d}/{total_cats}] {cat_nombre.ljust(30)}", end=" ", flush=True)
+        t0 = time.perf_counter()
+
+        n_skus, total_web = get_productos_categoria(p_id, c_id, cat_nombre, cat_principal,
+                                                    session, escritor, journal)
+        metricas.fin_categoria(cat_nombre, cat_principal, time.perf_counter() - t0, n_skus)
+
+        if n_skus:
+            print(f"-> {n_skus} SKUs (Total: {escritor.filas})")
+        else:
+            print("-> SIN DATOS/ERROR")
+
+
+# ── ENGINE ASYNC: todas las categorías a la vez ───────────────────────────────
+async def scrape_async(categorias, session, escritor, journal):
+    """
+    Recorre todas las categorías en simultáneo con un único presupuesto de
+    MAX_WORKERS requests en vuelo (semáforo global). Cada página se parsea
+    con el mismo fetch_page y se escribe apenas termina.
+    """
+    loop    = asyncio.get_running_loop()
+    sem     = asyncio.Semaphore(MAX_WORKERS)
+    total_cats = len(categorias)
+    hechas  = 0
+
+    async def pagina(fq, from_idx, cat_nombre, cat_principal):
+        async with sem:
+            res = await loop.run_in_executor(
+                None, fetch_page, (session, fq, from_idx, cat_nombre, cat_principal))
+        return (from_idx,) + res
+
+    async def bajar_fq(fq, cat_nombre, cat_principal, vistos):
+        """Baja un fq (categoría o shard) y devuelve cuántos SKUs escribió."""
+        n_skus = 0
+        total_vtex = journal.total(fq)
+        skus_p0 = None   # None: página 0 ya estaba en el journal
+        if total_vtex is None:
+            _, skus_p0, total_vtex, err = await pagina(fq, 0, cat_nombre, cat_principal)
+            if err:
+                print(f" [Error inicial en {cat_nombre}]: {err}")
+                escritor.fallo(fq, 0, err)
+                return 0
+
+        shards = shards_necesarios(fq, total_vtex, cat_nombre)
+        if shards:
+            if skus_p0 is not None:
+                escritor.escribir([], fq, 0, total_vtex)
+            res = await asyncio.gather(*(bajar_fq(sh, cat_nombre, cat_principal, vistos)
+                                         for sh in shards))
+            return sum(res)
+
+        if skus_p0 is not None:
+            ajena = not pagina_asignada(fq, 0)
+            skus_p0 = [] if ajena else filtrar_vistos(skus_p0, vistos)
+            escritor.escribir(skus_p0, fq, 0, total_vtex, ajena=ajena)
+            n_skus += len(skus_p0)
+
+        tareas = [pagina(fq, off, cat_nombre, cat_principal)
+                  for off in offsets_restantes(total_vtex)
+                  if pagina_asignada(fq, off) and not journal.completa(fq, off)]
+        for tarea in asyncio.as_completed(tareas):
+            off, skus, _, err = await tarea
+            if err:
+                print(f" [Error offset {off} en {cat_nombre}]: {err}")
+                escritor.fallo(fq, off, err)
+                continue
+            skus = filtrar_vistos(skus, vistos)
+            escritor.escribir(skus, fq, off, total_vtex)
+            n_skus += len(skus)
+        return n_skus
+
+    async def categoria(cat_principal, cat_nombre, p_id, c_id):
+        nonlocal hechas
+        t0 = time.perf_counter()
+        n_skus = await bajar_fq(f"C:/{p_id}/{c_id}/", cat_nombre, cat_principal, set())
+        metricas.fin_categoria(cat_nombre, cat_principal, time.perf_counter() - t0, n_skus)
+
+        hechas += 1
+        estado = f"{n_skus} SKUs (Total: {escritor.filas})" if n_skus else "SIN DATOS/ERROR"
+        print(f"[{hechas:02d}/{total_cats}] {cat_nombre.ljust(30)} -> {estado}")
 
-        prods_cat, total_web = get_productos_categoria(p_id, c_id, cat_nombre, cat_principal, session)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        loop.set_default_executor(ex)
+        await asyncio.gather(*(categoria(*c) for c in categorias))
+
+
+def entero_positivo(valor):
+    n = int(valor)
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"tiene que ser 1 o más (se pasó {valor})")
+    return n
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scraper de precios Carrefour (VTEX)")
+    parser.add_argument("--engine", choices=ENGINES, default="async",
+                        help="async: todas las categorías en paralelo (default); "
+                             "threads: una categoría por vez (comparación)")
+    parser.add_argument("--formato", choices=FORMATOS, default="parquet",
+                        help="parquet: lotes tipados (default); csv: texto como antes")
+    parser.add_argument("--workers", type=entero_positivo, default=MAX_WORKERS,
+                        help=f"requests concurrentes (default: {MAX_WORKERS})")
+    parser.add_argument("--resume", nargs="?", const="ultimo", metavar="SALIDA",
+                        help="retoma una corrida: baja sólo las páginas faltantes o "
+                             "fallidas según el journal (default: el output más reciente)")
+    parser.add_argument("--shard", metavar="K/N",
+                        help="baja sólo la porción K de N del trabajo (páginas repartidas "
+                             "por hash) y escribe un parcial en output_carrefour/parciales")
+    parser.add_argument("--merge", nargs="+", metavar="PARCIAL",
+                        help="combina los parciales de --shard (CSV o Parquet) en un "
+                             "único output")
+    parser.add_argument("--refrescar-categorias", action="store_true",
+                        help="ignora el cache y vuelve a leer el árbol de categorías")
+    args = parser.parse_args(argv)
+    if args.shard:
+        m = re.fullmatch(r"(\d+)/(\d+)", args.shard)
+        if not m or not 1 <= int(m.group(1)) <= int(m.group(2)):
+            parser.error("--shard espera K/N con 1 <= K <= N (ej: 3/8)")
+        args.shard = (int(m.group(1)), int(m.group(2)))
+    return args
+
+
+def main(argv=None):
+    global MAX_WORKERS, SHARD
+    args = parse_args(argv)
+    if args.merge:
+        return main_merge(args.merge)
+    MAX_WORKERS = args.workers
+    SHARD = args.shard or (1, 1)
+    OUTPUT_DIR.mkdir(exist_ok=True)
+    if SHARD[1] > 1:
+        DIR_PARCIALES.mkdir(exist_ok=True)
 
-        if prods_cat:
-            df_temp = pd.DataFrame(prods_cat)
+    if args.resume:
+        formato = args.formato if args.formato == "csv" or pa is not None else "csv"
+        salida = ultimo_output(formato) if args.resume == "ultimo" else Path(args.resume)
+        if salida is None or not ruta_journal(salida).exists():
+            print("ERROR: No hay corrida con journal para retomar.")
+            return
+    else:
+        timestamp    = datetime.now().strftime("%Y%m%d_%H%M%S")
+        formato = args.formato
+        if formato == "parquet" and pa is None:
+            print(" [Aviso] pyarrow no está instalado; la salida va en CSV")
+            formato = "csv"
+        salida = ruta_output(timestamp, formato)
 
-            with csv_lock:
-                header_necesario = not csv_filename.exists()
-                df_temp.to_csv(csv_filename, mode="a", index=False,
-                               header=header_necesario, encoding="utf-8-sig")
+    journal  = Journal(ruta_journal(salida))
+    escritor = crear_escritor(salida, journal)
 
-            acumulado_skus += len(prods_cat)
-            print(f"-> {len(prods_cat)} SKUs (Total: {acumulado_skus})")
+    session = crear_sesion()
+    inicio  = time.monotonic()
+    categorias, origen = cargar_categorias(session, args.refrescar_categorias)
+
+    print(f"{'='*60}")
+    print(f" CARREBOT - SCRAPER COMPLETO ({len(categorias)} CATEGORÍAS, {origen})")
+    print(f" Engine: {args.engine} | Workers: {MAX_WORKERS}"
+          + (f" | Shard: {SHARD[0]}/{SHARD[1]}" if SHARD[1] > 1 else ""))
+    if args.resume:
+        print(f" RETOMANDO: {salida} ({len(journal.ok)} páginas ya bajadas, "
+              f"{len(journal.errores)} fallidas)")
+    print(f" Inicia: {datetime.now().strftime('%H:%M:%S')}")
+    print(f"{'='*60}\n")
+
+    try:
+        if args.engine == "async":
+            asyncio.run(scrape_async(categorias, session, escritor, journal))
         else:
-            print("-> SIN DATOS/ERROR")
+            scrape_threads(categorias, session, escritor, journal)
+    finally:
+        escritor.cerrar()
+        journal.cerrar()
+
+    # Una corrida retomada o un shard es parcial: no se compara ni pisa la base
+    parcial = bool(args.resume) or SHARD[1] > 1
+    reporte = guardar_reporte(
+        metricas.reporte(engine=args.engine, workers=MAX_WORKERS, archivo=str(salida),
+                         resume=bool(args.resume), shard=f"{SHARD[0]}/{SHARD[1]}", req_s=round(limitador.tasa_efectiva(), 2),
+                         throttles=limitador.throttles),
+        salida.with_suffix(".reporte.json"), PROM_TEXTFILE,
+        None if parcial else ULTIMO_REPORTE)
 
     print(f"\n{'='*60}")
-    print(f" PROCESO TERMINADO")
-    print(f" Total SKUs guardados: {acumulado_skus}")
-    print(f" Archivo: {csv_filename}")
+    print(f" PROCESO TERMINADO ({time.monotonic() - inicio:.0f}s)")
+    print(f" Total SKUs guardados: {escritor.filas}")
+    print(f" Rate: {limitador.resumen()}")
+    print(f" Archivo: {salida}")
+    print(f" Reporte: {salida.with_suffix('.reporte.json')}")
+    if journal.errores:
+        print(f" ATENCIÓN: {len(journal.errores)} páginas fallidas. "
+              f"Reintentar con: --resume {salida}")
+    for alerta in reporte["alertas"]:
+        print(f" ALERTA {alerta['categoria']} ({alerta['tipo']}): {alerta['detalle']}")
     print(f"{'='*60}")
 
 
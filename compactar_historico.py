@@ -0,0 +1,217 @@
+"""
+compactar_historico.py
+======================
+Retención por niveles del histórico: las fechas de los últimos
+DIAS_DIARIOS días quedan como están y las anteriores se juntan por
+semana (lunes a domingo) en una sola partición, fechada en la última
+fecha scrapeada de la semana, con la última observación de cada
+producto en esa semana. Así el histórico crece ~1/7 por día pasado el
+corte en vez de una partición completa por día.
+
+Sólo se juntan semanas completas (que terminan antes del corte): la
+que cruza el corte espera a quedar entera, así cada semana se compacta
+una sola vez. Pasado el corte se pierde el detalle diario: el backfill
+(analizar_precios_carrefour.py --desde) y las consultas puntuales
+(consulta_precios.py) ven una fecha por semana.
+
+El índice no necesita nada especial: sus pasos son entre fechas
+consecutivas guardadas, que pasado el corte quedan a una semana. Sin
+--aplicar (o con --validar) se calcula graficos.json del último año con
+y sin la compactación y se escribe en data/compactacion.json cuánto se
+mueve cada serie (en puntos porcentuales, sobre las fechas que quedan),
+sin contar las filas en cuarentena (anomalias_precios). Los
+representantes sí las guardan: la cuarentena se aplica al leer y se
+vuelve a evaluar sobre las particiones reescritas.
+
+No corre en el workflow diario (sólo a mano, o con el input compactar
+de workflow_dispatch). Es incremental: una semana ya compactada es una
+fecha sola y no se toca. El log de cambios (historico_delta), que es lo
+que se versiona, se reescribe en el momento (sólo las entradas de las
+semanas juntadas y las siguientes); historico_mmap y la base SQLite se
+ponen al día solas en la próxima corrida; del estado del índice se
+descartan los pasos que tocan una partición reescrita.
+
+Uso:
+    python compactar_historico.py                 # sólo el reporte
+    python compactar_historico.py --aplicar --dias-diarios 60
+"""
+
+import argparse
+import json
+import shutil
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import anomalias_precios
+import historico_delta
+import historico_precios
+import indice_precios
+from analizar_precios_carrefour import DIAS_HISTORIA, ORDEN_CATS, PERIODOS
+from historico_precios import DIR_DATA
+
+DIAS_DIARIOS = 60
+REPORTE      = DIR_DATA / "compactacion.json"
+
+
+def semanas_a_compactar(fechas, corte):
+    """
+    {fecha representante: [fechas de la semana]} de las semanas completas
+    (el domingo antes de `corte`) que todavía tienen más de una fecha.
+    """
+    grupos = {}
+    for f in fechas:
+        dia = datetime.strptime(f, "%Y%m%d")
+        domingo = (dia + timedelta(days=6 - dia.weekday())).strftime("%Y%m%d")
+        if domingo < corte:
+            grupos.setdefault(domingo, []).append(f)
+    return {g[-1]: g for g in grupos.values() if len(g) > 1}
+
+
+def representante(df_semana):
+    """
+    Última observación de cada producto en la semana, fechada en la última
+    fecha: primero las filas de esa fecha (en su orden), después las de
+    productos que sólo aparecieron antes.
+    """
+    fechas = np.sort(df_semana["fecha"].unique())[::-1]
+    partes = [df_semana[df_semana["fecha"] == f] for f in fechas]
+    rep = pd.concat(partes).drop_duplicates("product_key", keep="first")
+    return rep.assign(fecha=rep["fecha"].dtype.type(fechas[0]))
+
+
+def compactar_frame(df_hist, semanas):
+    """`df_hist` con las semanas reemplazadas por su representante."""
+    fechas = df_hist["fecha"].to_numpy()
+    juntas = np.isin(fechas, [int(f) for g in semanas.values() for f in g])
+    partes = [df_hist[~juntas]]
+    for g in semanas.values():
+        semana = df_hist[np.isin(fechas, [int(f) for f in g])]
+        if len(semana):   # semanas fuera del rango cargado
+            partes.append(representante(semana))
+    return pd.concat(partes).sort_values("fecha", kind="stable").reset_index(drop=True)
+
+
+# ── VALIDACIÓN ────────────────────────────────────────────────────────────────
+def desvio_serie(completa, compactada):
+    """Diferencia en pp entre las dos series en las fechas de la compactada."""
+    a = {p["fecha"]: p["pct"] for p in completa}
+    b = {p["fecha"]: p["pct"] for p in compactada}
+    comunes = [f for f in b if f in a]
+    if not comunes:
+        return {"max_pp": None, "final_pp": None, "puntos": [len(a), len(b)]}
+    base = a[comunes[0]]   # la completa rebasada al inicio de la compactada
+    difs = [b[f] - (a[f] - base) for f in comunes]
+    return {"max_pp": round(max(abs(d) for d in difs), 2), "final_pp": round(difs[-1], 2),
+            "puntos": [len(a), len(b)]}
+
+
+def validar(df_hist, semanas, hoy=None):
+    """Desvío de cada serie de graficos.json por compactar `semanas` de `df_hist`."""
+    completo = indice_precios.generar_graficos(df_hist, PERIODOS, ORDEN_CATS, hoy)
+    compactado = indice_precios.generar_graficos(compactar_frame(df_hist, semanas),
+                                                 PERIODOS, ORDEN_CATS, hoy)
+    desvio = {}
+    for periodo, series in completo.items():
+        otras = compactado.get(periodo, {"total": [], "categorias": {}})
+        desvio[periodo] = {indice_precios.TOTAL: desvio_serie(series["total"], otras["total"])}
+        for cat, serie in series["categorias"].items():
+            desvio[periodo][cat] = desvio_serie(serie, otras["categorias"].get(cat, []))
+    return desvio
+
+
+# ── APLICACIÓN ────────────────────────────────────────────────────────────────
+def aplicar(semanas):
+    """
+    Escribe la partición de cada representante, borra las demás fechas de
+    la semana, deja el log de cambios igual y saca del estado del índice
+    los pasos que las usaban.
+    """
+    borradas = set()
+    for fecha_rep, fechas in semanas.items():
+        rep = representante(historico_precios.cargar_hechos(fechas=fechas))
+        historico_precios.escribir_hechos(fecha_rep, rep["product_key"].to_numpy(),
+                                          rep["precio_actual"].to_numpy(),
+                                          rep["precio_regular"].to_numpy())
+        for f in fechas:
+            if f != fecha_rep:
+                shutil.rmtree(historico_precios.ruta_particion(f).parent)
+                borradas.add(f)
+    historico_delta.sincronizar(set(semanas), borradas)
+    descartar_del_indice(set(semanas))
+
+
+def descartar_del_indice(fechas):
+    """Saca del estado del índice los pasos que usan particiones reescritas."""
+    if fechas and indice_precios.ESTADO.exists():
+        estado = indice_precios.cargar_estado(ORDEN_CATS)
+        indice_precios.descartar_dias(estado, fechas)
+        indice_precios.guardar_estado(estado)
+
+
+def compactar(dias_diarios=DIAS_DIARIOS, aplicar_cambios=False, validar_cambios=True,
+              hoy=None):
+    """
+    Valida (si validar_cambios) y aplica (si aplicar_cambios) la
+    compactación. Devuelve el reporte.
+    """
+    _, reemplazadas = historico_delta.restaurar()
+    descartar_del_indice(set(reemplazadas))
+    fechas = historico_precios.fechas_disponibles()
+    corte = historico_precios.desde_dias(dias_diarios, hoy)
+    semanas = semanas_a_compactar(fechas, corte)
+    desvio = {}
+    if semanas and validar_cambios:
+        desde = historico_precios.desde_dias(DIAS_HISTORIA, hoy)
+        cuarentena = anomalias_precios.claves_cuarentena(anomalias_precios.cargar_estado())
+        df_hist = anomalias_precios.quitar(historico_precios.cargar_historico(desde=desde),
+                                           cuarentena)
+        desvio = validar(df_hist, semanas, pd.Timestamp(hoy).normalize() if hoy else None)
+    juntas = sum(len(g) for g in semanas.values())
+    reporte = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "dias_diarios": dias_diarios,
+        "corte": corte,
+        "aplicado": aplicar_cambios,
+        "validado": bool(desvio),
+        "fechas_antes": len(fechas),
+        "fechas_despues": len(fechas) - juntas + len(semanas),
+        "semanas": [{"fecha": f, "fechas": g} for f, g in semanas.items()],
+        "max_pp": max((d["max_pp"] for p in desvio.values() for d in p.values()
+                       if d["max_pp"] is not None), default=0.0),
+        "desvio": desvio,
+    }
+    if aplicar_cambios and semanas:
+        aplicar(semanas)
+    with open(REPORTE, "w", encoding="utf-8") as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2)
+    return reporte
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compacta por semana el histórico viejo")
+    parser.add_argument("--dias-diarios", type=int, default=DIAS_DIARIOS,
+                        help="días recientes que quedan con una fecha por día")
+    parser.add_argument("--aplicar", action="store_true",
+                        help="reescribe data/hist/ (sin esto sólo valida)")
+    parser.add_argument("--validar", action="store_true",
+                        help="con --aplicar, calcula igual el desvío de graficos.json")
+    args = parser.parse_args(argv)
+
+    rep = compactar(args.dias_diarios, args.aplicar, args.validar or not args.aplicar)
+    print(f"  Corte {rep['corte']}: {len(rep['semanas'])} semanas, "
+          f"{rep['fechas_antes']} -> {rep['fechas_despues']} fechas"
+          f"{'' if rep['aplicado'] else ' (sin aplicar)'}")
+    for periodo, series in rep["desvio"].items():
+        total = series[indice_precios.TOTAL]
+        print(f"  {periodo:>4}: total máx {total['max_pp']} pp, final {total['final_pp']} pp, "
+              f"{total['puntos'][0]} -> {total['puntos'][1]} puntos")
+    if rep["validado"]:
+        print(f"  Desvío máximo: {rep['max_pp']} pp  ({REPORTE})")
+    if rep["semanas"]:
+        print(f"  Antes de {rep['corte']}, backfill y consulta_precios ven una fecha por semana")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+consulta_precios.py
+===================
+Consultas puntuales al histórico ("¿cuánto salía el EAN X el día Y?")
+sin cargarlo entero: una base SQLite embebida, indexada por product_id,
+ean y fecha, que se alimenta de data/hist/ (ver historico_precios.py).
+
+La base (data/precios.sqlite) no se versiona. Se crea con --actualizar
+y desde ahí analizar_precios_carrefour.py le agrega cada día lo nuevo;
+sólo se reingesta una fecha si su partición cambió (por md5, como
+historico_mmap: el mtime no sirve después de un checkout). Si se
+compactó el histórico viejo (compactar_historico.py), antes del corte
+hay una fecha por semana y el precio vigente sale de la semana anterior.
+
+Uso:
+    python consulta_precios.py --actualizar
+    python consulta_precios.py --ean 7790070318107
+    python consulta_precios.py --ean 7790070318107 --fecha 20260501
+    python consulta_precios.py --id 123456 --desde 20260101 --json
+
+Desde Python:
+    import consulta_precios
+    consulta_precios.precio_en("20260501", ean="7790070318107")
+    consulta_precios.serie(product_id="123456")
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import time
+
+import pyarrow.parquet as pq
+
+import historico_mmap
+import historico_precios
+from historico_precios import DIR_DATA
+
+DB = DIR_DATA / "precios.sqlite"
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS productos (
+    product_key   INTEGER PRIMARY KEY,
+    product_id    TEXT,
+    sku_id        TEXT,
+    ean           TEXT,
+    nombre        TEXT,
+    marca         TEXT,
+    categoria     TEXT,
+    cat_principal TEXT
+);
+CREATE INDEX IF NOT EXISTS productos_id  ON productos (product_id);
+CREATE INDEX IF NOT EXISTS productos_ean ON productos (ean);
+
+CREATE TABLE IF NOT EXISTS precios (
+    product_key    INTEGER NOT NULL,
+    fecha          INTEGER NOT NULL,
+    precio_actual  REAL,
+    precio_regular REAL,
+    PRIMARY KEY (product_key, fecha)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS fechas (
+    fecha INTEGER PRIMARY KEY,
+    firma TEXT NOT NULL,
+    filas INTEGER NOT NULL
+);
+"""
+
+CAMPOS_PRODUCTO = ["product_key"] + historico_precios.COLUMNAS_PRODUCTO
+
+
+def conectar(ruta=DB):
+    con = sqlite3.connect(ruta)
+    con.row_factory = sqlite3.Row
+    columnas = [r["name"] for r in con.execute("PRAGMA table_info(fechas)")]
+    if columnas and "firma" not in columnas:
+        con.execute("DROP TABLE fechas")   # base vieja (por mtime): se recargan todas
+    con.executescript(ESQUEMA)
+    return con
+
+
+# ── INGESTA ───────────────────────────────────────────────────────────────────
+def actualizar(ruta=DB):
+    """
+    Sincroniza la base con data/hist/: reemplaza la tabla de productos y
+    (re)carga sólo las fechas nuevas o cuya partición cambió; borra las
+    que ya no están. Devuelve las fechas cargadas.
+    """
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    con = conectar(ruta)
+    cargadas = []
+    with con:
+        dim = historico_precios.cargar_productos().reset_index()
+        dim = dim.astype(object).where(dim.notna(), None)
+        con.execute("DELETE FROM productos")
+        con.executemany(f"INSERT INTO productos VALUES ({','.join('?' * len(CAMPOS_PRODUCTO))})",
+                        dim[CAMPOS_PRODUCTO].itertuples(index=False, name=None))
+
+        previas = {r["fecha"]: r["firma"] for r in con.execute("SELECT fecha, firma FROM fechas")}
+        disponibles = historico_precios.fechas_disponibles()
+        for fecha in set(previas) - {int(f) for f in disponibles}:
+            con.execute("DELETE FROM precios WHERE fecha = ?", (fecha,))
+            con.execute("DELETE FROM fechas WHERE fecha = ?", (fecha,))
+
+        for fecha in disponibles:
+            firma = historico_mmap.firma_particion(fecha)
+            if previas.get(int(fecha)) == firma:
+                continue
+            df = pq.read_table(historico_precios.ruta_particion(fecha)).to_pandas()
+            filas = zip(df["product_key"].tolist(), df["fecha"].tolist(),
+                        historico_precios.precio64(df["precio_actual"]).tolist(),
+                        historico_precios.precio64(df["precio_regular"]).tolist())
+            con.execute("DELETE FROM precios WHERE fecha = ?", (int(fecha),))
+            con.executemany("INSERT OR REPLACE INTO precios VALUES (?, ?, ?, ?)", filas)
+            con.execute("INSERT OR REPLACE INTO fechas VALUES (?, ?, ?)",
+                        (int(fecha), firma, len(df)))
+            cargadas.append(fecha)
+    con.close()
+    return cargadas
+
+
+# ── CONSULTAS ─────────────────────────────────────────────────────────────────
+def productos(con, product_id=None, ean=None):
+    """Productos que coinciden con el product_id o el EAN."""
+    if product_id is not None:
+        cur = con.execute("SELECT * FROM productos WHERE product_id = ?", (str(product_id),))
+    elif ean is not None:
+        cur = con.execute("SELECT * FROM productos WHERE ean = ?", (str(ean),))
+    else:
+        raise ValueError("hace falta product_id o ean")
+    return [dict(r) for r in cur]
+
+
+def serie(product_id=None, ean=None, desde=None, hasta=None, ruta=DB):
+    """
+    Serie completa de precios de cada producto que coincide:
+    [{**producto, "precios": [{"fecha", "precio_actual", "precio_regular"}, ...]}]
+    """
+    con = conectar(ruta)
+    resultado = []
+    for prod in productos(con, product_id, ean):
+        cur = con.execute(
+            "SELECT fecha, precio_actual, precio_regular FROM precios "
+            "WHERE product_key = ? AND fecha BETWEEN ? AND ? ORDER BY fecha",
+            (prod["product_key"], int(desde or 0), int(hasta or 99991231)))
+        resultado.append(dict(prod, precios=[dict(r) for r in cur]))
+    con.close()
+    return resultado
+
+
+def precio_en(fecha, product_id=None, ean=None, ruta=DB):
+    """
+    Precio vigente a `fecha` (el último relevado en o antes de ese día) de
+    cada producto que coincide: [{**producto, "fecha", "precio_actual",
+    "precio_regular"}]. Los que no tenían precio todavía no aparecen.
+    """
+    con = conectar(ruta)
+    resultado = []
+    for prod in productos(con, product_id, ean):
+        fila = con.execute(
+            "SELECT fecha, precio_actual, precio_regular FROM precios "
+            "WHERE product_key = ? AND fecha <= ? ORDER BY fecha DESC LIMIT 1",
+            (prod["product_key"], int(fecha))).fetchone()
+        if fila is not None:
+            resultado.append(dict(prod, **dict(fila)))
+    con.close()
+    return resultado
+
+
+def _pesos(valor):
+    return f"${valor:>10.2f}" if valor is not None else f"{'-':>11}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consultas de precios sobre el histórico")
+    parser.add_argument("--actualizar", action="store_true",
+                        help="crea/actualiza la base desde data/hist/")
+    parser.add_argument("--id", dest="product_id")
+    parser.add_argument("--ean")
+    parser.add_argument("--fecha", help="precio vigente a esta fecha (YYYYMMDD)")
+    parser.add_argument("--desde", help="inicio de la serie (YYYYMMDD)")
+    parser.add_argument("--hasta", help="fin de la serie (YYYYMMDD)")
+    parser.add_argument("--json", action="store_true", help="salida en JSON")
+    args = parser.parse_args(argv)
+
+    if args.actualizar:
+        t0 = time.perf_counter()
+        cargadas = actualizar()
+        print(f"  {DB}: {len(cargadas)} fechas cargadas ({time.perf_counter() - t0:.1f}s)")
+    if args.product_id is None and args.ean is None:
+        if not args.actualizar:
+            parser.error("indicar --id o --ean (o --actualizar)")
+        return
+    if not DB.exists():
+        sys.exit(f"ERROR: no existe {DB}; correr primero con --actualizar")
+
+    t0 = time.perf_counter()
+    if args.fecha:
+        res = precio_en(args.fecha, args.product_id, args.ean)
+    else:
+        res = serie(args.product_id, args.ean, args.desde, args.hasta)
+    ms = (time.perf_counter() - t0) * 1000
+
+    if args.json:
+        print(json.dumps(res, ensure_ascii=False, indent=2))
+        return
+    if not res:
+        print("  Sin resultados")
+    for prod in res:
+        print(f"  {prod['product_id']} | EAN {prod['ean']} | {prod['nombre']} ({prod['marca']})")
+        for fila in (prod["precios"] if "precios" in prod else [prod]):
+            print(f"    {fila['fecha']}  regular {_pesos(fila['precio_regular'])}  "
+                  f"actual {_pesos(fila['precio_actual'])}")
+    print(f"  ({ms:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
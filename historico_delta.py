@@ -0,0 +1,285 @@
+"""
+historico_delta.py
+==================
+El histórico que se versiona: un log de cambios por fecha con sólo los
+productos que aparecieron, cambiaron de precio o desaparecieron respecto
+de la fecha anterior, y un checkpoint completo en la primera fecha de
+cada tramo de CHECKPOINT_CADA días de calendario:
+
+    data/hist_delta/
+        checkpoint-YYYYMMDD.parquet   product_key | precio_actual | precio_regular
+        delta-YYYYMMDD.parquet        product_key | precio_actual | precio_regular | baja
+
+Como casi todos los productos repiten precio de un día al otro, un delta
+pesa una fracción de la partición completa, y es lo único que agrega el
+commit de cada día. Cada entrada guarda en su metadata la firma (md5 del
+contenido) de la fecha completa.
+
+El log manda. Las particiones de data/hist/fecha=*/ no se versionan: son
+la copia local con la que trabaja todo lo demás (leer una partición es
+más barato que aplicar hasta CHECKPOINT_CADA deltas), y restaurar() la
+deja igual al log al empezar cada corrida: borra las fechas que el log
+no tiene y rearma las que faltan o no coinciden con su firma, aplicando
+los deltas sobre arrays densos indexados por product_key. Las filas
+salen ordenadas por product_key, igual que las escribe
+historico_precios. hechos_en_fecha() arma una fecha sola desde el log,
+sin pasar por data/hist/.
+
+Quien cambia data/hist/ (el analizador al guardar el día, la
+compactación) le pasa a sincronizar() las fechas que escribió o borró;
+el resto del log no se compara con las particiones. Los tramos van por
+fecha y no por posición, así que borrar o reescribir fechas (compactar
+una semana) sólo toca esas entradas, la siguiente y, si cae el primer
+día de un tramo, su checkpoint.
+"""
+
+import hashlib
+import shutil
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import historico_precios
+from historico_precios import DIR_DATA
+
+DIR_DELTA       = DIR_DATA / "hist_delta"
+CHECKPOINT_CADA = 28
+
+ESQUEMA_CHECKPOINT = pa.schema([
+    ("product_key",    pa.int32()),
+    ("precio_actual",  pa.float32()),
+    ("precio_regular", pa.float32()),
+])
+ESQUEMA_DELTA = ESQUEMA_CHECKPOINT.append(pa.field("baja", pa.bool_()))
+
+
+def ruta_entrada(fecha, checkpoint):
+    return DIR_DELTA / f"{'checkpoint' if checkpoint else 'delta'}-{fecha}.parquet"
+
+
+def es_inicio_tramo(fecha, anterior):
+    """Si `fecha` abre un tramo nuevo de checkpoint (anterior: la fecha previa o None)."""
+    return anterior is None or _tramo(fecha) != _tramo(anterior)
+
+
+def _tramo(fecha):
+    return date(int(fecha[:4]), int(fecha[4:6]), int(fecha[6:])).toordinal() // CHECKPOINT_CADA
+
+
+def fechas_log():
+    """[(fecha, es_checkpoint)] del log, ordenadas por fecha."""
+    if not DIR_DELTA.exists():
+        return []
+    return sorted((p.stem.split("-", 1)[1], p.stem.startswith("checkpoint"))
+                  for p in DIR_DELTA.glob("*-????????.parquet"))
+
+
+# ── ESTADO DENSO ──────────────────────────────────────────────────────────────
+class Snapshot:
+    """Precios de una fecha en arrays indexados por product_key."""
+
+    def __init__(self):
+        self.actual   = np.empty(0, dtype=np.float32)
+        self.regular  = np.empty(0, dtype=np.float32)
+        self.presente = np.empty(0, dtype=bool)
+
+    def _crecer(self, n):
+        if n > len(self.presente):
+            extra = n - len(self.presente)
+            self.actual   = np.append(self.actual, np.full(extra, np.nan, np.float32))
+            self.regular  = np.append(self.regular, np.full(extra, np.nan, np.float32))
+            self.presente = np.append(self.presente, np.zeros(extra, bool))
+
+    def reemplazar(self, claves, actual, regular):
+        """Deja presentes exactamente `claves` con esos precios (checkpoint)."""
+        self.presente[:] = False
+        self.aplicar(claves, actual, regular, np.zeros(len(claves), bool))
+
+    def aplicar(self, claves, actual, regular, baja):
+        self._crecer(int(claves.max()) + 1 if len(claves) else 0)
+        self.actual[claves] = actual
+        self.regular[claves] = regular
+        self.presente[claves] = ~baja
+
+    def filas(self):
+        """(product_key, precio_actual, precio_regular) de los presentes, por clave."""
+        claves = np.flatnonzero(self.presente).astype(np.int32)
+        return claves, self.actual[claves], self.regular[claves]
+
+    def diferencias(self, claves, actual, regular):
+        """
+        Filas del delta que lleva de este snapshot a uno con `claves` y esos
+        precios: altas y cambios con sus precios nuevos, bajas marcadas.
+        """
+        self._crecer(int(claves.max()) + 1 if len(claves) else 0)
+        cambia = ~self.presente[claves] | _distintos(self.actual[claves], actual) \
+                                        | _distintos(self.regular[claves], regular)
+        sigue = np.zeros(len(self.presente), bool)
+        sigue[claves] = True
+        bajas = np.flatnonzero(self.presente & ~sigue).astype(np.int32)
+        n = len(bajas)
+        return (np.concatenate([claves[cambia], bajas]),
+                np.concatenate([actual[cambia], np.full(n, np.nan, np.float32)]),
+                np.concatenate([regular[cambia], np.full(n, np.nan, np.float32)]),
+                np.concatenate([np.zeros(int(cambia.sum()), bool), np.ones(n, bool)]))
+
+
+def _distintos(a, b):
+    return (a != b) & ~(np.isnan(a) & np.isnan(b))
+
+
+def firma(claves, actual, regular):
+    """md5 del contenido de una fecha (claves ordenadas y sus precios)."""
+    h = hashlib.md5()
+    for valores, tipo in ((claves, np.int32), (actual, np.float32), (regular, np.float32)):
+        h.update(np.ascontiguousarray(valores, dtype=tipo).tobytes())
+    return h.hexdigest()
+
+
+def firma_guardada(fecha, checkpoint):
+    """Firma de la fecha guardada con su entrada (None en entradas sin firma)."""
+    meta = pq.read_schema(ruta_entrada(fecha, checkpoint)).metadata or {}
+    return meta.get(b"firma", b"").decode() or None
+
+
+def _leer(fecha, checkpoint, snap):
+    tabla = pq.read_table(ruta_entrada(fecha, checkpoint))
+    claves = tabla.column("product_key").to_numpy()
+    actual = tabla.column("precio_actual").to_numpy(zero_copy_only=False)
+    regular = tabla.column("precio_regular").to_numpy(zero_copy_only=False)
+    if checkpoint:
+        snap.reemplazar(claves, actual, regular)
+    else:
+        snap.aplicar(claves, actual, regular,
+                     tabla.column("baja").to_numpy(zero_copy_only=False))
+
+
+def _escribir(fecha, checkpoint, columnas, firma_fecha):
+    esquema = (ESQUEMA_CHECKPOINT if checkpoint else ESQUEMA_DELTA) \
+        .with_metadata({"firma": firma_fecha})
+    tabla = pa.table({n: pa.array(c, type=esquema.field(n).type)
+                      for n, c in zip(esquema.names, columnas)}, schema=esquema)
+    historico_precios._escribir(tabla, ruta_entrada(fecha, checkpoint))
+
+
+def _reproducir(log, desde):
+    """
+    Recorre el log desde el último checkpoint en o antes de la posición
+    `desde`: (fecha, snapshot) de cada fecha a partir de ahí.
+    """
+    inicio = max(i for i in range(desde + 1) if log[i][1])
+    snap = Snapshot()
+    for i, (fecha, checkpoint) in enumerate(log[inicio:], inicio):
+        _leer(fecha, checkpoint, snap)
+        if i >= desde:
+            yield fecha, snap
+
+
+def hechos_en_fecha(fecha):
+    """
+    Hechos (como historico_precios.cargar_hechos) de una fecha del log,
+    armados desde su checkpoint y los deltas siguientes, sin leer ni
+    escribir data/hist/. None si la fecha no está en el log.
+    """
+    log = fechas_log()
+    pos = next((i for i, (f, _) in enumerate(log) if f == fecha), None)
+    if pos is None:
+        return None
+    _, snap = next(_reproducir(log, pos))
+    claves, actual, regular = snap.filas()
+    return pd.DataFrame({"product_key": claves,
+                         "fecha": np.full(len(claves), int(fecha), np.int32),
+                         "precio_actual": actual, "precio_regular": regular})
+
+
+# ── SINCRONIZACIÓN CON data/hist/ ─────────────────────────────────────────────
+def _leer_particion(fecha):
+    tabla = pq.read_table(historico_precios.ruta_particion(fecha))
+    return (tabla.column("product_key").to_numpy(),
+            tabla.column("precio_actual").to_numpy(zero_copy_only=False),
+            tabla.column("precio_regular").to_numpy(zero_copy_only=False))
+
+
+def sincronizar(cambiadas=(), borradas=()):
+    """
+    Lleva al log las fechas de `cambiadas` (particiones escritas o
+    reescritas en data/hist/) y saca las de `borradas`; el resto del log no
+    se mira contra data/hist/. Además de esas fechas reescribe los deltas
+    cuya fecha anterior cambió y las entradas que pasan a ser o dejan de
+    ser checkpoint. Con el log vacío toma todas las particiones (histórico
+    anterior al log, o recién migrado). Devuelve las fechas escritas.
+    """
+    log = fechas_log()
+    en_log = dict(log)
+    if not log:
+        cambiadas = historico_precios.fechas_disponibles()
+    cambiadas, borradas = set(cambiadas), set(borradas)
+    fechas = sorted((set(en_log) | cambiadas) - borradas)
+    anterior_log = dict(zip((f for f, _ in log[1:]), (f for f, _ in log)))
+
+    for fecha in borradas & set(en_log):
+        ruta_entrada(fecha, en_log[fecha]).unlink()
+
+    escritas = []
+    for fecha, anterior in zip(fechas, [None] + fechas[:-1]):
+        checkpoint = es_inicio_tramo(fecha, anterior)
+        if (en_log.get(fecha) == checkpoint and fecha not in cambiadas
+                and (checkpoint or (anterior_log.get(fecha) == anterior
+                                    and anterior not in cambiadas))):
+            continue
+        if fecha in en_log:
+            ruta_entrada(fecha, en_log[fecha]).unlink()
+        columnas = _leer_particion(fecha)
+        firma_fecha = firma(*columnas)
+        if not checkpoint:
+            snap = Snapshot()
+            snap.reemplazar(*_leer_particion(anterior))
+            columnas = snap.diferencias(*columnas)
+        _escribir(fecha, checkpoint, columnas, firma_fecha)
+        escritas.append(fecha)
+    return escritas
+
+
+# ── RESTAURACIÓN DE data/hist/ ────────────────────────────────────────────────
+def restaurar():
+    """
+    Deja data/hist/ igual al log: borra las particiones de fechas que no
+    están en el log y reescribe las que faltan o cuyo contenido no
+    coincide con la firma de su entrada (después de un checkout, donde no
+    se versionan, o de traer un log compactado en otro lado). Con el log
+    vacío no toca nada. Devuelve (fechas escritas, las que ya estaban con
+    otro contenido): éstas cambiaron para lo derivado, las demás no.
+    """
+    log = fechas_log()
+    if not log:
+        return [], []
+    en_log = dict(log)
+    locales = historico_precios.fechas_disponibles()
+    for fecha in set(locales) - set(en_log):
+        shutil.rmtree(historico_precios.ruta_particion(fecha).parent)
+    locales = set(locales) & set(en_log)
+
+    guardadas = {f: firma_guardada(f, c) for f, c in log}
+    revisar = {f for f in en_log if f not in locales or guardadas[f] is None
+               or guardadas[f] != firma(*_leer_particion(f))}
+    if not revisar:
+        return [], []
+    primera = min(i for i, (f, _) in enumerate(log) if f in revisar)
+    escritas, reemplazadas = [], []
+    for fecha, snap in _reproducir(log, primera):
+        if fecha not in revisar:
+            continue
+        firma_log = firma(*snap.filas())
+        if guardadas[fecha] is None:   # entrada de antes de las firmas: se le agrega
+            ruta = ruta_entrada(fecha, en_log[fecha])
+            historico_precios._escribir(
+                pq.read_table(ruta).replace_schema_metadata({"firma": firma_log}), ruta)
+        if fecha not in locales or firma_log != firma(*_leer_particion(fecha)):
+            historico_precios.escribir_hechos(fecha, *snap.filas())
+            escritas.append(fecha)
+            if fecha in locales:
+                reemplazadas.append(fecha)
+    return escritas, reemplazadas
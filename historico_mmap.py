@@ -0,0 +1,153 @@
+"""
+historico_mmap.py
+=================
+Copia columnar del histórico para abrirlo con mmap, sin parsear nada:
+
+    data/hist_mmap/
+        product_key.bin     int32    una fila por (producto, fecha), ordenadas
+        fecha.bin           int32    por fecha y en el orden de la partición
+        precio_actual.bin   float32
+        precio_regular.bin  float32
+        cat_principal.bin   int16    código por product_key (diccionario en meta)
+        meta.json           filas, rango de filas y firma de cada fecha, diccionario
+
+Es derivada de data/hist/ (la fuente de verdad) y no se versiona.
+sincronizar() la pone al día agregando al final las fechas nuevas; si
+cambió o desapareció alguna fecha ya copiada, la rearma entera. Las
+fechas se reconocen por el md5 de la partición (no por mtime, que un
+checkout nuevo pisa), así la copia sirve desde el cache de CI. Al leer,
+cada columna es un np.memmap y un rango de fechas es un slice, así que
+sólo se tocan las páginas de las columnas y fechas que se usan.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+import historico_precios
+from historico_precios import DIR_DATA
+
+DIR_MMAP = DIR_DATA / "hist_mmap"
+META     = DIR_MMAP / "meta.json"
+VERSION  = 1
+
+COLUMNAS = {
+    "product_key":    np.int32,
+    "fecha":          np.int32,
+    "precio_actual":  np.float32,
+    "precio_regular": np.float32,
+}
+
+
+def ruta_columna(nombre):
+    return DIR_MMAP / f"{nombre}.bin"
+
+
+def firma_particion(fecha):
+    return hashlib.md5(historico_precios.ruta_particion(fecha).read_bytes()).hexdigest()
+
+
+def leer_meta():
+    if not META.exists():
+        return None
+    with open(META, encoding="utf-8") as f:
+        meta = json.load(f)
+    return meta if meta.get("version") == VERSION else None
+
+
+def _guardar_meta(meta):
+    tmp = META.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp, META)
+
+
+# ── SINCRONIZACIÓN CON data/hist/ ─────────────────────────────────────────────
+def sincronizar():
+    """
+    Pone la copia al día con data/hist/. Devuelve las fechas copiadas
+    (todas si hubo que rearmarla).
+    """
+    actuales = [(f, firma_particion(f)) for f in historico_precios.fechas_disponibles()]
+    meta = leer_meta()
+    previas = [(f["fecha"], f.get("firma")) for f in meta["fechas"]] if meta else []
+    if previas and previas == actuales[:len(previas)]:
+        nuevas, filas, fechas = actuales[len(previas):], meta["filas"], meta["fechas"]
+    else:
+        nuevas, filas, fechas = actuales, 0, []
+
+    DIR_MMAP.mkdir(parents=True, exist_ok=True)
+    archivos = {}
+    for nombre, dtype in COLUMNAS.items():
+        f = open(ruta_columna(nombre), "r+b" if filas else "wb")
+        f.truncate(filas * np.dtype(dtype).itemsize)   # descarta un append cortado
+        f.seek(0, os.SEEK_END)
+        archivos[nombre] = f
+    try:
+        for fecha, firma in nuevas:
+            tabla = pq.read_table(historico_precios.ruta_particion(fecha))
+            for nombre, dtype in COLUMNAS.items():
+                archivos[nombre].write(tabla.column(nombre).to_numpy().astype(dtype).tobytes())
+            fechas.append({"fecha": fecha, "firma": firma,
+                           "inicio": filas, "fin": filas + tabla.num_rows})
+            filas += tabla.num_rows
+    finally:
+        for f in archivos.values():
+            f.close()
+
+    cats = historico_precios.cargar_productos(["cat_principal"])["cat_principal"]
+    cats = cats.astype("category")
+    codigos = np.full(int(cats.index.max()) + 1 if len(cats) else 0, -1, dtype=np.int16)
+    codigos[cats.index.to_numpy()] = cats.cat.codes.to_numpy()
+    codigos.tofile(ruta_columna("cat_principal"))
+
+    _guardar_meta({"version": VERSION, "filas": filas, "fechas": fechas,
+                   "cat_principal": [str(c) for c in cats.cat.categories]})
+    return [f for f, _ in nuevas]
+
+
+# ── LECTURA ───────────────────────────────────────────────────────────────────
+def _columna(nombre, dtype, n):
+    if n == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(ruta_columna(nombre), dtype=dtype, mode="r", shape=(n,))
+
+
+def cargar_historico(desde=None, hasta=None, columnas_producto=("cat_principal",),
+                     fechas=None):
+    """
+    Igual que historico_precios.cargar_historico pero sobre los memmaps:
+    un rango de fechas es un solo slice sin copia; una lista suelta de
+    fechas concatena sus slices. cat_principal sale como categórica desde
+    el diccionario; otras columnas de producto se unen de la dimensión.
+    """
+    meta = leer_meta()
+    if meta is None:
+        raise FileNotFoundError(f"No hay copia columnar en {DIR_MMAP}; correr sincronizar()")
+    rangos = {f["fecha"]: (f["inicio"], f["fin"]) for f in meta["fechas"]}
+    if fechas is None:
+        elegidas = historico_precios.fechas_en_rango(list(rangos), desde, hasta)
+        tramos = [(rangos[elegidas[0]][0], rangos[elegidas[-1]][1])] if elegidas else []
+    else:
+        tramos = [rangos[f] for f in sorted(fechas)]
+
+    columnas = {}
+    for nombre, dtype in COLUMNAS.items():
+        mapa = _columna(nombre, dtype, meta["filas"])
+        partes = [mapa[a:b] for a, b in tramos]
+        columnas[nombre] = (partes[0] if len(partes) == 1
+                            else np.concatenate(partes) if partes else np.empty(0, dtype))
+    df = pd.DataFrame(columnas, copy=False)
+
+    otras = [c for c in columnas_producto if c != "cat_principal"]
+    if "cat_principal" in columnas_producto:
+        codigos = np.fromfile(ruta_columna("cat_principal"), dtype=np.int16)
+        df["cat_principal"] = pd.Categorical.from_codes(
+            codigos[df["product_key"].to_numpy()], categories=meta["cat_principal"])
+    if otras:
+        df = historico_precios.unir_productos(df, otras)
+    return df
@@ -0,0 +1,283 @@
+"""
+historico_precios.py
+====================
+Histórico de precios particionado por fecha, normalizado en dos tablas:
+
+- Dimensión de productos (una fila por producto, clave entera):
+      data/hist/productos.parquet
+      product_key int32 | product_id | sku_id | ean | nombre | marca |
+      categoria | cat_principal
+  Se reescribe sólo cuando aparece un producto nuevo o cambia su metadata.
+
+- Hechos, una partición por fecha, ordenada por product_key:
+      data/hist/fecha=YYYYMMDD/part-0.parquet
+      product_key int32 | fecha int32 | precio_actual float32 | precio_regular float32
+  Las particiones no se versionan: en git queda el log de cambios de
+  historico_delta, desde el que se rearman.
+
+Guardar un día reemplaza sólo su partición y las lecturas abren
+únicamente las particiones del rango pedido. Los textos (nombre, marca,
+etc.) se unen recién cuando un reporte los necesita (unir_productos).
+
+Reemplaza a data/precios_compacto.csv, que se migra una sola vez.
+"""
+
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DIR_DATA         = Path("data")
+DIR_HIST         = DIR_DATA / "hist"
+PRODUCTOS        = DIR_HIST / "productos.parquet"
+PRECIOS_COMPACTO = DIR_DATA / "precios_compacto.csv"   # formato anterior
+
+COLUMNAS_PRODUCTO = ["product_id", "sku_id", "ean", "nombre", "marca",
+                     "categoria", "cat_principal"]
+
+ESQUEMA_PRODUCTOS = pa.schema(
+    [("product_key", pa.int32())]
+    + [(c, pa.dictionary(pa.int16(), pa.string()) if c in ("categoria", "cat_principal")
+        else pa.string()) for c in COLUMNAS_PRODUCTO])
+
+ESQUEMA_HECHOS = pa.schema([
+    ("product_key",    pa.int32()),
+    ("fecha",          pa.int32()),
+    ("precio_actual",  pa.float32()),
+    ("precio_regular", pa.float32()),
+])
+
+
+def ruta_particion(fecha_str):
+    return DIR_HIST / f"fecha={fecha_str}" / "part-0.parquet"
+
+
+def fechas_disponibles():
+    """Fechas (YYYYMMDD) con partición guardada, ordenadas."""
+    if not DIR_HIST.exists():
+        return []
+    return sorted(p.parent.name.split("=", 1)[1]
+                  for p in DIR_HIST.glob("fecha=*/part-0.parquet"))
+
+
+def precio64(serie):
+    """Precio guardado en float32 -> float64 con los centavos exactos."""
+    return serie.astype("float64").round(2)
+
+
+def _escribir(tabla, ruta):
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    tmp = ruta.with_name(f".{ruta.name}.tmp")
+    pq.write_table(tabla, tmp, compression="zstd")
+    os.replace(tmp, ruta)
+
+
+# ── DIMENSIÓN DE PRODUCTOS ────────────────────────────────────────────────────
+def cargar_productos(columnas=None):
+    """Dimensión de productos indexada por product_key."""
+    columnas = ["product_key"] + [c for c in (columnas or COLUMNAS_PRODUCTO)
+                                  if c != "product_key"]
+    if not PRODUCTOS.exists():
+        return pd.DataFrame(columns=columnas).set_index("product_key")
+    return pq.read_table(PRODUCTOS, columns=columnas).to_pandas().set_index("product_key")
+
+
+def actualizar_productos(df_dia):
+    """
+    Agrega a la dimensión los productos nuevos de `df_dia` y actualiza los
+    que cambiaron de metadata. Devuelve un Series product_id -> product_key.
+    """
+    meta = df_dia.drop_duplicates("product_id").reindex(columns=COLUMNAS_PRODUCTO)
+    meta = meta.astype("string").astype(object).where(meta.notna(), None)
+
+    dim = cargar_productos().reset_index()
+    for col in ("categoria", "cat_principal"):
+        dim[col] = dim[col].astype(object)
+    dim["product_key"] = dim["product_key"].astype("int64")
+
+    previo = dim.set_index("product_id")
+    conocidos = meta["product_id"].isin(previo.index)
+    nuevos = meta[~conocidos].copy()
+    siguiente = int(dim["product_key"].max()) + 1 if len(dim) else 0
+    nuevos.insert(0, "product_key", np.arange(siguiente, siguiente + len(nuevos)))
+
+    existentes = meta[conocidos].set_index("product_id")
+    actuales = previo.loc[existentes.index, existentes.columns]
+    distintos = ~((existentes == actuales) | (existentes.isna() & actuales.isna())).all(axis=1)
+    cambiados = existentes[distintos]
+
+    if len(nuevos) or len(cambiados):
+        previo.loc[cambiados.index, cambiados.columns] = cambiados   # también los None
+        dim = pd.concat([previo.reset_index(), nuevos], ignore_index=True)
+        dim = dim[["product_key"] + COLUMNAS_PRODUCTO]
+        _escribir(pa.Table.from_pandas(dim, schema=ESQUEMA_PRODUCTOS, preserve_index=False),
+                  PRODUCTOS)
+        print(f"  productos.parquet: {len(dim)} productos "
+              f"({len(nuevos)} nuevos, {len(cambiados)} actualizados)")
+    return dim.set_index("product_id")["product_key"]
+
+
+def unir_productos(df, columnas):
+    """Agrega a `df` (con product_key) las columnas pedidas de la dimensión."""
+    dim = cargar_productos(columnas)
+    unido = dim.reindex(df["product_key"].to_numpy())
+    out = df.copy()
+    for col in columnas:
+        out[col] = unido[col].to_numpy()
+    return out
+
+
+# ── HECHOS POR FECHA ──────────────────────────────────────────────────────────
+def guardar_dia(df_dia, fecha_str):
+    """
+    Escribe (o reemplaza) la partición de una fecha a partir del día con
+    todas sus columnas; actualiza antes la dimensión. Devuelve la ruta, o
+    None sin escribir nada si el día no tiene ningún precio_regular
+    válido: una partición vacía sería una fecha sin productos para el
+    índice, el log de cambios y la copia mmap.
+    """
+    if not (pd.to_numeric(df_dia["precio_regular"], errors="coerce") > 0).any():
+        return None
+    claves = actualizar_productos(df_dia)
+    return escribir_hechos(fecha_str,
+                           claves.reindex(df_dia["product_id"].astype(str)).to_numpy(),
+                           pd.to_numeric(df_dia["precio_actual"], errors="coerce"),
+                           pd.to_numeric(df_dia["precio_regular"], errors="coerce"))
+
+
+def escribir_hechos(fecha_str, product_key, precio_actual, precio_regular):
+    """
+    Escribe la partición de una fecha con claves ya asignadas, ordenada
+    por product_key: así la misma fecha da el mismo archivo venga del
+    scraper o de historico_delta.restaurar.
+    """
+    orden = np.argsort(np.asarray(product_key), kind="stable")
+    hechos = pa.table({
+        "product_key":    pa.array(np.asarray(product_key)[orden], type=pa.int32()),
+        "fecha":          pa.array(np.full(len(product_key), int(fecha_str)), type=pa.int32()),
+        "precio_actual":  pa.array(np.asarray(precio_actual, dtype=np.float64)[orden],
+                                   type=pa.float32()),
+        "precio_regular": pa.array(np.asarray(precio_regular, dtype=np.float64)[orden],
+                                   type=pa.float32()),
+    }, schema=ESQUEMA_HECHOS)
+    ruta = ruta_particion(fecha_str)
+    _escribir(hechos, ruta)
+    return ruta
+
+
+def fechas_en_rango(fechas, desde=None, hasta=None):
+    """
+    Fechas de `fechas` dentro de [desde, hasta]. Incluye además la última
+    fecha anterior a `desde`, que es la que usan los snapshots "a tal
+    fecha" cuando justo ese día no hubo scraping.
+    """
+    if hasta is not None:
+        fechas = [f for f in fechas if f <= hasta]
+    if desde is None:
+        return fechas
+    previas = [f for f in fechas if f < desde]
+    return previas[-1:] + [f for f in fechas if f >= desde]
+
+
+def cargar_hechos(desde=None, hasta=None, fechas=None):
+    """
+    Tabla de hechos (product_key, fecha, precios) del rango pedido, o de
+    exactamente las `fechas` indicadas.
+    """
+    if fechas is None:
+        fechas = fechas_en_rango(fechas_disponibles(), desde, hasta)
+    tablas = [pq.read_table(ruta_particion(f)) for f in sorted(fechas)]
+    if not tablas:
+        return ESQUEMA_HECHOS.empty_table().to_pandas()
+    return pa.concat_tables(tablas).to_pandas()
+
+
+def cargar_historico(desde=None, hasta=None, columnas_producto=("cat_principal",),
+                     fechas=None):
+    """
+    Hechos del rango más las columnas de producto pedidas (por default
+    sólo cat_principal, como categórica). Para nombres y demás textos usar
+    unir_productos sobre el subconjunto que se va a mostrar.
+    """
+    return agregar_columnas_producto(cargar_hechos(desde, hasta, fechas), columnas_producto)
+
+
+def agregar_columnas_producto(df, columnas_producto):
+    """Une a los hechos las columnas de producto pedidas, como categóricas."""
+    if columnas_producto:
+        df = unir_productos(df, list(columnas_producto))
+        for col in columnas_producto:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def desde_dias(dias, referencia=None):
+    """Fecha YYYYMMDD de `dias` días antes de `referencia` (hoy por default)."""
+    referencia = referencia or datetime.now()
+    return (referencia - timedelta(days=dias)).strftime("%Y%m%d")
+
+
+# ── ÍNDICE POR FECHA ──────────────────────────────────────────────────────────
+class IndiceFechas:
+    """
+    Histórico ordenado por fecha con el rango de filas de cada una, armado
+    una sola vez. Las búsquedas son binarias sobre el array de fechas y
+    cada día se devuelve como un slice del frame, sin máscara ni copia.
+    Dentro de cada fecha se conserva el orden de la partición.
+    """
+
+    def __init__(self, df_hist):
+        fechas = df_hist["fecha"].to_numpy()
+        if len(fechas) and not (fechas[1:] >= fechas[:-1]).all():
+            df_hist = df_hist.sort_values("fecha", kind="stable")
+            fechas = df_hist["fecha"].to_numpy()
+        self.df = df_hist
+        self.inicios = np.flatnonzero(np.r_[True, fechas[1:] != fechas[:-1]]) if len(fechas) \
+            else np.empty(0, dtype=np.int64)
+        self.fechas = fechas[self.inicios]
+        self.fines = np.append(self.inicios[1:], len(fechas))
+
+    def __len__(self):
+        return len(self.fechas)
+
+    def filas(self):
+        """Por fila del frame, la posición de su fecha en self.fechas."""
+        return np.repeat(np.arange(len(self.fechas), dtype=np.int32), self.fines - self.inicios)
+
+    def ultima_hasta(self, fecha):
+        """Última fecha <= `fecha` (int), o None."""
+        i = np.searchsorted(self.fechas, int(fecha), side="right")
+        return int(self.fechas[i - 1]) if i else None
+
+    def anterior_a(self, fecha):
+        """Última fecha < `fecha` (int), o None."""
+        i = np.searchsorted(self.fechas, int(fecha), side="left")
+        return int(self.fechas[i - 1]) if i else None
+
+    def dia(self, fecha):
+        """Filas de `fecha` como slice del histórico (vacío si no está)."""
+        i = np.searchsorted(self.fechas, int(fecha))
+        if i == len(self.fechas) or self.fechas[i] != int(fecha):
+            return self.df.iloc[0:0]
+        return self.df.iloc[self.inicios[i]:self.fines[i]]
+
+
+# ── MIGRACIÓN DE FORMATOS ANTERIORES ──────────────────────────────────────────
+def migrar_compacto():
+    """
+    Pasa data/precios_compacto.csv al histórico particionado la primera
+    vez que se corre (si todavía no hay particiones). El CSV queda como
+    estaba.
+    """
+    if fechas_disponibles() or not PRECIOS_COMPACTO.exists():
+        return 0
+    df = pd.read_csv(PRECIOS_COMPACTO, dtype={"product_id": str, "sku_id": str,
+                                              "ean": str, "fecha": str})
+    for fecha, df_f in df.groupby("fecha"):
+        guardar_dia(df_f, fecha)
+    print(f"  Migrado {PRECIOS_COMPACTO} -> {DIR_HIST} ({df['fecha'].nunique()} fechas)")
+    return df["fecha"].nunique()
@@ -0,0 +1,336 @@
+"""
+indice_precios.py
+=================
+Motor del índice de precios que alimenta graficos.json.
+
+Arma una sola vez la matriz fecha × producto de precio_regular y de ahí
+saca, con operaciones de arrays, la variación promedio de cada día
+contra el anterior para el total y cada categoría. Los cuatro períodos
+usan esa misma serie de pasos: cada uno es el acumulado (redondeado día
+a día, como siempre) desde su primera fecha.
+
+Reproduce exactamente lo que hacía el loop de calcular_variacion por
+par de fechas: mismos productos (presentes ambos días, precio anterior
+> 0), mismo redondeo por producto y la misma suma en orden de product_id.
+
+Los pasos se guardan en data/indice_estado.json (uno por fecha, junto
+con la fecha contra la que se calculó), así la corrida diaria sólo
+calcula el de hoy contra el snapshot anterior. Las ventanas de cada
+período se corren todos los días, por eso las series se vuelven a
+acumular desde los pasos guardados (son pocos números por fecha).
+"""
+
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+import historico_precios
+from historico_precios import DIR_DATA
+
+TOTAL  = "total"
+ESTADO = DIR_DATA / "indice_estado.json"
+VERSION_ESTADO = 1
+PARES_SUELTOS  = 8   # más fechas que esto a calcular: se arma una matriz con todo el tramo
+
+
+class MatrizPrecios:
+    """
+    Precios (float64, redondeados a centavos) en una matriz fecha ×
+    producto. Las columnas van en orden de product_id y cada fila es
+    contigua, así las sumas por día recorren los productos en ese orden.
+    Con `fechas` hay una fila por cada una aunque no tenga precios (queda
+    toda NaN: paso 0.0 y ningún producto ese día).
+    """
+
+    def __init__(self, df_hist, fechas=None):
+        indice = historico_precios.IndiceFechas(df_hist)
+        df_hist = indice.df
+        self.fechas, fila = indice.fechas, indice.filas()
+        if fechas is not None:
+            self.fechas = np.union1d(self.fechas, np.asarray(fechas, dtype=np.int64))
+            fila = np.searchsorted(self.fechas, indice.fechas)[fila]
+
+        ids = historico_precios.cargar_productos(["product_id"])["product_id"]
+        orden = np.full(int(ids.index.max()) + 1 if len(ids) else 0, -1, dtype=np.int32)
+        # Sin productos (primer día vacío) el índice es object: matriz de 0 columnas
+        orden[ids.sort_values().index.to_numpy(dtype=np.int64)] = np.arange(len(ids))
+        rango = orden[df_hist["product_key"].to_numpy()]
+        presente = np.zeros(len(ids), dtype=bool)
+        presente[rango] = True
+        col = (np.cumsum(presente) - 1)[rango]
+        n_productos = int(presente.sum())
+
+        # Se llena en float32 (como está guardado) y se pasa a float64 con
+        # centavos exactos sobre la matriz, no fila por fila del histórico.
+        self.fechas_dt = pd.to_datetime(self.fechas.astype(str), format="%Y%m%d")
+        precios = np.full((len(self.fechas), n_productos), np.nan, dtype=np.float32)
+        precios[fila, col] = df_hist["precio_regular"].to_numpy(dtype=np.float32)
+        self.precios = precios.astype(np.float64)
+        np.round(self.precios, 2, out=self.precios)
+        del precios
+
+        cats = df_hist["cat_principal"].astype("category")
+        codigos = np.empty(n_productos, dtype=np.int16)
+        codigos[col] = cats.cat.codes.to_numpy()
+        nombres = np.append(np.asarray(cats.cat.categories, dtype=object), None)
+        self.cat = nombres[codigos]   # código -1 (sin categoría) -> None
+
+
+def pasos_diarios(matriz, categorias, workers=1):
+    """
+    Variación promedio (%) de cada fecha contra la anterior, para el total
+    y cada categoría: {serie: [None, v1, v2, ...]}. None en la primera
+    fecha; 0.0 cuando ningún producto está en ambos días.
+
+    Con workers > 1 reparte tramos de fechas entre procesos, que leen la
+    matriz de un .npy con mmap en vez de recibirla serializada.
+    """
+    mascaras = {c: matriz.cat == c for c in categorias}
+    n = len(matriz.fechas)
+    if workers <= 1 or n < 3:
+        filas = _pasos_tramo(matriz.precios, mascaras, 1, n)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, "precios.npy")
+            np.save(ruta, matriz.precios)
+            cortes = np.linspace(1, n, min(n - 1, workers * 4) + 1).astype(int)
+            tramos = list(zip(cortes[:-1], cortes[1:]))
+            partes = mapear(_pasos_tramo_compartido, tramos, workers,
+                            _iniciar_pasos, (ruta, mascaras))
+            filas = [fila for parte in partes for fila in parte]
+    return {serie: [None] + [fila[serie] for fila in filas] for serie in [TOTAL] + list(categorias)}
+
+
+def _pasos_tramo(precios, mascaras, inicio, fin):
+    """Pasos de las fechas [inicio, fin): una lista de {serie: valor}."""
+    filas = []
+    for i in range(inicio, fin):
+        antes, hoy = precios[i - 1], precios[i]
+        validos = ~np.isnan(hoy) & ~np.isnan(antes) & (antes > 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            diff_abs = np.round(hoy - antes, 2)
+            diff_pct = np.round((diff_abs / antes) * 100, 2)
+        fila = {TOTAL: _promedio(diff_pct[validos])}
+        for cat, mascara in mascaras.items():
+            fila[cat] = _promedio(diff_pct[validos & mascara])
+        filas.append(fila)
+    return filas
+
+
+def _promedio(valores):
+    return float(valores.sum() / len(valores)) if len(valores) else 0.0
+
+
+def acumular(fechas_dt, pasos, inicio):
+    """Serie acumulada desde la fecha de índice `inicio` (pct 0.0 ahí)."""
+    serie = [{"fecha": fechas_dt[inicio].strftime("%Y-%m-%d"), "pct": 0.0}]
+    acum = 0.0
+    for i in range(inicio + 1, len(fechas_dt)):
+        acum = round(acum + pasos[i], 2)
+        serie.append({"fecha": fechas_dt[i].strftime("%Y-%m-%d"), "pct": acum})
+    return serie
+
+
+# ── ESTADO INCREMENTAL ────────────────────────────────────────────────────────
+def estado_vacio(categorias):
+    return {"version": VERSION_ESTADO, "categorias": list(categorias), "dias": {}}
+
+
+def cargar_estado(categorias, ruta=ESTADO):
+    """Estado guardado; vacío si no existe o es de otra versión/categorías."""
+    if ruta.exists():
+        with open(ruta, encoding="utf-8") as f:
+            estado = json.load(f)
+        if (estado.get("version") == VERSION_ESTADO
+                and estado.get("categorias") == list(categorias)):
+            return estado
+        print(f"  {ruta}: versión o categorías distintas, se recalcula")
+    return estado_vacio(categorias)
+
+
+def ultimos_acumulados(estado):
+    """Último acumulado de cada serie desde la primera fecha del estado."""
+    fechas = sorted(estado["dias"])
+    series = [TOTAL] + estado["categorias"]
+    acum = dict.fromkeys(series, 0.0)
+    for f in fechas[1:]:
+        for serie in series:
+            acum[serie] = round(acum[serie] + estado["dias"][f]["pasos"][serie], 2)
+    return {serie: {"fecha": fechas[-1] if fechas else None, "acum": acum[serie]}
+            for serie in series}
+
+
+def guardar_estado(estado, ruta=ESTADO):
+    estado["ultimo"] = ultimos_acumulados(estado)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    tmp = ruta.with_suffix(ruta.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(estado, f, ensure_ascii=False, indent=1)
+    tmp.replace(ruta)
+
+
+def descartar_dias(estado, fechas):
+    """
+    Saca del estado las `fechas` (particiones reescritas por fuera del
+    analizador) y las que les siguen, cuyo paso las usa; actualizar_estado
+    las vuelve a calcular.
+    """
+    guardadas = sorted(estado["dias"])
+    fuera = set()
+    for i, f in enumerate(guardadas):
+        if f in fechas:
+            fuera.update(guardadas[i:i + 2])
+    estado["dias"] = {f: d for f, d in estado["dias"].items() if f not in fuera}
+    return sorted(fuera)
+
+
+def dias_de_matriz(matriz, categorias, workers=1):
+    """
+    Entradas del estado para cada fecha de la matriz: fecha anterior,
+    pasos por serie y productos por categoría. La primera fecha no tiene
+    anterior (pasos None).
+    """
+    pasos = pasos_diarios(matriz, categorias, workers)
+    presentes = ~np.isnan(matriz.precios)
+    productos = {c: presentes[:, matriz.cat == c].sum(axis=1) for c in categorias}
+    dias = {}
+    for i, fecha in enumerate(matriz.fechas):
+        dias[str(fecha)] = {
+            "anterior":  str(matriz.fechas[i - 1]) if i else None,
+            "pasos":     {s: v[i] for s, v in pasos.items()} if i else None,
+            "productos": {c: int(n[i]) for c, n in productos.items()},
+        }
+    return dias
+
+
+def reconstruir_estado(df_hist, categorias, workers=1, fechas=None):
+    """
+    Estado completo calculado desde cero sobre `df_hist`; con `fechas`,
+    también las que no tienen filas (como actualizar_estado).
+    """
+    estado = estado_vacio(categorias)
+    if not df_hist.empty or fechas:
+        estado["dias"] = dias_de_matriz(MatrizPrecios(df_hist, fechas), categorias, workers)
+    return estado
+
+
+def actualizar_estado(estado, desde, recalcular=(), cargar=historico_precios.cargar_historico,
+                      workers=1):
+    """
+    Deja en el estado una entrada por fecha del histórico desde `desde`
+    (más la anterior inmediata, como cargar_historico). Sólo calcula las
+    fechas nuevas, las de `recalcular` (particiones reescritas) y las que
+    les siguen o cambiaron de fecha anterior; el resto se reutiliza. Los
+    pares de fechas se leen con `cargar` (parquet o historico_mmap), en
+    `workers` procesos si hay varios para calcular.
+    Devuelve las fechas calculadas.
+    """
+    categorias = estado["categorias"]
+    fechas = historico_precios.fechas_en_rango(historico_precios.fechas_disponibles(), desde)
+    previos = estado["dias"]
+    dias, pares = {}, []
+    for i, fecha in enumerate(fechas):
+        anterior = fechas[i - 1] if i else None
+        previo = previos.get(fecha)
+        if previo is not None and fecha not in recalcular and anterior not in recalcular:
+            if anterior is None:
+                dias[fecha] = dict(previo, anterior=None, pasos=None)
+                continue
+            if previo["anterior"] == anterior:
+                dias[fecha] = previo
+                continue
+        pares.append((anterior, fecha) if anterior else (fecha,))
+
+    if len(pares) > PARES_SUELTOS:
+        # Muchas fechas (estado nuevo o viejo): una sola matriz sobre el tramo
+        tramo = fechas[fechas.index(pares[0][0]):fechas.index(pares[-1][-1]) + 1]
+        todas = dias_de_matriz(MatrizPrecios(cargar(fechas=tramo), tramo), categorias,
+                               workers)
+        calculados = [todas[par[-1]] for par in pares]
+    else:
+        calculados = mapear(_dia_de_par, pares, workers, _iniciar_pares, (categorias, cargar))
+    for par, dia in zip(pares, calculados):
+        dias[par[-1]] = dia
+    estado["dias"] = {f: dias[f] for f in fechas}
+    return [par[-1] for par in pares]
+
+
+def comparar_estados(a, b):
+    """Fechas en las que dos estados difieren (pasos o productos)."""
+    fechas = sorted(set(a["dias"]) | set(b["dias"]))
+    return [f for f in fechas if a["dias"].get(f) != b["dias"].get(f)]
+
+
+def graficos_desde_estado(estado, periodos, hoy=None):
+    """{periodo: {"total": serie, "categorias": {cat: serie}}} para graficos.json."""
+    fechas = sorted(estado["dias"])
+    if not fechas:
+        return {}
+    hoy = hoy if hoy is not None else pd.Timestamp.now().normalize()
+    categorias = estado["categorias"]
+    dias = [estado["dias"][f] for f in fechas]
+    fechas_dt = pd.to_datetime(fechas, format="%Y%m%d")
+    pasos = {s: [d["pasos"] and d["pasos"][s] for d in dias] for s in [TOTAL] + categorias}
+    presencia = {c: np.array([d["productos"][c] > 0 for d in dias]) for c in categorias}
+
+    resultado = {}
+    for periodo, dias_periodo in periodos.items():
+        inicio = int(np.searchsorted(fechas_dt, hoy - timedelta(days=dias_periodo)))
+        if inicio >= len(fechas):
+            resultado[periodo] = {"total": [], "categorias": {}}
+            continue
+        resultado[periodo] = {
+            "total": acumular(fechas_dt, pasos[TOTAL], inicio),
+            "categorias": {c: acumular(fechas_dt, pasos[c], inicio)
+                           for c in categorias if presencia[c][inicio:].any()},
+        }
+    return resultado
+
+
+def generar_graficos(df_hist, periodos, categorias, hoy=None, workers=1):
+    """graficos.json calculado desde cero sobre `df_hist`, sin usar el estado."""
+    return graficos_desde_estado(reconstruir_estado(df_hist, categorias, workers), periodos, hoy)
+
+
+# ── EJECUCIÓN EN PARALELO ─────────────────────────────────────────────────────
+_compartido = {}   # lo que cada proceso worker recibe una sola vez al iniciar
+
+
+def mapear(funcion, items, workers=1, inicializar=None, args_inicializar=()):
+    """
+    map() en un pool de `workers` procesos (en orden). Con workers <= 1
+    corre en este proceso, pasando igual por `inicializar`.
+    """
+    items = list(items)
+    if workers <= 1 or len(items) < 2:
+        if inicializar is not None:
+            inicializar(*args_inicializar)
+        return [funcion(x) for x in items]
+    with ProcessPoolExecutor(max_workers=min(workers, len(items)), initializer=inicializar,
+                             initargs=args_inicializar) as pool:
+        return list(pool.map(funcion, items))
+
+
+def _iniciar_pasos(ruta, mascaras):
+    _compartido["precios"] = np.load(ruta, mmap_mode="r")
+    _compartido["mascaras"] = mascaras
+
+
+def _pasos_tramo_compartido(tramo):
+    return _pasos_tramo(_compartido["precios"], _compartido["mascaras"], *tramo)
+
+
+def _iniciar_pares(categorias, cargar):
+    _compartido["categorias"] = categorias
+    _compartido["cargar"] = cargar
+
+
+def _dia_de_par(par):
+    """Entrada del estado para la última fecha de `par`, leyendo sólo esas fechas."""
+    df = _compartido["cargar"](fechas=list(par))
+    return dias_de_matriz(MatrizPrecios(df, par), _compartido["categorias"])[par[-1]]
@@ -0,0 +1,199 @@
+"""
+metricas_scraper.py
+===================
+Instrumentación de carrefour_scraper: tiempos por request y por categoría,
+reintentos, códigos HTTP y bytes bajados. Al final de la corrida escribe
+un reporte JSON, un textfile de Prometheus y marca las categorías cuya
+latencia o cantidad de SKUs empeoró mucho respecto de la corrida anterior.
+"""
+
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from threading import Lock
+
+UMBRAL_CAIDA_SKUS = 0.30   # alerta si una categoría rinde 30% menos SKUs
+UMBRAL_LATENCIA   = 2.0    # alerta si la p50 de una categoría se duplica
+LATENCIA_MIN_MS   = 100    # ...y además supera este piso (evita ruido)
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) por rango más cercano; None si no hay valores."""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    k = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[k]
+
+
+def resumen_latencias(segundos):
+    if not segundos:
+        return {}
+    res = {f"p{p}": round(percentil(segundos, p) * 1000, 1) for p in (50, 95, 99)}
+    res["max"] = round(max(segundos) * 1000, 1)
+    return res
+
+
+class Metricas:
+    """Acumula métricas de la corrida (thread-safe)."""
+
+    def __init__(self):
+        self.lock       = Lock()
+        self.inicio     = time.time()
+        self.latencias  = defaultdict(list)   # categoría -> [segundos]
+        self.status     = Counter()           # "200", "429", "ConnectionError"...
+        self.reintentos = Counter()           # categoría -> n
+        self.bytes      = Counter()           # categoría -> n
+        self.paginas    = Counter()           # categoría -> páginas OK
+        self.fallidas   = Counter()           # categoría -> páginas con error
+        self.categorias = {}
+
+    def request(self, cat_nombre, status, segundos, n_bytes=0):
+        with self.lock:
+            self.latencias[cat_nombre].append(segundos)
+            self.status[str(status)] += 1
+            self.bytes[cat_nombre] += n_bytes
+
+    def reintento(self, cat_nombre):
+        with self.lock:
+            self.reintentos[cat_nombre] += 1
+
+    def pagina(self, cat_nombre, ok, error=None):
+        with self.lock:
+            if ok:
+                self.paginas[cat_nombre] += 1
+            else:
+                self.fallidas[cat_nombre] += 1
+                if error:
+                    self.status[error] += 1
+
+    def fin_categoria(self, cat_nombre, cat_principal, segundos, skus):
+        with self.lock:
+            self.categorias[cat_nombre] = {
+                "cat_principal": cat_principal,
+                "duracion_s":    round(segundos, 2),
+                "skus":          skus,
+            }
+
+    def reporte(self, **extra):
+        with self.lock:
+            todas = [s for lat in self.latencias.values() for s in lat]
+            categorias = {}
+            for nombre, datos in self.categorias.items():
+                categorias[nombre] = dict(datos,
+                    paginas=self.paginas[nombre],
+                    paginas_error=self.fallidas[nombre],
+                    requests=len(self.latencias[nombre]),
+                    reintentos=self.reintentos[nombre],
+                    bytes=self.bytes[nombre],
+                    latencia_ms=resumen_latencias(self.latencias[nombre]))
+            fin = time.time()
+            return dict(extra,
+                inicio=datetime.fromtimestamp(self.inicio).isoformat(timespec="seconds"),
+                fin=datetime.fromtimestamp(fin).isoformat(timespec="seconds"),
+                duracion_s=round(fin - self.inicio, 2),
+                skus=sum(c["skus"] for c in self.categorias.values()),
+                requests=len(todas),
+                status=dict(self.status),
+                reintentos=sum(self.reintentos.values()),
+                bytes=sum(self.bytes.values()),
+                paginas=sum(self.paginas.values()),
+                paginas_error=sum(self.fallidas.values()),
+                latencia_ms=resumen_latencias(todas),
+                categorias=categorias)
+
+
+def comparar_reportes(actual, anterior):
+    """Alertas por categoría que rindió bastante menos o se volvió lenta."""
+    if not anterior:
+        return []
+    alertas = []
+    previas = anterior.get("categorias", {})
+    for nombre, prev in previas.items():
+        cat = actual["categorias"].get(nombre)
+        if cat is None:
+            alertas.append({"categoria": nombre, "tipo": "ausente",
+                            "detalle": "no aparece en esta corrida"})
+            continue
+        if prev["skus"] and cat["skus"] < prev["skus"] * (1 - UMBRAL_CAIDA_SKUS):
+            alertas.append({"categoria": nombre, "tipo": "skus",
+                            "detalle": f"{prev['skus']} -> {cat['skus']} SKUs"})
+        p50_prev = prev.get("latencia_ms", {}).get("p50")
+        p50 = cat.get("latencia_ms", {}).get("p50")
+        if p50_prev and p50 and p50 > LATENCIA_MIN_MS and p50 > p50_prev * UMBRAL_LATENCIA:
+            alertas.append({"categoria": nombre, "tipo": "latencia",
+                            "detalle": f"p50 {p50_prev} ms -> {p50} ms"})
+    return alertas
+
+
+def _etiqueta(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def a_prometheus(rep):
+    """Reporte en formato textfile de Prometheus (node_exporter)."""
+    lineas = []
+
+    def metrica(nombre, ayuda, valores):
+        lineas.append(f"# HELP carrebot_scrape_{nombre} {ayuda}")
+        lineas.append(f"# TYPE carrebot_scrape_{nombre} gauge")
+        for etiquetas, v in valores:
+            if v is None:
+                continue
+            lbl = ",".join(f'{k}="{_etiqueta(x)}"' for k, x in etiquetas.items())
+            lineas.append(f"carrebot_scrape_{nombre}{{{lbl}}} {v}" if lbl
+                          else f"carrebot_scrape_{nombre} {v}")
+
+    cats = rep["categorias"].items()
+    metrica("timestamp_segundos", "Fin de la corrida (epoch).",
+            [({}, int(datetime.fromisoformat(rep["fin"]).timestamp()))])
+    metrica("duracion_segundos", "Duración total de la corrida.", [({}, rep["duracion_s"])])
+    metrica("skus", "SKUs escritos.", [({}, rep["skus"])])
+    metrica("requests", "Requests HTTP por status.",
+            [({"status": s}, n) for s, n in sorted(rep["status"].items())])
+    metrica("reintentos", "Reintentos por 429/5xx.", [({}, rep["reintentos"])])
+    metrica("bytes", "Bytes descargados.", [({}, rep["bytes"])])
+    metrica("paginas_error", "Páginas que fallaron.", [({}, rep["paginas_error"])])
+    metrica("latencia_segundos", "Latencia por request.",
+            [({"quantile": q}, rep["latencia_ms"].get(p) and rep["latencia_ms"][p] / 1000)
+             for q, p in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99"))])
+    metrica("categoria_skus", "SKUs por categoría.",
+            [({"categoria": n}, c["skus"]) for n, c in cats])
+    metrica("categoria_duracion_segundos", "Duración por categoría.",
+            [({"categoria": n}, c["duracion_s"]) for n, c in cats])
+    metrica("categoria_latencia_p50_segundos", "Latencia p50 por categoría.",
+            [({"categoria": n}, c["latencia_ms"].get("p50") and c["latencia_ms"]["p50"] / 1000)
+             for n, c in cats])
+    metrica("alertas", "Categorías con caída de SKUs o latencia.",
+            [({}, len(rep.get("alertas", [])))])
+    return "\n".join(lineas) + "\n"
+
+
+def escribir_atomico(ruta, contenido):
+    tmp = ruta.with_suffix(ruta.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(contenido)
+    os.replace(tmp, ruta)
+
+
+def guardar_reporte(rep, ruta_json, ruta_prom, ruta_ultimo=None):
+    """
+    Escribe el reporte de la corrida y el textfile de Prometheus. Si se
+    pasa ruta_ultimo, compara contra el reporte guardado ahí (la corrida
+    anterior), agrega las alertas y lo reemplaza por el actual.
+    """
+    anterior = None
+    if ruta_ultimo is not None and ruta_ultimo.exists():
+        with open(ruta_ultimo, encoding="utf-8") as f:
+            anterior = json.load(f)
+    rep["alertas"] = comparar_reportes(rep, anterior)
+
+    texto = json.dumps(rep, ensure_ascii=False, indent=2)
+    escribir_atomico(ruta_json, texto)
+    escribir_atomico(ruta_prom, a_prometheus(rep))
+    if ruta_ultimo is not None:
+        ruta_ultimo.parent.mkdir(parents=True, exist_ok=True)
+        escribir_atomico(ruta_ultimo, texto)
+    return rep
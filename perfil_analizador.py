@@ -0,0 +1,154 @@
+"""
+perfil_analizador.py
+====================
+Perfilado de analizar_precios_carrefour (--profile): tiempo de pared,
+tiempo de CPU y pico de memoria por etapa de main() y por función clave
+(lecturas, guardar_compacto, snapshots, calcular_variacion, gráficos,
+escritura de JSONs). Al final escribe un reporte JSON en data/perfil/ y,
+con --cprofile, un volcado de cProfile por etapa (se abre con pstats o
+snakeviz).
+
+Apagado no mide nada. Prendido usa tracemalloc, que hace todo bastante
+más lento: los tiempos sirven para comparar partes entre sí, no con una
+corrida normal. Con --workers N lo que corre en los workers cuenta en la
+etapa que los lanzó, pero no en las funciones.
+"""
+
+import cProfile
+import functools
+import json
+import os
+import re
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from historico_precios import DIR_DATA
+
+DIR_PERFIL = DIR_DATA / "perfil"
+
+
+class Perfil:
+    """Acumula mediciones de la corrida; no hace nada hasta activar()."""
+
+    def __init__(self):
+        self.activo    = False
+        self.cprofile  = False
+        self.inicio    = None
+        self.etapas    = []   # [{nombre, wall_s, cpu_s, pico_mb}] en orden
+        self.funciones = {}   # nombre -> {llamadas, wall_s, cpu_s, pico_mb}
+        self._abiertos = []   # mediciones en curso (las etapas contienen funciones)
+        self._volcados = {}   # etapa -> cProfile.Profile
+
+    def activar(self, cprofile=False):
+        self.activo = True
+        self.cprofile = cprofile
+        self.inicio = datetime.now()
+        self._t0 = (time.perf_counter(), time.process_time())
+        tracemalloc.start()
+
+    def _pico(self):
+        """Pasa el pico de tracemalloc a las mediciones abiertas y lo reinicia."""
+        pico = tracemalloc.get_traced_memory()[1]
+        for abierta in self._abiertos:
+            abierta["pico"] = max(abierta["pico"], pico)
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def _medir(self):
+        self._pico()
+        actual = tracemalloc.get_traced_memory()[0]
+        abierta = {"base": actual, "pico": actual}
+        self._abiertos.append(abierta)
+        t0, c0 = time.perf_counter(), time.process_time()
+        try:
+            yield abierta
+        finally:
+            abierta["wall_s"] = time.perf_counter() - t0
+            abierta["cpu_s"] = time.process_time() - c0
+            self._pico()
+            self._abiertos.remove(abierta)
+            abierta["pico_mb"] = (abierta["pico"] - abierta["base"]) / 1e6
+
+    @contextmanager
+    def etapa(self, nombre):
+        """Una etapa de main(); con cprofile, además la perfila."""
+        if not self.activo:
+            yield
+            return
+        prof = cProfile.Profile() if self.cprofile else None
+        with self._medir() as m:
+            if prof:
+                prof.enable()
+            try:
+                yield
+            finally:
+                if prof:
+                    prof.disable()
+        self.etapas.append({"nombre": nombre, "wall_s": round(m["wall_s"], 3),
+                            "cpu_s": round(m["cpu_s"], 3), "pico_mb": round(m["pico_mb"], 1)})
+        if prof:
+            self._volcados[nombre] = prof
+
+    def funcion(self, nombre=None):
+        """Decorador: acumula llamadas, tiempos y el mayor pico de la función."""
+        def decorador(f):
+            clave = nombre or f.__name__
+
+            @functools.wraps(f)
+            def medida(*args, **kwargs):
+                if not self.activo:
+                    return f(*args, **kwargs)
+                with self._medir() as m:
+                    resultado = f(*args, **kwargs)
+                acum = self.funciones.setdefault(
+                    clave, {"llamadas": 0, "wall_s": 0.0, "cpu_s": 0.0, "pico_mb": 0.0})
+                acum["llamadas"] += 1
+                acum["wall_s"] += m["wall_s"]
+                acum["cpu_s"] += m["cpu_s"]
+                acum["pico_mb"] = max(acum["pico_mb"], m["pico_mb"])
+                return resultado
+            return medida
+        return decorador
+
+    def reporte(self, **extra):
+        wall, cpu = time.perf_counter() - self._t0[0], time.process_time() - self._t0[1]
+        return dict(extra,
+            inicio=self.inicio.isoformat(timespec="seconds"),
+            wall_s=round(wall, 3),
+            cpu_s=round(cpu, 3),
+            pico_mb=round(tracemalloc.get_traced_memory()[1] / 1e6, 1),
+            etapas=self.etapas,
+            funciones={n: {k: round(v, 3) if isinstance(v, float) else v for k, v in d.items()}
+                       for n, d in sorted(self.funciones.items(),
+                                          key=lambda x: -x[1]["wall_s"])})
+
+    def guardar(self, rep):
+        """Escribe el reporte (y los volcados de cProfile). Devuelve la ruta del JSON."""
+        sello = self.inicio.strftime("%Y%m%d_%H%M%S")
+        DIR_PERFIL.mkdir(parents=True, exist_ok=True)
+        if self._volcados:
+            dir_prof = DIR_PERFIL / sello
+            dir_prof.mkdir(exist_ok=True)
+            rep["cprofile"] = {}
+            for i, (etapa, prof) in enumerate(self._volcados.items(), 1):
+                ruta = dir_prof / f"{i:02d}_{re.sub(r'[^0-9A-Za-z]+', '_', etapa)}.prof"
+                prof.dump_stats(ruta)
+                rep["cprofile"][etapa] = str(ruta)
+        ruta = DIR_PERFIL / f"perfil_{sello}.json"
+        tmp = ruta.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(rep, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, ruta)
+        return ruta
+
+
+def imprimir(rep):
+    print(f"  {'etapa':<26} {'pared s':>8} {'cpu s':>8} {'pico MB':>8}")
+    for e in rep["etapas"]:
+        print(f"  {e['nombre']:<26} {e['wall_s']:>8.3f} {e['cpu_s']:>8.3f} {e['pico_mb']:>8.1f}")
+    print(f"  {'función':<24} {'n':>3} {'pared s':>8} {'cpu s':>8} {'pico MB':>8}")
+    for nombre, d in rep["funciones"].items():
+        print(f"  {nombre:<24} {d['llamadas']:>3} {d['wall_s']:>8.3f} {d['cpu_s']:>8.3f} "
+              f"{d['pico_mb']:>8.1f}")
@@ -0,0 +1,206 @@
+"""
+salida_scraper.py
+=================
+Escritores de la salida de carrefour_scraper.
+
+- Parquet (default): las filas se juntan en lotes tipados con un esquema
+  fijo y cada lote (FILAS_POR_LOTE filas, PAGINAS_POR_LOTE páginas o
+  SEGUNDOS_POR_LOTE, lo que llegue primero) se escribe como un archivo
+  part-NNNNN.parquet dentro del directorio carrefour_<ts>.parquet/. Cada part se escribe completo
+  antes de aparecer (tmp + rename), así una corrida cortada deja un
+  dataset legible y --resume sólo agrega parts nuevos.
+- CSV: una fila por SKU, agregada a medida que llegan las páginas.
+
+En ambos casos las páginas se anotan en el journal recién cuando sus
+filas están en disco.
+"""
+
+import csv
+import os
+import time
+from threading import Lock
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+FORMATOS       = ("parquet", "csv")
+FILAS_POR_LOTE    = 10_000
+PAGINAS_POR_LOTE  = 20     # un part también cada tantas páginas ...
+SEGUNDOS_POR_LOTE = 5.0    # ... o cada tantos segundos, así un corte pierde poco
+
+COLUMNAS = ("fecha", "product_id", "sku_id", "ean", "nombre", "marca", "categoria",
+            "precio_actual", "precio_regular", "disponible", "link", "cat_principal")
+
+if pa is not None:
+    ESQUEMA = pa.schema([
+        ("fecha",          pa.string()),
+        ("product_id",     pa.string()),
+        ("sku_id",         pa.string()),
+        ("ean",            pa.string()),
+        ("nombre",         pa.string()),
+        ("marca",          pa.string()),
+        ("categoria",      pa.dictionary(pa.int16(), pa.string())),
+        ("precio_actual",  pa.float64()),
+        ("precio_regular", pa.float64()),
+        ("disponible",     pa.int64()),
+        ("link",           pa.string()),
+        ("cat_principal",  pa.dictionary(pa.int8(), pa.string())),
+    ])
+
+
+def formato_de(ruta):
+    return "parquet" if ruta.suffix == ".parquet" else "csv"
+
+
+class EscritorCSV:
+    """
+    Agrega filas al CSV de salida a medida que llegan las páginas y anota
+    cada página en el journal recién después de escribirla.
+    """
+
+    def __init__(self, ruta, journal=None):
+        self.ruta    = ruta
+        self.journal = journal
+        self.lock    = Lock()
+        self.filas   = 0
+
+    def _agregar(self, skus):
+        header_necesario = not self.ruta.exists()
+        with open(self.ruta, "a", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            if header_necesario:
+                writer.writerow(COLUMNAS)
+            writer.writerows(skus)
+        self.filas += len(skus)
+
+    def escribir(self, skus, fq=None, from_idx=None, total=None, ajena=False):
+        with self.lock:
+            if skus:
+                self._agregar(skus)
+            if self.journal is not None:
+                self.journal.registrar(fq, from_idx, total=total, ajena=ajena)
+
+    def fallo(self, fq, from_idx, err):
+        with self.lock:
+            self.journal.registrar(fq, from_idx, error=err)
+
+    def cerrar(self):
+        pass
+
+
+class EscritorParquet:
+    """
+    Junta filas en memoria y las escribe como un part Parquet con ESQUEMA
+    al llegar a FILAS_POR_LOTE filas o PAGINAS_POR_LOTE páginas, o pasados
+    SEGUNDOS_POR_LOTE desde el part anterior. Las páginas del lote se
+    anotan en el journal después de escribir el part.
+    """
+
+    def __init__(self, ruta, journal=None, filas_por_lote=FILAS_POR_LOTE,
+                 paginas_por_lote=PAGINAS_POR_LOTE, segundos_por_lote=SEGUNDOS_POR_LOTE):
+        self.ruta    = ruta
+        self.journal = journal
+        self.filas_por_lote    = filas_por_lote
+        self.paginas_por_lote  = paginas_por_lote
+        self.segundos_por_lote = segundos_por_lote
+        self.ultimo  = time.monotonic()
+        self.lock    = Lock()
+        self.filas   = 0
+        self.buffer  = []
+        self.paginas = []   # entradas de journal pendientes del lote actual
+        self.n_part  = len(list(ruta.glob("part-*.parquet"))) if ruta.exists() else 0
+
+    def _flush(self):
+        if self.buffer:
+            columnas = list(zip(*self.buffer))
+            lote = pa.RecordBatch.from_arrays(
+                [pa.array(col, type=campo.type)
+                 for col, campo in zip(columnas, ESQUEMA)], schema=ESQUEMA)
+            self.ruta.mkdir(parents=True, exist_ok=True)
+            destino = self.ruta / f"part-{self.n_part:05d}.parquet"
+            tmp = self.ruta / f".{destino.name}.tmp"
+            pq.write_table(pa.Table.from_batches([lote]), tmp, compression="zstd")
+            os.replace(tmp, destino)
+            self.n_part += 1
+            self.filas  += len(self.buffer)
+            self.buffer = []
+        if self.journal is not None:
+            for fq, from_idx, total, ajena in self.paginas:
+                self.journal.registrar(fq, from_idx, total=total, ajena=ajena)
+        self.paginas = []
+        self.ultimo = time.monotonic()
+
+    def escribir(self, skus, fq=None, from_idx=None, total=None, ajena=False):
+        with self.lock:
+            self.buffer.extend(skus)
+            self.paginas.append((fq, from_idx, total, ajena))
+            if (len(self.buffer) >= self.filas_por_lote
+                    or len(self.paginas) >= self.paginas_por_lote
+                    or time.monotonic() - self.ultimo >= self.segundos_por_lote):
+                self._flush()
+
+    def fallo(self, fq, from_idx, err):
+        with self.lock:
+            self.journal.registrar(fq, from_idx, error=err)
+
+    def cerrar(self):
+        with self.lock:
+            self._flush()
+
+
+def crear_escritor(ruta, journal=None):
+    if formato_de(ruta) == "parquet":
+        return EscritorParquet(ruta, journal)
+    return EscritorCSV(ruta, journal)
+
+
+def leer_lotes(ruta, columnas=COLUMNAS, tamanio_lote=FILAS_POR_LOTE):
+    """
+    Itera una salida en DataFrames de hasta `tamanio_lote` filas con las
+    `columnas` pedidas que tenga: textos como str y precios como float64
+    (en el CSV, lo que no es un número queda NaN).
+    """
+    import pandas as pd   # sólo lo usa el analizador; el scraper no lo necesita
+
+    precios = [c for c in ("precio_actual", "precio_regular") if c in columnas]
+    if formato_de(ruta) == "parquet":
+        for part in sorted(ruta.glob("part-*.parquet")) if ruta.is_dir() else [ruta]:
+            archivo = pq.ParquetFile(part)
+            presentes = [c for c in columnas if c in archivo.schema_arrow.names]
+            for lote in archivo.iter_batches(batch_size=tamanio_lote, columns=presentes):
+                df = lote.to_pandas()
+                for col in df.columns[df.dtypes == "category"]:
+                    df[col] = df[col].astype(str).where(df[col].notna())
+                yield df
+        return
+    textos = {c: str for c in columnas if c not in precios}
+    for df in pd.read_csv(ruta, encoding="utf-8-sig", usecols=lambda c: c in columnas,
+                          dtype=textos, chunksize=tamanio_lote):
+        for col in precios:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors="coerce")
+        yield df
+
+
+def leer_filas(ruta, tamanio_lote=FILAS_POR_LOTE):
+    """Itera las filas (tuplas en orden COLUMNAS) de una salida, en lotes."""
+    if formato_de(ruta) == "parquet":
+        for part in sorted(ruta.glob("part-*.parquet")):
+            archivo = pq.ParquetFile(part)
+            for lote in archivo.iter_batches(batch_size=tamanio_lote, columns=list(COLUMNAS)):
+                yield list(zip(*(lote.column(c).to_pylist() for c in COLUMNAS)))
+        return
+    with open(ruta, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        lote = []
+        for fila in reader:
+            lote.append(tuple(fila))
+            if len(lote) >= tamanio_lote:
+                yield lote
+                lote = []
+        if lote:
+            yield lote